@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+
+""" Micro-benchmark of redis value codecs (encode/decode throughput, no redis server needed). """
+
+import timeit
+
+from pyHMI.DS_Redis import MsgpackCodec, RedisCodec, StructCodec, TextCodec
+
+# some constants
+N_LOOP = 100_000
+SAMPLES_L = [(True, bool), (123_456_789, int), (3.141592653589793, float), ('temperature', str)]
+
+
+def bench(codec: RedisCodec) -> None:
+    for value, _type in SAMPLES_L:
+        raw = codec.encode(value, _type)
+        enc_s = timeit.timeit(lambda: codec.encode(value, _type), number=N_LOOP)
+        dec_s = timeit.timeit(lambda: codec.decode(raw, _type), number=N_LOOP)
+        print(f'{codec.__class__.__name__:<13} {_type.__name__:<6} {len(raw):>3} bytes  '
+              f'encode {N_LOOP / enc_s / 1e6:5.2f} M/s  decode {N_LOOP / dec_s / 1e6:5.2f} M/s')
+
+
+if __name__ == '__main__':
+    codecs_l = [TextCodec(), StructCodec()]
+    try:
+        codecs_l.append(MsgpackCodec())
+    except ImportError:
+        print('msgpack is not installed: skip MsgpackCodec')
+    for codec in codecs_l:
+        bench(codec)
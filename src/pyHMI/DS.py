@@ -106,3 +106,11 @@ class TagOp(DataSource):
 
     def error(self) -> bool:
         return self._error or self._a_error or self._b_error
+
+    def watch(self, tag: Tag) -> bool:
+        # forward changes of operand tags (False if one of them cannot report changes)
+        watch_ok = True
+        for operand in (self.a, self.b):
+            if isinstance(operand, Tag):
+                watch_ok &= operand.subscribe(lambda _operand: tag._notify())
+        return watch_ok
@@ -1,19 +1,32 @@
+import asyncio
 import logging
 import queue
+import socket
 import struct
 import time
-from enum import Enum, auto
-from threading import Event, Lock, Thread, current_thread
-from typing import Any, Dict, Literal, Optional, get_args
-from weakref import WeakValueDictionary
+from abc import ABC, abstractmethod
+from enum import Enum, IntEnum, auto
+from itertools import count
+from operator import itemgetter
+from threading import Event, Lock, Thread, Timer, current_thread
+from typing import Any, Callable, Dict, Iterable, List, Literal, Optional, Tuple, Union, get_args
+from weakref import WeakSet
 
 from pyModbusTCP.client import ModbusClient
+from pyModbusTCP.constants import MB_EXCEPT_ERR, MB_NO_ERR, MB_TIMEOUT_ERR
 
 from pyHMI.Tag import Tag
 
-from .Misc import SafeObject, auto_repr, cut_bytes_to_regs, swap_bytes, swap_words
+from .Misc import (CyclicScheduler, FairLock, LatencyHistogram, SafeObject, auto_repr, cut_bytes_to_regs, swap_bytes,
+                   swap_words)
 from .Tag import DataSource, Device
 
+# NumPy is only required by array data sources
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -22,6 +35,13 @@ class ModbusDS(DataSource):
     pass
 
 
+class Priority(IntEnum):
+    """ Priority classes of single-run requests (a lower value runs first). """
+    COMMAND = 0
+    READ = 1
+    BACKGROUND = 2
+
+
 class _RequestType(Enum):
     READ_COILS = auto()
     READ_D_INPUTS = auto()
@@ -31,29 +51,306 @@ class _RequestType(Enum):
     WRITE_H_REGS = auto()
 
 
+# max number of bits/registers per read PDU for every read request type
+_READ_MAX_SIZE = {_RequestType.READ_COILS: 2000, _RequestType.READ_D_INPUTS: 2000,
+                  _RequestType.READ_H_REGS: 125, _RequestType.READ_I_REGS: 125}
+# max gap (in bits/registers) to merge two dirty spans of a write request in a single PDU: a gap costs less
+# than the MBAP and PDU headers of another write (13 bytes)
+_WRITE_MERGE_GAP = {_RequestType.WRITE_COILS: 104, _RequestType.WRITE_H_REGS: 6}
+# modbus function codes
+_READ_FUNC_CODE = {_RequestType.READ_COILS: 0x01, _RequestType.READ_D_INPUTS: 0x02,
+                   _RequestType.READ_H_REGS: 0x03, _RequestType.READ_I_REGS: 0x04}
+
+
+def _read_tx_pdu(type: _RequestType, address: int, size: int) -> bytes:
+    """ Build the PDU of a read request. """
+    return struct.pack('>BHH', _READ_FUNC_CODE[type], address, size)
+
+
+def _read_rx_pdu(type: _RequestType, size: int, rx_pdu: bytes) -> Optional[list]:
+    """ Decode the PDU of a read response (return None for an exception or a malformed response). """
+    # skip exception or malformed response
+    if len(rx_pdu) < 2 or rx_pdu[0] != _READ_FUNC_CODE[type] or rx_pdu[1] != len(rx_pdu) - 2:
+        return None
+    # bits: packed 8 by byte, LSB first
+    if type in (_RequestType.READ_COILS, _RequestType.READ_D_INPUTS):
+        if rx_pdu[1] < (size + 7) // 8:
+            return None
+        return [bool(rx_pdu[2 + i // 8] >> (i % 8) & 1) for i in range(size)]
+    # registers: 16-bit big-endian
+    if rx_pdu[1] != 2 * size:
+        return None
+    return list(struct.unpack(f'>{size}H', rx_pdu[2:]))
+
+
+def _write_tx_pdu(type: _RequestType, address: int, values_l: list, single_func: bool = False) -> bytes:
+    """ Build the PDU of a write request. """
+    if type is _RequestType.WRITE_COILS:
+        if single_func:
+            return struct.pack('>BHH', 0x05, address, 0xff00 if values_l[0] else 0x0000)
+        bits_b = bytearray((len(values_l) + 7) // 8)
+        for i, value in enumerate(values_l):
+            if value:
+                bits_b[i // 8] |= 1 << (i % 8)
+        return struct.pack('>BHHB', 0x0f, address, len(values_l), len(bits_b)) + bits_b
+    elif type is _RequestType.WRITE_H_REGS:
+        if single_func:
+            return struct.pack('>BHH', 0x06, address, values_l[0])
+        return struct.pack(f'>BHHB{len(values_l)}H', 0x10, address, len(values_l), 2 * len(values_l), *values_l)
+    raise ValueError(f'{type.name} is not a write request type')
+
+
+def _write_rx_pdu(tx_pdu: bytes, rx_pdu: bytes) -> bool:
+    """ Check the PDU of a write response (a valid one echoes function code, address and value or size). """
+    return rx_pdu[:5] == tx_pdu[:5]
+
+
+def _write_read_tx_pdu(write_address: int, values_l: list, read_address: int, read_size: int) -> bytes:
+    """ Build the PDU of a read/write multiple registers request (FC23, the write is done before the read). """
+    return struct.pack(f'>BHHHHB{len(values_l)}H', 0x17, read_address, read_size,
+                       write_address, len(values_l), 2 * len(values_l), *values_l)
+
+
+def _write_read_rx_pdu(read_size: int, rx_pdu: bytes) -> Optional[list]:
+    """ Decode the PDU of a read/write multiple registers response (return None for an exception or a malformed
+    response). """
+    if len(rx_pdu) < 2 or rx_pdu[0] != 0x17 or rx_pdu[1] != len(rx_pdu) - 2 or rx_pdu[1] != 2 * read_size:
+        return None
+    return list(struct.unpack(f'>{read_size}H', rx_pdu[2:]))
+
+
+class _RegsCodec:
+    """ A precompiled conversion between a value and the raw bytes of its registers.
+
+    Swaps are folded at build time: when they amount to an endianness change, decode is a single unpack
+    from the request buffer.
+    """
+
+    def __init__(self, byte_length: int, byte_order: Literal['little', 'big'], byte_swap: bool, word_swap: bool,
+                 fmt_char: Optional[str] = None, signed: bool = False) -> None:
+        # args
+        self.byte_length = byte_length
+        self.signed = signed
+        # byte permutation applied by swaps (same behaviour as Misc.swap_bytes and Misc.swap_words)
+        perm_b = bytes(range(byte_length))
+        if byte_swap:
+            perm_b = bytes(swap_bytes(perm_b))
+        if word_swap:
+            perm_b = bytes(swap_words(perm_b))
+        # fold it into byte order if we can
+        self.byte_order = byte_order
+        self._perm: Optional[Callable] = None
+        if perm_b == bytes(reversed(range(byte_length))) and byte_length > 1:
+            self.byte_order = 'little' if byte_order == 'big' else 'big'
+        elif perm_b != bytes(range(byte_length)):
+            self._perm = itemgetter(*perm_b)
+        # struct for values with a native C type (int are decoded with int.from_bytes otherwise)
+        self._struct: Optional[struct.Struct] = None
+        if fmt_char:
+            self._struct = struct.Struct(('>' if self.byte_order == 'big' else '<') + fmt_char)
+
+    def decode(self, buffer: Union[bytearray, memoryview], offset: int = 0) -> Any:
+        # apply the unfoldable part of swaps
+        if self._perm:
+            buffer = bytes(self._perm(buffer[offset:offset + self.byte_length]))
+            offset = 0
+        if self._struct:
+            return self._struct.unpack_from(buffer, offset)[0]
+        return int.from_bytes(buffer[offset:offset + self.byte_length], byteorder=self.byte_order, signed=self.signed)
+
+    def encode(self, value: Any) -> bytes:
+        if self._struct:
+            value_as_b = self._struct.pack(value)
+        else:
+            value_as_b = value.to_bytes(self.byte_length, byteorder=self.byte_order, signed=self.signed)
+        if self._perm:
+            value_as_b = bytes(self._perm(value_as_b))
+        return value_as_b
+
+
 class _Data:
-    def __init__(self, address: int, size: int, default_value: Any) -> None:
+    """ The data space of a request.
+
+    Registers are stored as raw big-endian bytes (as on the wire) and bits in a bytearray (one byte per bit). A
+    validity mask flags addresses that have never been set (read None) and a dirty mask flags addresses set
+    since the last write.
+    """
+
+    def __init__(self, address: int, size: int, default_value: Any, bits: bool = False) -> None:
+        # args
+        self.address = address
+        self.size = size
+        self.bits = bits
         # private
         self._lock = Lock()
-        self._data_d: Dict[int, Any] = dict()
-        # populate data dict
-        for iter_addr in range(address, address + size):
-            self._data_d[iter_addr] = default_value
+        default = 0 if default_value is None else int(default_value)
+        self._values = bytearray([default]) * size if bits else bytearray(struct.pack('>H', default)) * size
+        self._valid = bytearray([default_value is not None]) * size
+        self._dirty = bytearray(size)
+        # public
+        self.view = memoryview(self._values).toreadonly()
+        self.generation = 0
 
     def __repr__(self) -> str:
-        return auto_repr(self, export_t=('_data_d', ))
+        return auto_repr(self, export_t=('address', 'size', 'bits'))
+
+    def contains(self, address: int, size: int = 1) -> bool:
+        """ Check that an address range is in this data space. """
+        return self.address <= address and address + size <= self.address + self.size
+
+    def is_set(self, address: int, size: int = 1) -> bool:
+        """ Check that every address of a range is set. """
+        offset = address - self.address
+        with self._lock:
+            return self._valid.find(0, offset, offset + size) == -1
+
+    def get(self, address: int, size: int = 1) -> list:
+        """ Return values of an address range (None for an unset address). """
+        offset = address - self.address
+        with self._lock:
+            if self.bits:
+                values_l = [bool(value) for value in self._values[offset:offset + size]]
+            else:
+                values_l = list(struct.unpack_from(f'>{size}H', self._values, 2 * offset))
+            valid_b = self._valid[offset:offset + size]
+        if valid_b.find(0) != -1:
+            values_l = [value if valid else None for value, valid in zip(values_l, valid_b)]
+        return values_l
+
+    def get_bytes(self, address: int, size: int = 1) -> Optional[bytes]:
+        """ Return raw bytes of a registers range (None if unset). """
+        offset = address - self.address
+        with self._lock:
+            if self._valid.find(0, offset, offset + size) != -1:
+                return None
+            return bytes(self._values[2 * offset:2 * (offset + size)])
+
+    def decode(self, codec: _RegsCodec, address: int) -> Any:
+        """ Decode a value from the registers at address with codec (None if unset). """
+        offset = address - self.address
+        with self._lock:
+            if self._valid.find(0, offset, offset + (codec.byte_length + 1) // 2) != -1:
+                return None
+            return codec.decode(self._values, 2 * offset)
+
+    def snapshot(self, address: int, size: int = 1) -> Tuple[bytes, bytes]:
+        """ Return a copy of raw values and validity flags of an address range. """
+        offset = address - self.address
+        width = 1 if self.bits else 2
+        with self._lock:
+            return bytes(self._values[width * offset:width * (offset + size)]), bytes(self._valid[offset:offset + size])
+
+    def set(self, address: int, values_l: list, dirty: bool = False) -> None:
+        """ Set values from address (in a single slice assignment). """
+        offset = address - self.address
+        with self._lock:
+            if self.bits:
+                self._values[offset:offset + len(values_l)] = bytearray(map(bool, values_l))
+            else:
+                struct.pack_into(f'>{len(values_l)}H', self._values, 2 * offset, *values_l)
+            self._valid[offset:offset + len(values_l)] = b'\x01' * len(values_l)
+            if dirty:
+                self._dirty[offset:offset + len(values_l)] = b'\x01' * len(values_l)
+            self.generation += 1
+
+    def mark_dirty(self, address: int, size: int = 1) -> None:
+        """ Flag an address range as dirty (like after a failed write). """
+        offset = address - self.address
+        with self._lock:
+            self._dirty[offset:offset + size] = b'\x01' * size
+
+    def pop_dirty(self, max_gap: int = 0) -> List[Tuple[int, int]]:
+        """ Return dirty spans as (address, size) and clear the dirty mask.
+
+        Spans separated by at most max_gap clean addresses are merged.
+        """
+        spans_l: List[List[int]] = []
+        with self._lock:
+            start = self._dirty.find(1)
+            while start != -1:
+                end = self._dirty.find(0, start)
+                end = self.size if end == -1 else end
+                if spans_l and start - spans_l[-1][1] <= max_gap:
+                    spans_l[-1][1] = end
+                else:
+                    spans_l.append([start, end])
+                start = self._dirty.find(1, end)
+            self._dirty[:] = bytes(self.size)
+        return [(self.address + start, end - start) for start, end in spans_l]
 
-    def __enter__(self):
-        self._lock.acquire()
-        return self._data_d
 
-    def __exit__(self, *args):
-        self._lock.release()
+class ModbusRequestStats:
+    """ Runs of a modbus request: counters and latency histogram (from the send of its first PDU to its result). """
+
+    def __init__(self) -> None:
+        # public
+        self.runs = 0
+        self.errors = 0
+        self.latency = LatencyHistogram()
+
+    def add(self, duration: Optional[float], error: bool) -> None:
+        """ Account for a run (duration is None if it got no response). """
+        self.runs += 1
+        self.errors += error
+        if duration is not None:
+            self.latency.add(duration)
+
+    def as_dict(self) -> dict:
+        return dict(runs=self.runs, errors=self.errors, latency=self.latency.as_dict())
+
+
+class ModbusDeviceStats:
+    """ I/O counters and latency histograms of a modbus device (a sample per PDU).
+
+    Updates take no lock, they are done by the I/O engine of the device.
+    """
+
+    def __init__(self) -> None:
+        # public
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.tx_bytes = 0
+        self.rx_bytes = 0
+        self.reconnects = 0
+        self.latency = LatencyHistogram()
+        self.cycle_lag = LatencyHistogram()
+        self.command_latency = LatencyHistogram()
+        # private
+        self._connects = 0
+
+    def add(self, duration: Optional[float], error: bool) -> None:
+        """ Account for a PDU (duration is None if it got no response). """
+        self.requests += 1
+        self.errors += error
+        if duration is not None:
+            self.latency.add(duration)
+
+    def add_connect(self) -> None:
+        """ Account for a new connection (every one except the first is a reconnect). """
+        self._connects += 1
+        self.reconnects = self._connects - 1
+
+    def as_dict(self) -> dict:
+        return dict(requests=self.requests, errors=self.errors, timeouts=self.timeouts, tx_bytes=self.tx_bytes,
+                    rx_bytes=self.rx_bytes, reconnects=self.reconnects, latency=self.latency.as_dict(),
+                    cycle_lag=self.cycle_lag.as_dict(), command_latency=self.command_latency.as_dict())
 
 
 class ModbusRequest:
-    def __init__(self, device: "ModbusTCPDevice", type: _RequestType, address: int, size: int,
-                 default_value: Any, cyclic: bool, on_set: bool = False, single_func: bool = False) -> None:
+    def __init__(self, device: "ModbusDevice", type: _RequestType, address: int, size: int,
+                 default_value: Any, cyclic: bool, on_set: bool = False, single_func: bool = False,
+                 period: Optional[float] = None, write_window: float = 0.0,
+                 priority: Optional[Priority] = None) -> None:
+        """ A modbus request and its data space.
+
+        Single runs are processed by priority (the default is COMMAND for a write request and READ for a read
+        one): pending COMMAND runs also suspend the cyclic jobs of the device between two PDUs.
+
+        A single run of a write request only sends the spans of its data space set since the last write (or the
+        whole request if nothing is set). With on_set, write_window delays this run so that every set in this
+        window is sent at once.
+        """
         # check single queries
         if single_func and size != 1:
             raise ValueError('single modbus function requires size=1')
@@ -62,6 +359,10 @@ class ModbusRequest:
             raise ValueError('address out of range (valid from 0 to 65535)')
         if address + size > 0x10000:
             raise ValueError('request after end of address space')
+        if period is not None and period <= 0.0:
+            raise ValueError('period must be positive')
+        if write_window < 0.0:
+            raise ValueError('write_window must be positive or zero')
         if type in (_RequestType.READ_COILS, _RequestType.READ_D_INPUTS):
             if not 1 <= size <= 2000:
                 raise ValueError('size out of range (valid from 1 to 2000)')
@@ -83,18 +384,43 @@ class ModbusRequest:
         self.cyclic = cyclic
         self.on_set = on_set
         self.single_func = single_func
+        self.period = period
+        self.write_window = write_window
+        if priority is None:
+            priority = Priority.COMMAND if type in (_RequestType.WRITE_COILS, _RequestType.WRITE_H_REGS) \
+                else Priority.READ
+        self.priority = priority
         # public
-        self.error = True
         self.run_done_evt = Event()
+        self.stats = ModbusRequestStats()
         # private
-        self._data = _Data(address=address, size=size, default_value=self.default_value)
+        self._error = True
+        self._watchers: List[Tuple[int, int, Tag]] = []
+        self._data = _Data(address=address, size=size, default_value=self.default_value,
+                           bits=type in (_RequestType.READ_COILS, _RequestType.READ_D_INPUTS,
+                                         _RequestType.WRITE_COILS))
         self._single_run_expire = 0.0
-        # reference this in I/O thread
-        self.device.cyclic_thread.add_request(self)
+        self._single_run_queued = False
+        self._single_run_at: Optional[float] = None
+        self._run_delayed = False
+        # reference this in I/O engine
+        self.device._add_request(self)
 
     def __repr__(self) -> str:
         return auto_repr(self, export_t=('type', 'address', 'size'))
 
+    @property
+    def error(self) -> bool:
+        return self._error
+
+    @error.setter
+    def error(self, value: bool) -> None:
+        # notify watchers of error status changes
+        if value != self._error:
+            self._error = value
+            for _, _, tag in self._watchers:
+                tag._notify()
+
     @property
     def _single_run_expired(self) -> bool:
         return time.monotonic() > self._single_run_expire
@@ -104,32 +430,98 @@ class ModbusRequest:
         # single-run thread process fresh modbus request exclusively
         return not self._single_run_expired
 
+    @property
+    def generation(self) -> int:
+        """ A counter incremented on every update of the data space (let data sources cache decoded values). """
+        return self._data.generation
+
+    @property
+    def data_view(self) -> memoryview:
+        """ A read-only view of the raw data space (big-endian registers or one byte per bit).
+
+        It is updated in place by I/O threads without any lock.
+        """
+        return self._data.view
+
     def _get_data(self, address: int, size: int = 1) -> list:
-        registers_l = []
-        with self._data as data:
-            for i in range(size):
-                registers_l.append(data[address + i])
-        return registers_l
+        return self._data.get(address, size)
+
+    def as_array(self, dtype: str = 'f4', byte_order: Literal['little', 'big'] = 'big', swap_bytes: bool = False,
+                 swap_word: bool = False, address: Optional[int] = None, size: Optional[int] = None) -> Any:
+        """ Decode registers of this request as a NumPy array of dtype (like 'f4', 'f8', 'i2', 'u4'...).
+
+        Decode the whole request or size registers from address. Swap options act as in ModbusInt/ModbusFloat.
+
+        Return None if some registers are unset.
+        """
+        if np is None:
+            raise ImportError('NumPy is required by as_array()')
+        if self.type not in (_RequestType.READ_H_REGS, _RequestType.READ_I_REGS, _RequestType.WRITE_H_REGS):
+            raise TypeError(f'bad request type {self.type.name} for as_array()')
+        address = self.address if address is None else address
+        size = self.address + self.size - address if size is None else size
+        if not self.is_valid(at_address=address, for_size=size):
+            raise ValueError(f'@{address} (size {size}) is not available in the data space of this request')
+        # copy raw bytes of registers
+        raw_b = self._data.get_bytes(address, size)
+        if raw_b is None:
+            return None
+        # apply swaps on the whole block (words are swapped by pairs inside each item, none for 16-bit items)
+        if swap_bytes:
+            raw_b = np.frombuffer(raw_b, dtype=np.uint8).reshape(-1, 2)[:, ::-1].tobytes()
+        if swap_word and np.dtype(dtype).itemsize >= 4:
+            raw_b = np.frombuffer(raw_b, dtype=np.uint16).reshape(-1, 2)[:, ::-1].tobytes()
+        # decode items
+        return np.frombuffer(raw_b, dtype=np.dtype(dtype).newbyteorder('>' if byte_order == 'big' else '<'))
+
+    def _watch(self, tag: Tag, address: int, size: int = 1) -> bool:
+        """ Notify tag when data of an address range changes. """
+        self._watchers.append((address, size, tag))
+        return True
+
+    def _notify_changes(self, address: int, size: int, prev_snapshot: Tuple[bytes, bytes]) -> None:
+        # quick exit if nothing changes
+        values_b, valid_b = self._data.snapshot(address, size)
+        prev_values_b, prev_valid_b = prev_snapshot
+        if values_b == prev_values_b and valid_b == prev_valid_b:
+            return
+        # notify tags that watch a changed range
+        width = 1 if self._data.bits else 2
+        for w_address, w_size, tag in self._watchers:
+            start = max(w_address, address) - address
+            end = min(w_address + w_size, address + size) - address
+            if start < end and (values_b[width * start:width * end] != prev_values_b[width * start:width * end]
+                                or valid_b[start:end] != prev_valid_b[start:end]):
+                tag._notify()
 
     def _set_data(self, address: int, registers_l: list, by_thread: bool = False):
-        # apply it to write address space
-        with self._data as data:
-            for i, value in enumerate(registers_l):
-                data[address + i] = value
+        # apply it to write address space (track changes for watchers, user sets are dirty until written)
+        if self._watchers:
+            prev_snapshot = self._data.snapshot(address, len(registers_l))
+            self._data.set(address, registers_l, dirty=not by_thread)
+            self._notify_changes(address, len(registers_l), prev_snapshot)
+        else:
+            self._data.set(address, registers_l, dirty=not by_thread)
         # skip others process if call by a thread
         if by_thread:
             return
-        # request executed on set
+        # request executed on set (at end of the write window if any)
         if self.on_set:
-            self.run()
+            if self.write_window > 0.0:
+                if not self._run_delayed:
+                    self._run_delayed = True
+                    self.run_done_evt.clear()
+                    self.device._call_later(self.write_window, self._delayed_run)
+            else:
+                self.run()
+
+    def _delayed_run(self) -> None:
+        self._run_delayed = False
+        self.run()
 
     def is_valid(self, at_address: int, for_size: int = 1) -> bool:
         """ Indicate request validity for this address and size. """
-        with self._data as data:
-            for offset in range(for_size):
-                if not at_address + offset in data:
-                    return False
-        return True
+        return self._data.contains(at_address, for_size)
 
     def run(self) -> bool:
         """ Attempt immediate execution of the request using the single run thread.
@@ -140,19 +532,371 @@ class ModbusRequest:
         Return True if the request is queued.
         """
         # accept this request when device is actually connected or if the single-run queue is empty
-        if self.device.connected or (self.device.single_run_thread.request_q.qsize() == 0):
+        if self.device.connected or (self.device._single_run_q_size() == 0):
             # set an expiration stamp (avoid single-run thread process outdated request)
             self._single_run_expire = time.monotonic() + self.device.cancel_delay
+            # clear done flag first: the I/O engine may process the request before put returns
+            self.run_done_evt.clear()
+            # an already queued request will run with the current data
+            if self._single_run_queued:
+                return True
             try:
-                self.device.single_run_thread.request_q.put_nowait(self)
-                self.run_done_evt.clear()
+                self._single_run_queued = True
+                self._single_run_at = time.monotonic()
+                self.device._single_run_put(self)
                 return True
             except queue.Full:
+                self._single_run_queued = False
                 logger.warning(f'single-run queue full, drop {self.type.name} at @{self.address}')
         # error reporting
         return False
 
 
+class _ReadBlock:
+    """ A read PDU built by the request planner to serve several cyclic read requests at once. """
+
+    def __init__(self, type: _RequestType, address: int, size: int) -> None:
+        # args
+        self.type = type
+        self.address = address
+        self.size = size
+        # public
+        self.requests: List[ModbusRequest] = []
+
+    def __repr__(self) -> str:
+        return auto_repr(self, export_t=('type', 'address', 'size'))
+
+    @property
+    def end(self) -> int:
+        return self.address + self.size
+
+    def add_request(self, request: ModbusRequest) -> None:
+        self.size = max(self.end, request.address + request.size) - self.address
+        self.requests.append(request)
+
+
+def _plan_read_blocks(requests: List[ModbusRequest], max_gap: int = 0) -> List[_ReadBlock]:
+    """ Merge read requests of the same type into the fewest read PDUs.
+
+    Requests that overlap, are adjacent or are separated by at most max_gap addresses share the same
+    PDU as long as it stays within the modbus size limit (2000 bits or 125 registers).
+    """
+    blocks_l: List[_ReadBlock] = []
+    for req_type, max_size in _READ_MAX_SIZE.items():
+        # requests of this type sorted by address (greedy merge is optimal on a sorted list)
+        type_req_l = sorted((r for r in requests if r.type is req_type), key=lambda r: (r.address, r.size))
+        block: Optional[_ReadBlock] = None
+        for request in type_req_l:
+            req_end = request.address + request.size
+            if block and request.address <= block.end + max_gap and \
+               max(block.end, req_end) - block.address <= max_size:
+                block.add_request(request)
+            else:
+                block = _ReadBlock(req_type, request.address, request.size)
+                block.add_request(request)
+                blocks_l.append(block)
+    return blocks_l
+
+
+class _WriteSpans:
+    """ The write PDUs of a write request: one for each span (address, size) of its data space to send. """
+
+    def __init__(self, request: ModbusRequest, spans_l: List[Tuple[int, int]]) -> None:
+        # args
+        self.request = request
+        self.spans_l = spans_l
+        # public
+        self.type = request.type
+
+    def __repr__(self) -> str:
+        return auto_repr(self, export_t=('type', 'spans_l'))
+
+    @classmethod
+    def of_dirty(cls, request: ModbusRequest) -> "_WriteSpans":
+        """ Spans set since the last write (the whole request if nothing is set). """
+        spans_l = request._data.pop_dirty(max_gap=_WRITE_MERGE_GAP[request.type])
+        return cls(request, spans_l or [(request.address, request.size)])
+
+    @classmethod
+    def of_all(cls, request: ModbusRequest) -> "_WriteSpans":
+        """ The whole request. """
+        request._data.pop_dirty()
+        return cls(request, [(request.address, request.size)])
+
+
+class _WriteReadPair:
+    """ A write of holding registers and a read of holding registers sent as a single FC23 PDU. """
+
+    def __init__(self, write_job: _WriteSpans, read_job: Union[ModbusRequest, _ReadBlock]) -> None:
+        # args
+        self.write_job = write_job
+        self.read_job = read_job
+        # public
+        self.type = _RequestType.WRITE_H_REGS
+
+    def __repr__(self) -> str:
+        return auto_repr(self, export_t=('write_job', 'read_job'))
+
+    @property
+    def write_span(self) -> Tuple[int, int]:
+        return self.write_job.spans_l[0]
+
+
+def _pair_write_read(jobs_l: list) -> list:
+    """ Pair every write of a single span of holding registers with a read of holding registers (FC23 jobs). """
+    writes_l = [job for job in jobs_l if isinstance(job, _WriteSpans) and job.type is _RequestType.WRITE_H_REGS
+                and not job.request.single_func and len(job.spans_l) == 1 and job.spans_l[0][1] <= 121]
+    reads_l = [job for job in jobs_l if isinstance(job, (ModbusRequest, _ReadBlock))
+               and job.type is _RequestType.READ_H_REGS]
+    pairs_l = [_WriteReadPair(write_job, read_job) for write_job, read_job in zip(writes_l, reads_l)]
+    paired_s = {id(job) for pair in pairs_l for job in (pair.write_job, pair.read_job)}
+    return [*pairs_l, *[job for job in jobs_l if id(job) not in paired_s]]
+
+
+# a job of the I/O engine: a request (read), a read block, the spans of a write request or a FC23 pair
+_Job = Union[ModbusRequest, _ReadBlock, _WriteSpans, _WriteReadPair]
+
+
+def _job_requests(job: _Job) -> List[ModbusRequest]:
+    """ Return every request served by a job. """
+    if isinstance(job, _ReadBlock):
+        return job.requests
+    elif isinstance(job, _WriteSpans):
+        return [job.request]
+    elif isinstance(job, _WriteReadPair):
+        return [*_job_requests(job.write_job), *_job_requests(job.read_job)]
+    return [job]
+
+
+class _Transaction:
+    """ A modbus transaction (request and response PDU) processed by the pipelined clients. """
+
+    def __init__(self, job: _Job, tx_pdu: bytes, span: Optional[Tuple[int, int]] = None) -> None:
+        # args
+        self.job = job
+        self.tx_pdu = tx_pdu
+        self.span = span
+        # public
+        self.sent_at: Optional[float] = None
+        self.done_at: Optional[float] = None
+        self.rx_pdu: Optional[bytes] = None
+
+
+def _build_transactions(jobs_l: List[_Job]) -> List[_Transaction]:
+    """ Build a transaction for every job (requests or read blocks) or every span of write jobs. """
+    transactions_l = []
+    for job in jobs_l:
+        if isinstance(job, _WriteReadPair):
+            address, size = job.write_span
+            registers_l = job.write_job.request._get_data(address=address, size=size)
+            tx_pdu = _write_read_tx_pdu(address, registers_l, job.read_job.address, job.read_job.size)
+            transactions_l.append(_Transaction(job, tx_pdu, span=job.write_span))
+        elif job.type in _READ_MAX_SIZE:
+            transactions_l.append(_Transaction(job, _read_tx_pdu(job.type, job.address, job.size)))
+        elif isinstance(job, _WriteSpans):
+            for address, size in job.spans_l:
+                registers_l = job.request._get_data(address=address, size=size)
+                tx_pdu = _write_tx_pdu(job.type, address, registers_l, single_func=job.request.single_func)
+                transactions_l.append(_Transaction(job, tx_pdu, span=(address, size)))
+    return transactions_l
+
+
+class _PipelinedClient:
+    """ A modbus/TCP client that keeps several transactions in flight on the same TCP connection.
+
+    Responses are matched to their requests with the MBAP transaction id, so the server is free to
+    reply in any order.
+    """
+
+    def __init__(self, host: str, port: int, unit_id: int, timeout: float, max_in_flight: int) -> None:
+        # args
+        self.host = host
+        self.port = port
+        self.unit_id = unit_id
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        # public
+        self.stats: Optional[ModbusDeviceStats] = None
+        # private
+        self._sock: Optional[socket.socket] = None
+        self._transaction_id = 0
+
+    def __repr__(self) -> str:
+        return auto_repr(self, export_t=('host', 'port', 'unit_id', 'timeout', 'max_in_flight'))
+
+    @property
+    def is_open(self) -> bool:
+        return self._sock is not None
+
+    def open(self) -> bool:
+        self.close()
+        try:
+            self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            return True
+        except OSError as e:
+            logger.debug(f'unable to connect to {self.host}:{self.port} ({e})')
+            return False
+
+    def close(self) -> None:
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+
+    def _next_frame(self, transaction: _Transaction) -> bytes:
+        self._transaction_id = (self._transaction_id + 1) & 0xffff
+        mbap = struct.pack('>HHHB', self._transaction_id, 0, len(transaction.tx_pdu) + 1, self.unit_id)
+        return mbap + transaction.tx_pdu
+
+    def _account_frame(self, frame: bytes, is_tx: bool, header_size: int = 0) -> None:
+        if self.stats:
+            if is_tx:
+                self.stats.tx_bytes += len(frame) + header_size
+            else:
+                self.stats.rx_bytes += len(frame) + header_size
+
+    def _response(self, in_flight_d: Dict[int, _Transaction], transaction_id: int, unit_id: int,
+                  rx_pdu: bytes) -> None:
+        # match a response with its request
+        transaction = in_flight_d.pop(transaction_id, None)
+        if transaction is None:
+            logger.debug(f'drop a response with an unknown transaction id ({transaction_id})')
+        elif unit_id == self.unit_id:
+            transaction.rx_pdu = rx_pdu
+            transaction.done_at = time.monotonic()
+
+    def _recv_all(self, size: int) -> bytes:
+        assert self._sock
+        buffer = b''
+        while len(buffer) < size:
+            chunk = self._sock.recv(size - len(buffer))
+            if not chunk:
+                raise ConnectionError('connection closed by peer')
+            buffer += chunk
+        return buffer
+
+    def run(self, transactions: List[_Transaction]) -> None:
+        """ Process all transactions, keeping at most max_in_flight of them pending on the socket.
+
+        On return, the rx_pdu attribute of every transaction is set, or left to None on error.
+        """
+        # auto open
+        if not self.is_open and not self.open():
+            return
+        assert self._sock
+        to_send_l = list(reversed(transactions))
+        in_flight_d: Dict[int, _Transaction] = {}
+        try:
+            while to_send_l or in_flight_d:
+                # fill the pipeline
+                while to_send_l and len(in_flight_d) < self.max_in_flight:
+                    transaction = to_send_l.pop()
+                    frame = self._next_frame(transaction)
+                    self._sock.sendall(frame)
+                    transaction.sent_at = time.monotonic()
+                    in_flight_d[self._transaction_id] = transaction
+                    self._account_frame(frame, is_tx=True)
+                # wait for the next response
+                f_transaction_id, f_protocol_id, f_length, f_unit_id = struct.unpack('>HHHB', self._recv_all(7))
+                if f_protocol_id != 0 or not 3 <= f_length <= 254:
+                    raise ConnectionError('MBAP checking error')
+                rx_pdu = self._recv_all(f_length - 1)
+                self._account_frame(rx_pdu, is_tx=False, header_size=7)
+                # match it with its request
+                self._response(in_flight_d, f_transaction_id, f_unit_id, rx_pdu)
+        except OSError as e:
+            logger.debug(f'modbus/TCP error with {self.host}:{self.port} ({e})')
+            if isinstance(e, socket.timeout) and self.stats:
+                self.stats.timeouts += 1
+            self.close()
+
+
+class _AsyncPipelinedClient(_PipelinedClient):
+    """ The asyncio version of the pipelined client. """
+
+    def __init__(self, host: str, port: int, unit_id: int, timeout: float, max_in_flight: int) -> None:
+        super().__init__(host, port, unit_id, timeout, max_in_flight)
+        # private
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+
+    async def async_open(self) -> bool:
+        self.close()
+        try:
+            coro = asyncio.open_connection(self.host, self.port)
+            self._reader, self._writer = await asyncio.wait_for(coro, timeout=self.timeout)
+            return True
+        except (OSError, asyncio.TimeoutError) as e:
+            logger.debug(f'unable to connect to {self.host}:{self.port} ({e!r})')
+            return False
+
+    def close(self) -> None:
+        if self._writer:
+            self._writer.close()
+            self._reader = None
+            self._writer = None
+
+    async def _async_recv_all(self, size: int) -> bytes:
+        assert self._reader
+        return await asyncio.wait_for(self._reader.readexactly(size), timeout=self.timeout)
+
+    async def async_run(self, transactions: List[_Transaction]) -> None:
+        """ Process all transactions, keeping at most max_in_flight of them pending on the socket.
+
+        On return, the rx_pdu attribute of every transaction is set, or left to None on error.
+        """
+        # auto open
+        if not self.is_open and not await self.async_open():
+            return
+        assert self._writer
+        to_send_l = list(reversed(transactions))
+        in_flight_d: Dict[int, _Transaction] = {}
+        try:
+            while to_send_l or in_flight_d:
+                # fill the pipeline
+                while to_send_l and len(in_flight_d) < self.max_in_flight:
+                    transaction = to_send_l.pop()
+                    frame = self._next_frame(transaction)
+                    self._writer.write(frame)
+                    transaction.sent_at = time.monotonic()
+                    in_flight_d[self._transaction_id] = transaction
+                    self._account_frame(frame, is_tx=True)
+                await asyncio.wait_for(self._writer.drain(), timeout=self.timeout)
+                # wait for the next response
+                header_b = await self._async_recv_all(7)
+                f_transaction_id, f_protocol_id, f_length, f_unit_id = struct.unpack('>HHHB', header_b)
+                if f_protocol_id != 0 or not 3 <= f_length <= 254:
+                    raise ConnectionError('MBAP checking error')
+                rx_pdu = await self._async_recv_all(f_length - 1)
+                self._account_frame(rx_pdu, is_tx=False, header_size=7)
+                # match it with its request
+                self._response(in_flight_d, f_transaction_id, f_unit_id, rx_pdu)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            logger.debug(f'modbus/TCP error with {self.host}:{self.port} ({e!r})')
+            if isinstance(e, asyncio.TimeoutError) and self.stats:
+                self.stats.timeouts += 1
+            self.close()
+
+
+class _StatsModbusClient(ModbusClient):
+    """ A ModbusClient that accounts for its frames in the stats of the device in use. """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # public
+        self.stats: Optional[ModbusDeviceStats] = None
+
+    def on_tx_rx(self, frame: bytes, is_tx: bool) -> None:
+        if self.stats:
+            if is_tx:
+                self.stats.tx_bytes += len(frame)
+            else:
+                self.stats.rx_bytes += len(frame)
+
+
 class _SingleRunThread(Thread):
     def __init__(self, modbus_device: "ModbusTCPDevice") -> None:
         super().__init__(daemon=True)
@@ -160,25 +904,36 @@ class _SingleRunThread(Thread):
         self.modbus_device = modbus_device
         # public
         self.reload_evt = Event()
-        self.request_q: queue.Queue[ModbusRequest] = queue.Queue(maxsize=255)
+        self.request_q: queue.PriorityQueue[Tuple[int, int, ModbusRequest]] = queue.PriorityQueue(maxsize=255)
+        # private
+        self._seq = count()
+
+    def put(self, request: ModbusRequest) -> None:
+        # FIFO order for requests of the same priority
+        self.request_q.put_nowait((request.priority, next(self._seq), request))
 
     def run(self):
-        """ This thread executes all requests put to the single-run queue. """
+        """ This thread executes all requests put to the single-run queue (by priority). """
         while True:
             # wait next request from queue
-            request = self.request_q.get()
+            requests_l = [self.request_q.get()[-1]]
+            # the pipelined engine processes every pending request at once
+            if self.modbus_device.pipelined:
+                while True:
+                    try:
+                        requests_l.append(self.request_q.get_nowait()[-1])
+                    except queue.Empty:
+                        break
+            self.modbus_device._single_run_dequeued(requests_l)
             # process it
-            try:
-                if request.single_run_ready and self.modbus_device.enabled:
-                    self.modbus_device._process_read_request(request)
-                    self.modbus_device._process_write_request(request)
+            if self.modbus_device.enabled:
+                self.modbus_device._process_jobs(self.modbus_device._plan_single_run_jobs(requests_l))
+            else:
                 self.modbus_device._process_device_state()
-            except Exception as e:
-                msg = f'except {type(e).__name__} in {current_thread().name} ' \
-                      f'({request.__class__.__name__}): {e}'
-                logger.warning(msg)
-            # mark queue task as done
-            self.request_q.task_done()
+            self.modbus_device._single_run_done(requests_l)
+            # mark queue task(s) as done
+            for _ in requests_l:
+                self.request_q.task_done()
 
 
 class _CyclicThread(Thread):
@@ -186,40 +941,56 @@ class _CyclicThread(Thread):
         super().__init__(daemon=True)
         # args
         self.modbus_device = modbus_device
-        # private
-        self._req_d_lock = Lock()
-        self._req_d: WeakValueDictionary[int, ModbusRequest] = WeakValueDictionary()
-        self._req_d_pos = 0
-
-    def add_request(self, request: ModbusRequest):
-        with self._req_d_lock:
-            self._req_d[self._req_d_pos] = request
-            self._req_d_pos += 1
 
     def run(self):
-        """ This thread executes cyclic requests. """
+        """ This thread executes cyclic requests when they are due. """
         while True:
-            # prevent request dictionnary change during iteration
-            with self._req_d_lock:
-                cp_req_d = self._req_d.copy()
-            # iterate over all requests
-            for request in cp_req_d.values():
-                try:
-                    if request.cyclic and self.modbus_device.enabled:
-                        self.modbus_device._process_read_request(request)
-                        self.modbus_device._process_write_request(request)
-                    self.modbus_device._process_device_state()
-                except Exception as e:
-                    msg = f'except {type(e).__name__} in {current_thread().name} ' \
-                          f'({request.__class__.__name__}): {e}'
-                    logger.warning(msg)
-            # wait before next refresh
-            time.sleep(self.modbus_device.refresh)
+            # process cyclic jobs (requests or read blocks) due now
+            due_l = self.modbus_device._pop_due()
+            if self.modbus_device.enabled:
+                self.modbus_device._process_jobs(self.modbus_device._plan_cyclic_jobs(due_l), preemptible=True)
+            else:
+                self.modbus_device._process_device_state()
+            # wait for the next deadline
+            time.sleep(self.modbus_device._scheduler.wait_time())
 
 
-class ModbusTCPDevice(Device):
-    def __init__(self, host='localhost', port=502, unit_id=1, timeout=5.0, refresh=1.0, cancel_delay=5.0,
-                 enabled=True, client_args: Optional[dict] = None):
+class _AsyncLoopThread(Thread):
+    """ The thread that runs the asyncio event loop shared by every AsyncModbusTCPDevice. """
+
+    _instance: Optional["_AsyncLoopThread"] = None
+    _instance_lock = Lock()
+
+    def __init__(self) -> None:
+        super().__init__(daemon=True, name='modbus-asyncio')
+        # public
+        self.loop = asyncio.new_event_loop()
+
+    @classmethod
+    def get(cls) -> "_AsyncLoopThread":
+        """ Return the shared loop thread (started on first call). """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+                cls._instance.start()
+            return cls._instance
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+
+class ModbusDevice(Device, ABC):
+    """ Common part of every modbus device (requests factory, jobs planning and results processing).
+
+    With pair_write_read, a write and a read of holding registers planned together are sent as a single
+    read/write multiple registers PDU (FC23, the server must support it).
+    """
+
+    def __init__(self, host: str = 'localhost', port: int = 502, unit_id: int = 1, timeout: float = 5.0,
+                 refresh: float = 1.0, cancel_delay: float = 5.0, enabled: bool = True,
+                 coalesce_reads: bool = False, coalesce_max_gap: int = 0, max_in_flight: int = 1,
+                 pair_write_read: bool = False):
         # args
         self.host = host
         self.port = port
@@ -228,44 +999,179 @@ class ModbusTCPDevice(Device):
         self.refresh = refresh
         self.cancel_delay = cancel_delay
         self.enabled = enabled
-        self.client_args = client_args
+        self.coalesce_reads = coalesce_reads
+        self.coalesce_max_gap = coalesce_max_gap
+        self.max_in_flight = max_in_flight
+        self.pair_write_read = pair_write_read
         # public
         self.connected = False
-        # allow thread safe access to modbus client (allow direct blocking IO on modbus socket)
-        args_d = {} if self.client_args is None else self.client_args
-        self.safe_cli = SafeObject(ModbusClient(host=self.host, port=self.port, unit_id=self.unit_id,
-                                                timeout=self.timeout, auto_open=True, **args_d))
-        # define polling threads
-        self.cyclic_thread = _CyclicThread(self)
-        self.single_run_thread = _SingleRunThread(self)
-        # start threads
-        self.cyclic_thread.start()
-        self.single_run_thread.start()
+        self.stats = ModbusDeviceStats()
+        # private
+        self._scheduler = CyclicScheduler(self)
+        self._requests: WeakSet[ModbusRequest] = WeakSet()
+        self._commands_lock = Lock()
+        self._commands_count = 0
+        self._no_command_evt = Event()
+        self._no_command_evt.set()
 
     def __str__(self) -> str:
         return f'{self.host}:{self.port}:{self.unit_id}'
 
     def __repr__(self):
         return f'{self.__class__.__name__}(host={self.host!r}, port={self.port}, unit_id={self.unit_id}, ' \
-               f'timeout={self.timeout:.1f}, refresh={self.refresh:.1f}, client_adv_args={self.client_args!r})'
+               f'timeout={self.timeout:.1f}, refresh={self.refresh:.1f})'
 
-    def _process_read_request(self, request: ModbusRequest) -> None:
-        # do request
-        if request.type is _RequestType.READ_COILS:
-            with self.safe_cli as cli:
-                registers_l = cli.read_coils(request.address, request.size)
-        elif request.type == _RequestType.READ_D_INPUTS:
-            with self.safe_cli as cli:
-                registers_l = cli.read_discrete_inputs(request.address, request.size)
-        elif request.type == _RequestType.READ_H_REGS:
-            with self.safe_cli as cli:
-                registers_l = cli.read_holding_registers(request.address, request.size)
-        elif request.type == _RequestType.READ_I_REGS:
-            with self.safe_cli as cli:
-                registers_l = cli.read_input_registers(request.address, request.size)
+    @property
+    def pipelined(self) -> bool:
+        return self.max_in_flight > 1
+
+    @property
+    def command_latency_stats(self) -> dict:
+        """ Time (in seconds) from the run() of COMMAND requests to the send of their PDU. """
+        return self.stats.command_latency.as_dict()
+
+    def stats_snapshot(self) -> dict:
+        """ Return the I/O statistics of this device and of its requests (latencies are in seconds). """
+        requests_l = [dict(request=_request_label(request), **request.stats.as_dict())
+                      for request in list(self._requests)]
+        return dict(device=str(self), connected=self.connected, **self.stats.as_dict(),
+                    missed_deadlines=self._scheduler.missed_count, requests_stats=requests_l)
+
+    def _set_connected(self, is_open: bool) -> None:
+        if is_open and not self.connected:
+            self.stats.add_connect()
+        self.connected = is_open
+
+    def _pop_due(self) -> List[ModbusRequest]:
+        """ Return the cyclic requests due now (and account for the lag of the cyclic loop). """
+        due_l = self._scheduler.pop_due()
+        if any(request.cyclic for request in due_l):
+            self.stats.cycle_lag.add(self._scheduler.last_lag)
+        return due_l
+
+    def _job_stats(self, job: _Job, duration: Optional[float]) -> None:
+        # account for a run of every request served by the job
+        for request in _job_requests(job):
+            request.stats.add(duration, request.error)
+
+    def _command_queued(self, request: ModbusRequest) -> None:
+        if request.priority is Priority.COMMAND:
+            with self._commands_lock:
+                self._commands_count += 1
+                self._no_command_evt.clear()
+
+    def _single_run_dequeued(self, requests: List[ModbusRequest]) -> None:
+        # from now, a new run of these requests must be queued (it will send the next sets)
+        for request in requests:
+            request._single_run_queued = False
+
+    def _single_run_done(self, requests: List[ModbusRequest]) -> None:
+        # forget the run stamp of requests (unless queued again during this run)
+        for request in requests:
+            if not request._single_run_queued:
+                request._single_run_at = None
+        n_commands = sum(request.priority is Priority.COMMAND for request in requests)
+        if n_commands:
+            with self._commands_lock:
+                self._commands_count = max(self._commands_count - n_commands, 0)
+                if not self._commands_count:
+                    self._no_command_evt.set()
+
+    def _job_on_wire(self, job: _Job, sent_at: float) -> None:
+        # account for command latency of requests queued for single-run
+        for request in _job_requests(job):
+            if request._single_run_at is not None:
+                if request.priority is Priority.COMMAND:
+                    self.stats.command_latency.add(sent_at - request._single_run_at)
+                request._single_run_at = None
+
+    def _add_request(self, request: ModbusRequest) -> None:
+        """ Reference a new request in the I/O engine. """
+        self._scheduler.add(request)
+        self._requests.add(request)
+
+    @abstractmethod
+    def _single_run_q_size(self) -> int:
+        """ Return the number of requests pending in the single-run queue. """
+
+    @abstractmethod
+    def _single_run_put(self, request: ModbusRequest) -> None:
+        """ Queue a request for single-run (raise queue.Full if this is not possible). """
+
+    @abstractmethod
+    def _call_later(self, delay: float, func: Callable[[], Any]) -> None:
+        """ Call func (from an I/O thread) after delay seconds. """
+
+    def _plan_single_run_jobs(self, requests: List[ModbusRequest]) -> List[_Job]:
+        jobs_l: List[_Job] = []
+        for request in dict.fromkeys(requests):
+            # skip outdated requests
+            if not request.single_run_ready:
+                continue
+            # write requests only send their dirty spans
+            if request.type in _WRITE_MERGE_GAP:
+                jobs_l.append(_WriteSpans.of_dirty(request))
+            else:
+                jobs_l.append(request)
+        return _pair_write_read(jobs_l) if self.pair_write_read else jobs_l
+
+    def _plan_cyclic_jobs(self, requests: List[ModbusRequest]) -> List[_Job]:
+        # keep cyclic requests only
+        cyclic_req_l = [r for r in requests if r.cyclic]
+        # cyclic write requests send their whole data space
+        read_req_l = [r for r in cyclic_req_l if r.type in _READ_MAX_SIZE]
+        write_jobs_l = [_WriteSpans.of_all(r) for r in cyclic_req_l if r.type in _WRITE_MERGE_GAP]
+        # without the planner, every read request is a job
+        if not self.coalesce_reads:
+            jobs_l: List[_Job] = [*read_req_l, *write_jobs_l]
+        # read requests are merged into read blocks
         else:
-            # ignore other requests
-            return
+            jobs_l = [*_plan_read_blocks(read_req_l, max_gap=self.coalesce_max_gap), *write_jobs_l]
+        # writes and reads of holding registers due together share FC23 PDUs
+        return _pair_write_read(jobs_l) if self.pair_write_read else jobs_l
+
+    def _transactions_done(self, transactions_l: List[_Transaction]) -> None:
+        write_ok_d: Dict[_WriteSpans, bool] = {}
+        job_transactions_d: Dict[Any, List[_Transaction]] = {}
+        for transaction in transactions_l:
+            job = transaction.job
+            job_transactions_d.setdefault(job, []).append(transaction)
+            if transaction.sent_at is not None:
+                self._job_on_wire(job, transaction.sent_at)
+                # a sample per PDU sent (an exception response is an error)
+                if transaction.rx_pdu is not None and transaction.done_at is not None:
+                    self.stats.add(transaction.done_at - transaction.sent_at, error=transaction.rx_pdu[0] >= 0x80)
+                else:
+                    self.stats.add(None, error=True)
+            if isinstance(job, _WriteReadPair):
+                registers_l = None
+                if transaction.rx_pdu is not None:
+                    registers_l = _write_read_rx_pdu(job.read_job.size, transaction.rx_pdu)
+                self._write_read_done(job, registers_l)
+            elif job.type in _READ_MAX_SIZE:
+                registers_l = None
+                if transaction.rx_pdu is not None:
+                    registers_l = _read_rx_pdu(job.type, job.size, transaction.rx_pdu)
+                if isinstance(job, _ReadBlock):
+                    self._read_block_done(job, registers_l)
+                else:
+                    self._read_done(job, registers_l)
+            elif isinstance(job, _WriteSpans) and transaction.span:
+                write_ok = transaction.rx_pdu is not None and _write_rx_pdu(transaction.tx_pdu, transaction.rx_pdu)
+                # an unsent span stays dirty
+                if not write_ok:
+                    job.request._data.mark_dirty(*transaction.span)
+                write_ok_d[job] = write_ok_d.get(job, True) and write_ok
+        for job, write_ok in write_ok_d.items():
+            self._write_done(job, write_ok)
+        # a job run lasts from the send of its first PDU to the response of its last one
+        for job, job_transactions_l in job_transactions_d.items():
+            duration = None
+            if all(t.done_at is not None for t in job_transactions_l):
+                duration = max(t.done_at for t in job_transactions_l) - min(t.sent_at for t in job_transactions_l)
+            self._job_stats(job, duration)
+
+    def _read_done(self, request: ModbusRequest, registers_l: Optional[list]) -> None:
         # process result
         if registers_l:
             # on success
@@ -281,59 +1187,502 @@ class ModbusTCPDevice(Device):
               f'from device {request.device}'
         logger.debug(msg)
 
-    def _process_write_request(self, request: ModbusRequest) -> None:
-        # do request
-        if request.type is _RequestType.WRITE_COILS:
-            registers_l = request._get_data(address=request.address, size=request.size)
-            with self.safe_cli as cli:
-                if request.single_func:
-                    write_ok = cli.write_single_coil(request.address, registers_l[0])
-                else:
-                    write_ok = cli.write_multiple_coils(request.address, registers_l)
-        elif request.type is _RequestType.WRITE_H_REGS:
-            registers_l = request._get_data(address=request.address, size=request.size)
-            with self.safe_cli as cli:
-                if request.single_func:
-                    write_ok = cli.write_single_register(request.address, registers_l[0])
-                else:
-                    write_ok = cli.write_multiple_registers(request.address, registers_l)
+    def _read_block_done(self, block: _ReadBlock, registers_l: Optional[list]) -> None:
+        # dispatch result to every request of the block
+        for request in block.requests:
+            if registers_l:
+                # on success
+                offset = request.address - block.address
+                request._set_data(address=request.address, registers_l=registers_l[offset:offset + request.size],
+                                  by_thread=True)
+                request.error = False
+            else:
+                # on error
+                request.error = True
+            # mark request run as done
+            request.run_done_evt.set()
+        # debug message
+        msg = f'{block.type.name.lower()} size={block.size} at @{block.address} for {len(block.requests)} ' \
+              f'request(s) return {registers_l} from device {self}'
+        logger.debug(msg)
+
+    def _write_read_done(self, pair: _WriteReadPair, registers_l: Optional[list]) -> None:
+        # a valid response acknowledges the write too
+        if registers_l is None:
+            pair.write_job.request._data.mark_dirty(*pair.write_span)
+        self._write_done(pair.write_job, registers_l is not None)
+        if isinstance(pair.read_job, _ReadBlock):
+            self._read_block_done(pair.read_job, registers_l)
         else:
-            # ignore other requests
-            return
+            self._read_done(pair.read_job, registers_l)
+
+    def _write_done(self, job: _WriteSpans, write_ok: bool) -> None:
+        request = job.request
         # result
         request.error = not write_ok
         # mark request run as done
         request.run_done_evt.set()
         # debug message
-        msg = f'{request.type.name.lower()} {registers_l} at @{request.address} return {write_ok} ' \
-              f'on device {request.device}'
+        msg = f'{request.type.name.lower()} spans={job.spans_l} return {write_ok} on device {request.device}'
         logger.debug(msg)
 
-    def _process_device_state(self):
-        with self.safe_cli as cli:
-            # ensure TCP connection is close when device is disabled
-            if self.connected and not self.enabled:
-                cli.close()
-            # update connected flag
-            self.connected = cli.is_open
-
-    def add_read_bits_request(self, address: int, size: int = 1, cyclic: bool = False, d_inputs: bool = False):
+    def add_read_bits_request(self, address: int, size: int = 1, cyclic: bool = False, d_inputs: bool = False,
+                              period: Optional[float] = None, priority: Optional[Priority] = None):
         req_type = _RequestType.READ_D_INPUTS if d_inputs else _RequestType.READ_COILS
-        return ModbusRequest(self, type=req_type, address=address, size=size, default_value=None, cyclic=cyclic)
+        return ModbusRequest(self, type=req_type, address=address, size=size, default_value=None, cyclic=cyclic,
+                             period=period, priority=priority)
 
     def add_write_bits_request(self, address: int, size: int = 1, cyclic: bool = False, on_set: bool = False,
-                               default_value: bool = False, single_func: bool = False):
+                               default_value: bool = False, single_func: bool = False, period: Optional[float] = None,
+                               write_window: float = 0.0, priority: Optional[Priority] = None):
         return ModbusRequest(self, type=_RequestType.WRITE_COILS, address=address, size=size,
-                             default_value=default_value, cyclic=cyclic, on_set=on_set, single_func=single_func)
+                             default_value=default_value, cyclic=cyclic, on_set=on_set, single_func=single_func,
+                             period=period, write_window=write_window, priority=priority)
 
-    def add_read_regs_request(self, address: int, size: int = 1, cyclic: bool = False, i_regs: bool = False):
+    def add_read_regs_request(self, address: int, size: int = 1, cyclic: bool = False, i_regs: bool = False,
+                              period: Optional[float] = None, priority: Optional[Priority] = None):
         req_type = _RequestType.READ_I_REGS if i_regs else _RequestType.READ_H_REGS
-        return ModbusRequest(self, type=req_type, address=address, size=size, default_value=None, cyclic=cyclic)
+        return ModbusRequest(self, type=req_type, address=address, size=size, default_value=None, cyclic=cyclic,
+                             period=period, priority=priority)
 
     def add_write_regs_request(self, address: int, size: int = 1, cyclic: bool = False, on_set: bool = False,
-                               default_value: int = 0, single_func: bool = False):
+                               default_value: int = 0, single_func: bool = False, period: Optional[float] = None,
+                               write_window: float = 0.0, priority: Optional[Priority] = None):
         return ModbusRequest(self, type=_RequestType.WRITE_H_REGS, address=address, size=size,
-                             default_value=default_value, cyclic=cyclic, on_set=on_set, single_func=single_func)
+                             default_value=default_value, cyclic=cyclic, on_set=on_set, single_func=single_func,
+                             period=period, write_window=write_window, priority=priority)
+
+
+class ModbusTCPGateway:
+    """ A modbus/TCP connection shared by the devices (unit ids) behind a gateway (like a TCP to RTU one).
+
+    Devices take turns on a single socket in the order of their requests: a device holds it for one
+    transaction with the blocking engine, or for at most turn_size transactions with the pipelined one.
+    """
+
+    def __init__(self, host: str = 'localhost', port: int = 502, timeout: float = 5.0, max_in_flight: int = 1,
+                 turn_size: int = 8, client_args: Optional[dict] = None) -> None:
+        # args
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.turn_size = turn_size
+        self.client_args = client_args
+        # public
+        self.turn_lock = FairLock()
+        # clients (only the one of the engine in use opens a socket)
+        args_d = {} if self.client_args is None else self.client_args
+        self.cli = _StatsModbusClient(host=self.host, port=self.port, timeout=self.timeout, auto_open=True,
+                                      **args_d)
+        self.pipe_cli = _PipelinedClient(host=self.host, port=self.port, unit_id=1, timeout=self.timeout,
+                                         max_in_flight=self.max_in_flight)
+
+    def __repr__(self) -> str:
+        return auto_repr(self, export_t=('host', 'port', 'timeout', 'max_in_flight', 'turn_size'))
+
+
+class _GatewayUnitClient:
+    """ Access to a client of a gateway for a unit id, in turns (used like SafeObject). """
+
+    def __init__(self, gateway: ModbusTCPGateway, client: Union[_StatsModbusClient, _PipelinedClient],
+                 unit_id: int, stats: ModbusDeviceStats) -> None:
+        # args
+        self.gateway = gateway
+        self.client = client
+        self.unit_id = unit_id
+        self.stats = stats
+
+    def __enter__(self):
+        self.gateway.turn_lock.acquire()
+        self.client.unit_id = self.unit_id
+        self.client.stats = self.stats
+        return self.client
+
+    def __exit__(self, *args):
+        self.gateway.turn_lock.release()
+
+
+class ModbusTCPDevice(ModbusDevice):
+    def __init__(self, host='localhost', port=502, unit_id=1, timeout=5.0, refresh=1.0, cancel_delay=5.0,
+                 enabled=True, client_args: Optional[dict] = None, coalesce_reads: bool = False,
+                 coalesce_max_gap: int = 0, max_in_flight: int = 1, pair_write_read: bool = False,
+                 gateway: Optional[ModbusTCPGateway] = None):
+        """ A modbus/TCP device.
+
+        With gateway, the device uses the shared connection of this gateway: its host, port, timeout,
+        max_in_flight and client_args apply.
+        """
+        if gateway:
+            host, port, timeout = gateway.host, gateway.port, gateway.timeout
+            max_in_flight, client_args = gateway.max_in_flight, gateway.client_args
+        super().__init__(host=host, port=port, unit_id=unit_id, timeout=timeout, refresh=refresh,
+                         cancel_delay=cancel_delay, enabled=enabled, coalesce_reads=coalesce_reads,
+                         coalesce_max_gap=coalesce_max_gap, max_in_flight=max_in_flight,
+                         pair_write_read=pair_write_read)
+        # args
+        self.client_args = client_args
+        self.gateway = gateway
+        if self.gateway:
+            # clients of the gateway, in turns with others devices
+            self.safe_cli: Union[SafeObject, _GatewayUnitClient] = \
+                _GatewayUnitClient(self.gateway, self.gateway.cli, self.unit_id, self.stats)
+            self.safe_pipe_cli: Union[SafeObject, _GatewayUnitClient] = \
+                _GatewayUnitClient(self.gateway, self.gateway.pipe_cli, self.unit_id, self.stats)
+        else:
+            # allow thread safe access to modbus client (allow direct blocking IO on modbus socket)
+            args_d = {} if self.client_args is None else self.client_args
+            cli = _StatsModbusClient(host=self.host, port=self.port, unit_id=self.unit_id, timeout=self.timeout,
+                                     auto_open=True, **args_d)
+            cli.stats = self.stats
+            self.safe_cli = SafeObject(cli)
+            # pipelined engine client (used instead of safe_cli by I/O threads when max_in_flight > 1)
+            pipe_cli = _PipelinedClient(host=self.host, port=self.port, unit_id=self.unit_id, timeout=self.timeout,
+                                        max_in_flight=self.max_in_flight)
+            pipe_cli.stats = self.stats
+            self.safe_pipe_cli = SafeObject(pipe_cli)
+        # define polling threads
+        self.cyclic_thread = _CyclicThread(self)
+        self.single_run_thread = _SingleRunThread(self)
+        # start threads
+        self.cyclic_thread.start()
+        self.single_run_thread.start()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(host={self.host!r}, port={self.port}, unit_id={self.unit_id}, ' \
+               f'timeout={self.timeout:.1f}, refresh={self.refresh:.1f}, client_adv_args={self.client_args!r})'
+
+    def _single_run_q_size(self) -> int:
+        return self.single_run_thread.request_q.qsize()
+
+    def _single_run_put(self, request: ModbusRequest) -> None:
+        # count the command before the single-run thread can process it
+        self._command_queued(request)
+        try:
+            self.single_run_thread.put(request)
+        except queue.Full:
+            self._single_run_done([request])
+            raise
+
+    def _yield_to_commands(self) -> None:
+        """ Wait for the single-run of pending COMMAND requests (up to cancel_delay). """
+        if not self._no_command_evt.is_set():
+            self._no_command_evt.wait(timeout=self.cancel_delay)
+
+    def _call_later(self, delay: float, func: Callable[[], Any]) -> None:
+        timer = Timer(delay, func)
+        timer.daemon = True
+        timer.start()
+
+    def _process_jobs(self, jobs_l: List[_Job], preemptible: bool = False) -> None:
+        """ Process a list of jobs (requests or read blocks) with the current engine.
+
+        With preemptible, pending COMMAND requests run first between two PDUs (or two pipeline fills).
+        """
+        if self.pipelined:
+            try:
+                transactions_l = _build_transactions(jobs_l)
+                # on a gateway, hold the connection for at most turn_size transactions at once
+                if self.gateway:
+                    turn_size = self.gateway.turn_size
+                else:
+                    turn_size = self.max_in_flight if preemptible else max(len(transactions_l), 1)
+                for i in range(0, max(len(transactions_l), 1), turn_size):
+                    if preemptible:
+                        self._yield_to_commands()
+                    with self.safe_pipe_cli as cli:
+                        cli.run(transactions_l[i:i + turn_size])
+                self._transactions_done(transactions_l)
+                self._process_device_state()
+            except Exception as e:
+                logger.warning(f'except {type(e).__name__} in {current_thread().name} (pipelined jobs): {e}')
+        else:
+            for job in jobs_l:
+                try:
+                    if preemptible:
+                        self._yield_to_commands()
+                    t_start = time.monotonic()
+                    self._job_on_wire(job, t_start)
+                    if isinstance(job, _ReadBlock):
+                        self._process_read_block(job)
+                    elif isinstance(job, _WriteReadPair):
+                        self._process_write_read(job)
+                    elif isinstance(job, _WriteSpans):
+                        self._process_write_spans(job)
+                    else:
+                        self._process_read_request(job)
+                    self._job_stats(job, time.monotonic() - t_start)
+                    self._process_device_state()
+                except Exception as e:
+                    msg = f'except {type(e).__name__} in {current_thread().name} ' \
+                          f'({job.__class__.__name__}): {e}'
+                    logger.warning(msg)
+
+    def _pdu_done(self, cli: _StatsModbusClient, t_start: float) -> None:
+        # a sample per PDU of the blocking engine (latency of the ones with a response only)
+        if cli.last_error in (MB_NO_ERR, MB_EXCEPT_ERR):
+            self.stats.add(time.monotonic() - t_start, error=cli.last_error != MB_NO_ERR)
+        else:
+            self.stats.add(None, error=True)
+            if cli.last_error == MB_TIMEOUT_ERR:
+                self.stats.timeouts += 1
+
+    def _read(self, type: _RequestType, address: int, size: int) -> Optional[list]:
+        if type not in _READ_MAX_SIZE:
+            raise ValueError(f'{type.name} is not a read request type')
+        with self.safe_cli as cli:
+            t_start = time.monotonic()
+            if type is _RequestType.READ_COILS:
+                registers_l = cli.read_coils(address, size)
+            elif type == _RequestType.READ_D_INPUTS:
+                registers_l = cli.read_discrete_inputs(address, size)
+            elif type == _RequestType.READ_H_REGS:
+                registers_l = cli.read_holding_registers(address, size)
+            else:
+                registers_l = cli.read_input_registers(address, size)
+            self._pdu_done(cli, t_start)
+            return registers_l
+
+    def _process_read_request(self, request: ModbusRequest) -> None:
+        # ignore other requests
+        if request.type not in _READ_MAX_SIZE:
+            return
+        # do request
+        self._read_done(request, self._read(request.type, request.address, request.size))
+
+    def _process_read_block(self, block: _ReadBlock) -> None:
+        # do a single request for the whole block
+        self._read_block_done(block, self._read(block.type, block.address, block.size))
+
+    def _write(self, type: _RequestType, address: int, registers_l: list, single_func: bool) -> bool:
+        if type not in _WRITE_MERGE_GAP:
+            raise ValueError(f'{type.name} is not a write request type')
+        with self.safe_cli as cli:
+            t_start = time.monotonic()
+            if type is _RequestType.WRITE_COILS:
+                if single_func:
+                    write_ok = cli.write_single_coil(address, registers_l[0])
+                else:
+                    write_ok = cli.write_multiple_coils(address, registers_l)
+            else:
+                if single_func:
+                    write_ok = cli.write_single_register(address, registers_l[0])
+                else:
+                    write_ok = cli.write_multiple_registers(address, registers_l)
+            self._pdu_done(cli, t_start)
+            return write_ok
+
+    def _process_write_read(self, pair: _WriteReadPair) -> None:
+        # do a single FC23 request for the write and the read
+        address, size = pair.write_span
+        registers_l = pair.write_job.request._get_data(address=address, size=size)
+        with self.safe_cli as cli:
+            t_start = time.monotonic()
+            read_l = cli.write_read_multiple_registers(address, registers_l, pair.read_job.address,
+                                                       pair.read_job.size)
+            self._pdu_done(cli, t_start)
+        self._write_read_done(pair, read_l)
+
+    def _process_write_spans(self, job: _WriteSpans) -> None:
+        # do a write for every span
+        write_ok = True
+        for address, size in job.spans_l:
+            registers_l = job.request._get_data(address=address, size=size)
+            if not self._write(job.type, address, registers_l, single_func=job.request.single_func):
+                # an unsent span stays dirty
+                job.request._data.mark_dirty(address, size)
+                write_ok = False
+        self._write_done(job, write_ok)
+
+    def _process_device_state(self):
+        with (self.safe_pipe_cli if self.pipelined else self.safe_cli) as cli:
+            # ensure TCP connection is close when device is disabled (a gateway one is shared)
+            if self.connected and not self.enabled and not self.gateway:
+                cli.close()
+            # update connected flag
+            self._set_connected(cli.is_open)
+
+
+class AsyncModbusTCPDevice(ModbusDevice):
+    """ A modbus/TCP device served by coroutines on an event loop shared by every instance.
+
+    Requests and data sources are the same as for ModbusTCPDevice, but no I/O thread is started per device:
+    all devices run on a single asyncio loop thread, which makes this class suitable for hundreds of devices.
+    """
+
+    def __init__(self, host='localhost', port=502, unit_id=1, timeout=5.0, refresh=1.0, cancel_delay=5.0,
+                 enabled=True, coalesce_reads: bool = False, coalesce_max_gap: int = 0, max_in_flight: int = 1,
+                 pair_write_read: bool = False):
+        super().__init__(host=host, port=port, unit_id=unit_id, timeout=timeout, refresh=refresh,
+                         cancel_delay=cancel_delay, enabled=enabled, coalesce_reads=coalesce_reads,
+                         coalesce_max_gap=coalesce_max_gap, max_in_flight=max_in_flight,
+                         pair_write_read=pair_write_read)
+        # private
+        self._cli = _AsyncPipelinedClient(host=self.host, port=self.port, unit_id=self.unit_id,
+                                          timeout=self.timeout, max_in_flight=self.max_in_flight)
+        self._cli.stats = self.stats
+        self._loop = _AsyncLoopThread.get().loop
+        self._cli_lock: Optional[asyncio.Lock] = None
+        self._single_run_q: Optional[asyncio.PriorityQueue] = None
+        self._single_run_seq = count()
+        # start device coroutines on the shared loop
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+
+    async def _start(self) -> None:
+        # asyncio objects must be created in the loop thread
+        self._cli_lock = asyncio.Lock()
+        self._single_run_q = asyncio.PriorityQueue(maxsize=255)
+        self._loop.create_task(self._cyclic_task())
+        self._loop.create_task(self._single_run_task())
+
+    def _single_run_q_size(self) -> int:
+        assert self._single_run_q
+        return self._single_run_q.qsize()
+
+    def _single_run_put(self, request: ModbusRequest) -> None:
+        assert self._single_run_q
+        if self._single_run_q.full():
+            raise queue.Full
+        self._command_queued(request)
+        self._loop.call_soon_threadsafe(self._single_run_put_nowait, request)
+
+    def _call_later(self, delay: float, func: Callable[[], Any]) -> None:
+        self._loop.call_soon_threadsafe(self._loop.call_later, delay, func)
+
+    def _single_run_put_nowait(self, request: ModbusRequest) -> None:
+        assert self._single_run_q
+        try:
+            # FIFO order for requests of the same priority
+            self._single_run_q.put_nowait((request.priority, next(self._single_run_seq), request))
+        except asyncio.QueueFull:
+            self._single_run_dequeued([request])
+            self._single_run_done([request])
+            logger.warning(f'single-run queue full, drop {request.type.name} at @{request.address}')
+
+    def _pop_commands(self) -> List[ModbusRequest]:
+        """ Remove the COMMAND requests from the single-run queue (they are at the head of it). """
+        assert self._single_run_q
+        requests_l = []
+        while not self._single_run_q.empty():
+            item = self._single_run_q.get_nowait()
+            if item[0] is not Priority.COMMAND:
+                # back to the queue, with its priority and sequence number
+                self._single_run_q.put_nowait(item)
+                break
+            requests_l.append(item[-1])
+        return requests_l
+
+    async def _process_jobs(self, jobs_l: List[_Job], preemptible: bool = False) -> None:
+        """ Process a list of jobs (requests or read blocks).
+
+        With preemptible, COMMAND requests of the single-run queue are processed first between two pipeline fills.
+        """
+        assert self._cli_lock
+        try:
+            transactions_l = _build_transactions(jobs_l)
+            turn_size = self.max_in_flight if preemptible else max(len(transactions_l), 1)
+            for i in range(0, max(len(transactions_l), 1), turn_size):
+                if preemptible and not self._no_command_evt.is_set():
+                    commands_l = self._pop_commands()
+                    if commands_l:
+                        await self._single_run(commands_l)
+                async with self._cli_lock:
+                    await self._cli.async_run(transactions_l[i:i + turn_size])
+            self._transactions_done(transactions_l)
+        except Exception as e:
+            logger.warning(f'except {type(e).__name__} in {self} coroutine: {e}')
+        self._process_device_state()
+
+    def _process_device_state(self) -> None:
+        # ensure TCP connection is close when device is disabled
+        if self.connected and not self.enabled:
+            self._cli.close()
+        # update connected flag
+        self._set_connected(self._cli.is_open)
+
+    async def _single_run_task(self) -> None:
+        """ This coroutine executes all requests put to the single-run queue. """
+        assert self._single_run_q
+        while True:
+            # wait next request from queue, then process every pending request at once
+            requests_l = [(await self._single_run_q.get())[-1]]
+            while not self._single_run_q.empty():
+                requests_l.append(self._single_run_q.get_nowait()[-1])
+            await self._single_run(requests_l)
+
+    async def _single_run(self, requests_l: List[ModbusRequest]) -> None:
+        self._single_run_dequeued(requests_l)
+        if self.enabled:
+            await self._process_jobs(self._plan_single_run_jobs(requests_l))
+        else:
+            self._process_device_state()
+        self._single_run_done(requests_l)
+
+    async def _cyclic_task(self) -> None:
+        """ This coroutine executes cyclic requests when they are due. """
+        while True:
+            # process cyclic jobs (requests or read blocks) due now
+            due_l = self._pop_due()
+            if self.enabled:
+                await self._process_jobs(self._plan_cyclic_jobs(due_l), preemptible=True)
+            else:
+                self._process_device_state()
+            # wait for the next deadline
+            await asyncio.sleep(self._scheduler.wait_time())
+
+
+def _request_label(request: ModbusRequest) -> str:
+    return f'{request.type.name.lower()}@{request.address}/{request.size}'
+
+
+def prometheus_text(devices: Iterable[ModbusDevice], prefix: str = 'pyhmi_modbus') -> str:
+    """ Export the I/O statistics of devices (and of their requests) in the Prometheus text format.
+
+    Serve it on the /metrics endpoint of an HTTP server (like http.server) to scrape slow devices.
+    """
+    devices_l = list(devices)
+    lines_l: List[str] = []
+
+    def add_family(name: str, type: str, help: str) -> str:
+        lines_l.extend([f'# HELP {prefix}_{name} {help}', f'# TYPE {prefix}_{name} {type}'])
+        return f'{prefix}_{name}'
+
+    def add_histogram(name: str, help: str, samples_l: List[Tuple[str, LatencyHistogram]]) -> None:
+        metric = add_family(name, 'histogram', help)
+        for labels, hist in samples_l:
+            for bound, count in hist.buckets():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines_l.append(f'{metric}_bucket{{{labels},le="{le}"}} {count}')
+            lines_l.append(f'{metric}_sum{{{labels}}} {hist.total}')
+            lines_l.append(f'{metric}_count{{{labels}}} {hist.count}')
+
+    # device metrics
+    dev_labels_l = [(f'device="{device}"', device) for device in devices_l]
+    metric = add_family('connected', 'gauge', 'Device TCP connection state.')
+    lines_l.extend(f'{metric}{{{labels}}} {int(device.connected)}' for labels, device in dev_labels_l)
+    for name, help in (('requests', 'PDUs sent.'), ('errors', 'PDUs without a valid response.'),
+                       ('timeouts', 'Response timeouts.'), ('tx_bytes', 'Bytes sent.'),
+                       ('rx_bytes', 'Bytes received.'), ('reconnects', 'TCP reconnections.')):
+        metric = add_family(f'{name}_total', 'counter', help)
+        lines_l.extend(f'{metric}{{{labels}}} {getattr(device.stats, name)}' for labels, device in dev_labels_l)
+    metric = add_family('missed_deadlines_total', 'counter', 'Cyclic runs skipped by an overloaded device.')
+    lines_l.extend(f'{metric}{{{labels}}} {device._scheduler.missed_count}' for labels, device in dev_labels_l)
+    add_histogram('latency_seconds', 'PDU response time.',
+                  [(labels, device.stats.latency) for labels, device in dev_labels_l])
+    add_histogram('cycle_lag_seconds', 'Delay of cyclic runs after their deadline.',
+                  [(labels, device.stats.cycle_lag) for labels, device in dev_labels_l])
+    add_histogram('command_latency_seconds', 'Delay from the run of a command to the send of its PDU.',
+                  [(labels, device.stats.command_latency) for labels, device in dev_labels_l])
+    # request metrics
+    req_labels_l = [(f'device="{device}",request="{_request_label(request)}"', request)
+                    for device in devices_l for request in list(device._requests)]
+    metric = add_family('request_runs_total', 'counter', 'Request runs.')
+    lines_l.extend(f'{metric}{{{labels}}} {request.stats.runs}' for labels, request in req_labels_l)
+    metric = add_family('request_errors_total', 'counter', 'Request runs in error.')
+    lines_l.extend(f'{metric}{{{labels}}} {request.stats.errors}' for labels, request in req_labels_l)
+    add_histogram('request_latency_seconds', 'Request run duration.',
+                  [(labels, request.stats.latency) for labels, request in req_labels_l])
+    return '\n'.join(lines_l) + '\n'
 
 
 class ModbusBool(ModbusDS):
@@ -373,6 +1722,9 @@ class ModbusBool(ModbusDS):
     def error(self) -> bool:
         return self.request.error
 
+    def watch(self, tag: Tag) -> bool:
+        return self.request._watch(tag, address=self.address)
+
     def sync(self) -> bool:
         return self.request.run()
 
@@ -411,6 +1763,9 @@ class ModbusBoolRegister(ModbusDS):
     def error(self) -> bool:
         return self.request.error
 
+    def watch(self, tag: Tag) -> bool:
+        return self.request._watch(tag, address=self.address)
+
     def sync(self) -> bool:
         return self.request.run()
 
@@ -423,7 +1778,14 @@ class ModbusInt(ModbusDS):
     def __init__(self, request: ModbusRequest, address: int, bit_length: int = 16, byte_order: BYTE_ORDER_TYPE = 'big',
                  signed: bool = False, swap_bytes: bool = False, swap_word: bool = False) -> None:
         # used by property
+        self._bit_length = 16
         self._byte_order: ModbusInt.BYTE_ORDER_TYPE = 'big'
+        self._signed = False
+        self._swap_bytes = False
+        self._swap_word = False
+        self._codec: Optional[_RegsCodec] = None
+        self._cache_gen = -1
+        self._cache_value = None
         # args
         self.request = request
         self.address = address
@@ -445,6 +1807,15 @@ class ModbusInt(ModbusDS):
     def reg_length(self):
         return self.bit_length//16 + (1 if self.bit_length % 16 else 0)
 
+    @property
+    def bit_length(self) -> int:
+        return self._bit_length
+
+    @bit_length.setter
+    def bit_length(self, value: int):
+        self._bit_length = value
+        self._reset_codec()
+
     @property
     def byte_order(self) -> BYTE_ORDER_TYPE:
         return self._byte_order
@@ -455,6 +1826,51 @@ class ModbusInt(ModbusDS):
         if value not in get_args(ModbusInt.BYTE_ORDER_TYPE):
             raise ValueError(f'byte_order must be in {get_args(ModbusInt.BYTE_ORDER_TYPE)}')
         self._byte_order = value
+        self._reset_codec()
+
+    @property
+    def signed(self) -> bool:
+        return self._signed
+
+    @signed.setter
+    def signed(self, value: bool):
+        self._signed = value
+        self._reset_codec()
+
+    @property
+    def swap_bytes(self) -> bool:
+        return self._swap_bytes
+
+    @swap_bytes.setter
+    def swap_bytes(self, value: bool):
+        self._swap_bytes = value
+        self._reset_codec()
+
+    @property
+    def swap_word(self) -> bool:
+        return self._swap_word
+
+    @swap_word.setter
+    def swap_word(self, value: bool):
+        self._swap_word = value
+        self._reset_codec()
+
+    def _reset_codec(self) -> None:
+        # codec and cached value must be rebuilt after an option change
+        self._codec = None
+        self._cache_gen = -1
+
+    @property
+    def codec(self) -> _RegsCodec:
+        # build it on first use or after an option change
+        if self._codec is None:
+            fmt_char = {16: 'h', 32: 'i', 64: 'q'}.get(self.bit_length)
+            if fmt_char and not self.signed:
+                fmt_char = fmt_char.upper()
+            self._codec = _RegsCodec(byte_length=2*self.reg_length, byte_order=self.byte_order,
+                                     byte_swap=self.swap_bytes, word_swap=self.swap_word,
+                                     fmt_char=fmt_char, signed=self.signed)
+        return self._codec
 
     def add_tag(self, tag: Tag) -> None:
         # warn user of type mismatch between initial tag value and this datasource
@@ -462,22 +1878,12 @@ class ModbusInt(ModbusDS):
             raise TypeError('init_value must be an int')
 
     def get(self) -> Optional[int]:
-        # read register(s)
-        registers_l = self.request._get_data(address=self.address, size=self.reg_length)
-        # skip decoding for uninitialized variables (usually at startup)
-        if None in registers_l:
-            return
-        # list of registers (int) -> bytes
-        value_as_b = bytes()
-        for register in registers_l:
-            value_as_b += register.to_bytes(2, byteorder='big')
-        # apply swaps
-        if self.swap_bytes:
-            value_as_b = swap_bytes(value_as_b)
-        if self.swap_word:
-            value_as_b = swap_words(value_as_b)
-        # format raw
-        return int.from_bytes(value_as_b, byteorder=self.byte_order, signed=self.signed)
+        # decode register(s) once per data space update (skip uninitialized variables, usually at startup)
+        generation = self.request._data.generation
+        if generation != self._cache_gen:
+            self._cache_value = self.request._data.decode(self.codec, self.address)
+            self._cache_gen = generation
+        return self._cache_value
 
     def set(self, value: int) -> None:
         # check write status
@@ -486,24 +1892,22 @@ class ModbusInt(ModbusDS):
         # check value type
         if not isinstance(value, int):
             raise TypeError('unsupported type for value (not an int)')
-        # convert to bytes:
+        # convert to bytes (with swaps):
         # - check strange value status (negative for an unsigned, ...)
         # - apply 2's complement if requested
         try:
-            value_as_b = value.to_bytes(2*self.reg_length, byteorder=self.byte_order, signed=self.signed)
-        except OverflowError as e:
+            value_as_b = self.codec.encode(value)
+        except (struct.error, OverflowError) as e:
             raise ValueError(f'cannot set this int ({e})')
-        # apply swaps
-        if self.swap_bytes:
-            value_as_b = swap_bytes(value_as_b)
-        if self.swap_word:
-            value_as_b = swap_words(value_as_b)
         # apply value to request data space
         self.request._set_data(address=self.address, registers_l=cut_bytes_to_regs(value_as_b))
 
     def error(self) -> bool:
         return self.request.error
 
+    def watch(self, tag: Tag) -> bool:
+        return self.request._watch(tag, address=self.address, size=self.reg_length)
+
     def sync(self) -> bool:
         return self.request.run()
 
@@ -518,6 +1922,11 @@ class ModbusFloat(ModbusDS):
         # used by property
         self._bit_length = 32
         self._byte_order: ModbusFloat.BYTE_ORDER_TYPE = 'big'
+        self._swap_bytes = False
+        self._swap_word = False
+        self._codec: Optional[_RegsCodec] = None
+        self._cache_gen = -1
+        self._cache_value = None
         # args
         self.request = request
         self.address = address
@@ -548,6 +1957,7 @@ class ModbusFloat(ModbusDS):
         if value not in [32, 64]:
             raise ValueError('bit_length must be either 32 or 64')
         self._bit_length = value
+        self._reset_codec()
 
     @property
     def byte_order(self) -> BYTE_ORDER_TYPE:
@@ -559,6 +1969,39 @@ class ModbusFloat(ModbusDS):
         if value not in get_args(ModbusFloat.BYTE_ORDER_TYPE):
             raise ValueError(f'byte_order must be in {get_args(ModbusFloat.BYTE_ORDER_TYPE)}')
         self._byte_order = value
+        self._reset_codec()
+
+    @property
+    def swap_bytes(self) -> bool:
+        return self._swap_bytes
+
+    @swap_bytes.setter
+    def swap_bytes(self, value: bool):
+        self._swap_bytes = value
+        self._reset_codec()
+
+    @property
+    def swap_word(self) -> bool:
+        return self._swap_word
+
+    @swap_word.setter
+    def swap_word(self, value: bool):
+        self._swap_word = value
+        self._reset_codec()
+
+    def _reset_codec(self) -> None:
+        # codec and cached value must be rebuilt after an option change
+        self._codec = None
+        self._cache_gen = -1
+
+    @property
+    def codec(self) -> _RegsCodec:
+        # build it on first use or after an option change
+        if self._codec is None:
+            self._codec = _RegsCodec(byte_length=2*self.reg_length, byte_order=self.byte_order,
+                                     byte_swap=self.swap_bytes, word_swap=self.swap_word,
+                                     fmt_char='f' if self.bit_length == 32 else 'd')
+        return self._codec
 
     def add_tag(self, tag: Tag) -> None:
         # warn user of type mismatch between initial tag value and this datasource
@@ -566,24 +2009,12 @@ class ModbusFloat(ModbusDS):
             raise TypeError('init_value must be a float')
 
     def get(self) -> Optional[float]:
-        # read register(s)
-        registers_l = self.request._get_data(address=self.address, size=self.reg_length)
-        # skip decoding for uninitialized variables (usually at startup)
-        if None in registers_l:
-            return
-        # list of registers (int) -> bytes
-        value_as_b = bytes()
-        for register in registers_l:
-            value_as_b += register.to_bytes(2, byteorder='big')
-        # apply swaps
-        if self.swap_bytes:
-            value_as_b = swap_bytes(value_as_b)
-        if self.swap_word:
-            value_as_b = swap_words(value_as_b)
-        # convert bytes to float and return it
-        fmt = '>' if self.byte_order == 'big' else '<'
-        fmt += 'f' if self.bit_length == 32 else 'd'
-        return struct.unpack(fmt, value_as_b)[0]
+        # decode register(s) once per data space update (skip uninitialized variables, usually at startup)
+        generation = self.request._data.generation
+        if generation != self._cache_gen:
+            self._cache_value = self.request._data.decode(self.codec, self.address)
+            self._cache_gen = generation
+        return self._cache_value
 
     def set(self, value: float) -> None:
         # check write status
@@ -592,34 +2023,107 @@ class ModbusFloat(ModbusDS):
         # check value type
         if not isinstance(value, (int, float)):
             raise TypeError('unsupported type for value (not an int or a float)')
-        # convert to bytes:
-        # - check strange value status (negative for an unsigned, ...)
-        # - apply 2's complement if requested
+        # convert to bytes (with swaps)
         try:
-            fmt = '>' if self.byte_order == 'big' else '<'
-            fmt += 'f' if self.bit_length == 32 else 'd'
-            value_as_b = struct.pack(fmt, value)
+            value_as_b = self.codec.encode(value)
         except (struct.error, OverflowError) as e:
             raise ValueError(f'cannot set this float ({e})')
-        # apply swaps
-        if self.swap_bytes:
-            value_as_b = swap_bytes(value_as_b)
-        if self.swap_word:
-            value_as_b = swap_words(value_as_b)
         # apply value to request data space
         self.request._set_data(address=self.address, registers_l=cut_bytes_to_regs(value_as_b))
 
     def error(self) -> bool:
         return self.request.error
 
+    def watch(self, tag: Tag) -> bool:
+        return self.request._watch(tag, address=self.address, size=self.reg_length)
+
+    def sync(self) -> bool:
+        return self.request.run()
+
+
+class _ModbusArray(ModbusDS):
+    """ Common part of NumPy array data sources. """
+
+    def __init__(self, request: ModbusRequest, address: int, count: int, dtype: str,
+                 byte_order: Literal['little', 'big'] = 'big', swap_bytes: bool = False,
+                 swap_word: bool = False) -> None:
+        # args
+        self.request = request
+        self.address = address
+        self.count = count
+        self.dtype = dtype
+        self.byte_order = byte_order
+        self.swap_bytes = swap_bytes
+        self.swap_word = swap_word
+        # some check
+        if np is None:
+            raise ImportError(f'NumPy is required by {self.__class__.__name__}')
+        if request.type not in (_RequestType.READ_H_REGS, _RequestType.READ_I_REGS, _RequestType.WRITE_H_REGS):
+            raise TypeError(f'bad request type {request.type.name} for {self.__class__.__name__}')
+        if not request.is_valid(at_address=self.address, for_size=self.reg_length):
+            raise ValueError(f'@{self.address} is not available in the data space of this request')
+
+    def __repr__(self) -> str:
+        return auto_repr(self)
+
+    @property
+    def reg_length(self):
+        return self.count * np.dtype(self.dtype).itemsize // 2
+
+    def add_tag(self, tag: Tag) -> None:
+        raise TypeError(f'{self.__class__.__name__} cannot be the data source of a tag')
+
+    def get(self) -> Any:
+        return self.request.as_array(dtype=self.dtype, byte_order=self.byte_order, swap_bytes=self.swap_bytes,
+                                     swap_word=self.swap_word, address=self.address, size=self.reg_length)
+
+    def set(self, value: Any) -> None:
+        raise TypeError(f'cannot write to this data source ({self.__class__.__name__})')
+
+    def error(self) -> bool:
+        return self.request.error
+
+    def watch(self, tag: Tag) -> bool:
+        return self.request._watch(tag, address=self.address, size=self.reg_length)
+
     def sync(self) -> bool:
         return self.request.run()
 
 
+class ModbusIntArray(_ModbusArray):
+    """ A data source to map an array of int to a block of 16-bit modbus registers (decoded with NumPy). """
+
+    def __init__(self, request: ModbusRequest, address: int, count: int, bit_length: int = 16,
+                 byte_order: Literal['little', 'big'] = 'big', signed: bool = False, swap_bytes: bool = False,
+                 swap_word: bool = False) -> None:
+        if bit_length not in [16, 32, 64]:
+            raise ValueError('bit_length must be 16, 32 or 64')
+        dtype = f'{"i" if signed else "u"}{bit_length // 8}'
+        super().__init__(request, address, count, dtype, byte_order=byte_order, swap_bytes=swap_bytes,
+                         swap_word=swap_word)
+
+
+class ModbusFloatArray(_ModbusArray):
+    """ A data source to map an array of float to a block of 16-bit modbus registers (decoded with NumPy). """
+
+    def __init__(self, request: ModbusRequest, address: int, count: int, bit_length: int = 32,
+                 byte_order: Literal['little', 'big'] = 'big', swap_bytes: bool = False,
+                 swap_word: bool = False) -> None:
+        if bit_length not in [32, 64]:
+            raise ValueError('bit_length must be either 32 or 64')
+        super().__init__(request, address, count, f'f{bit_length // 8}', byte_order=byte_order,
+                         swap_bytes=swap_bytes, swap_word=swap_word)
+
+
 class ModbusStrTBox(ModbusDS):
     """ A data source to map a str to a T-Box one (or similar product) from its 16-bit register spaces. """
 
     def __init__(self, request: ModbusRequest, address: int, str_length: int, encoding: str = 'iso-8859-1') -> None:
+        # used by property
+        self._str_length = 0
+        self._encoding = ''
+        self._cache_gen = -1
+        self._cache_value: Optional[str] = None
         # args
         self.request = request
         self.address = address
@@ -638,21 +2142,43 @@ class ModbusStrTBox(ModbusDS):
     def reg_length(self):
         return self.str_length//2 + (1 if self.str_length % 2 else 0)
 
+    @property
+    def str_length(self) -> int:
+        return self._str_length
+
+    @str_length.setter
+    def str_length(self, value: int):
+        self._str_length = value
+        self._cache_gen = -1
+
+    @property
+    def encoding(self) -> str:
+        return self._encoding
+
+    @encoding.setter
+    def encoding(self, value: str):
+        self._encoding = value
+        self._cache_gen = -1
+
     def add_tag(self, tag: Tag) -> None:
         # warn user of type mismatch between initial tag value and this datasource
         if type(tag.init_value) is not str:
             raise TypeError('init_value must be a str')
 
     def get(self) -> Optional[str]:
-        # read register(s)
-        registers_l = self.request._get_data(address=self.address, size=self.reg_length)
+        # decode register(s) once per data space update
+        generation = self.request._data.generation
+        if generation != self._cache_gen:
+            self._cache_value = self._decode()
+            self._cache_gen = generation
+        return self._cache_value
+
+    def _decode(self) -> Optional[str]:
+        # read register(s) as raw bytes
+        value_as_b = self.request._data.get_bytes(address=self.address, size=self.reg_length)
         # skip decoding for uninitialized variables (usually at startup)
-        if None in registers_l:
+        if value_as_b is None:
             return
-        # list of registers (int) -> bytes
-        value_as_b = bytes()
-        for register in registers_l:
-            value_as_b += register.to_bytes(2, byteorder='big')
         # remove the final padding
         value_as_b = value_as_b.rstrip(b'\x00')
         # format raw
@@ -687,5 +2213,8 @@ class ModbusStrTBox(ModbusDS):
     def error(self) -> bool:
         return self.request.error
 
+    def watch(self, tag: Tag) -> bool:
+        return self.request._watch(tag, address=self.address, size=self.reg_length)
+
     def sync(self) -> bool:
         return self.request.run()
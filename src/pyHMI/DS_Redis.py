@@ -1,15 +1,26 @@
 import logging
 import queue
+import re
+import select
+import socket
+import struct
 import time
-from threading import Event, Lock, Thread
-from typing import Any, Optional, Set, Union
-from weakref import WeakValueDictionary
+from abc import ABC, abstractmethod
+from threading import Condition, Event, Lock, Thread
+from typing import Any, Dict, List, Optional, Tuple, Union
+from weakref import WeakSet
 
 import redis
 
-from .Misc import TTL, SafeObject
+from .Misc import TTL, CyclicScheduler, LoopStats, SafeObject
 from .Tag import DataSource, Device, Tag
 
+# msgpack is only required by MsgpackCodec
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -52,13 +63,97 @@ def _encode_to_redis(data: KEY_TYPE, type: KEY_TYPE_CLASS) -> bytes:
     raise TypeError
 
 
+class RedisCodec(ABC):
+    """ Convert values of a data source type to/from redis bytes (raise TypeError on a bad value). """
+
+    @abstractmethod
+    def encode(self, data: Any, type: KEY_TYPE_CLASS) -> bytes:
+        """ Return data (a value of type) as redis bytes. """
+
+    @abstractmethod
+    def decode(self, raw_data: bytes, type: KEY_TYPE_CLASS) -> Any:
+        """ Return redis bytes raw_data as a value of type. """
+
+
+class TextCodec(RedisCodec):
+    """ The default codec: values as text (like b'3.14' or b'True'), readable by any redis client. """
+
+    def encode(self, data: KEY_TYPE, type: KEY_TYPE_CLASS) -> bytes:
+        return _encode_to_redis(data, type)
+
+    def decode(self, raw_data: bytes, type: KEY_TYPE_CLASS) -> KEY_TYPE:
+        return _decode_from_redis(raw_data, type)
+
+
+class StructCodec(RedisCodec):
+    """ A compact codec: bool, int and float as fixed-width big-endian binary (1, 8 and 8 bytes).
+
+    Int values must fit in a signed 64 bits, str and bytes are stored as with the text codec.
+    """
+
+    structs_d = {bool: struct.Struct('>?'), int: struct.Struct('>q'), float: struct.Struct('>d')}
+    # accepted value types (as with text codec)
+    accept_d = {bool: (bool, int), int: (int,), float: (int, float)}
+
+    def encode(self, data: KEY_TYPE, type: KEY_TYPE_CLASS) -> bytes:
+        s = self.structs_d.get(type)
+        if s is None:
+            return _encode_to_redis(data, type)
+        if not isinstance(data, self.accept_d[type]):
+            raise TypeError
+        try:
+            return s.pack(data)
+        except struct.error:
+            raise TypeError
+
+    def decode(self, raw_data: bytes, type: KEY_TYPE_CLASS) -> KEY_TYPE:
+        s = self.structs_d.get(type)
+        if s is None:
+            return _decode_from_redis(raw_data, type)
+        try:
+            return s.unpack(raw_data)[0]
+        except struct.error:
+            raise TypeError
+
+
+class MsgpackCodec(RedisCodec):
+    """ A msgpack codec, also for compound values (type list or dict). Require the msgpack package. """
+
+    def __init__(self) -> None:
+        if msgpack is None:
+            raise ImportError('msgpack is required by MsgpackCodec')
+
+    def encode(self, data: Any, type: KEY_TYPE_CLASS) -> bytes:
+        if type is float and isinstance(data, int) and not isinstance(data, bool):
+            data = float(data)
+        if not isinstance(data, type) or (type is int and isinstance(data, bool)):
+            raise TypeError
+        try:
+            return msgpack.packb(data, use_bin_type=True)
+        except (OverflowError, TypeError, ValueError):
+            raise TypeError
+
+    def decode(self, raw_data: bytes, type: KEY_TYPE_CLASS) -> Any:
+        try:
+            data = msgpack.unpackb(raw_data, raw=False)
+        except (ValueError, msgpack.UnpackException):
+            raise TypeError
+        if not isinstance(data, type):
+            raise TypeError
+        return data
+
+
 class RedisDS(DataSource):
     pass
 
 
 class RedisPublish(RedisDS):
     class Message:
-        """ A message data container for publish with io thread queue. """
+        """ A message data container for publish with io thread queue.
+
+        A message superseded by a newer one on the same channel (with device publish_coalesce) is not sent:
+        its coalesced flag and send_evt are set with a delivery_count of 0.
+        """
 
         def __init__(self, redis_pub: "RedisPublish", message: bytes) -> None:
             # args
@@ -68,12 +163,15 @@ class RedisPublish(RedisDS):
             self.ttl = TTL(self.redis_pub.device.cancel_delay)
             self.send_evt = Event()
             self.delivery_count = 0
+            self.coalesced = False
 
-    def __init__(self, device: "RedisDevice", channel: Union[bytes, str], type: KEY_TYPE_CLASS) -> None:
+    def __init__(self, device: "RedisDevice", channel: Union[bytes, str], type: KEY_TYPE_CLASS,
+                 codec: Optional[RedisCodec] = None) -> None:
         # args
         self.device = device
         self.channel = _normalized_for_redis(channel)
         self.type = type
+        self.codec = device.codec if codec is None else codec
         # public
         self.last_message: Optional[RedisPublish.Message] = None
         self.io_error = False
@@ -113,7 +211,7 @@ class RedisPublish(RedisDS):
 
     def set(self, value: KEY_TYPE) -> None:
         try:
-            self._send_msg(_encode_to_redis(value, type=self.type))
+            self._send_msg(self.codec.encode(value, self.type))
         except TypeError:
             raise TypeError(f'unsupported type for value {self!r}')
 
@@ -122,12 +220,21 @@ class RedisPublish(RedisDS):
 
 
 class RedisSubscribe(RedisDS):
-    def __init__(self, device: "RedisDevice", channel: Union[bytes, str], type: KEY_TYPE_CLASS) -> None:
+    def __init__(self, device: "RedisDevice", channel: Union[bytes, str], type: KEY_TYPE_CLASS,
+                 pattern: bool = False, codec: Optional[RedisCodec] = None) -> None:
+        """ A data source to receive messages published on a channel.
+
+        With pattern, channel is a glob-style pattern (like "plant:*:alarm") and messages of every matching
+        channel are received (the name of the last one is in last_channel).
+        """
         # args
         self.device = device
         self.channel = _normalized_for_redis(channel)
         self.type = type
+        self.pattern = pattern
+        self.codec = device.codec if codec is None else codec
         # public
+        self.last_channel: Optional[bytes] = None
         self.value: Any = None
         self.io_error = False
         self.fmt_error = False
@@ -137,7 +244,8 @@ class RedisSubscribe(RedisDS):
         self.device.subscribe_thread.add_subscribe(self)
 
     def __repr__(self):
-        return f'RedisSubscribe(device={self.device!r}, channel={self.channel!r}, type={self.type.__name__})'
+        return f'RedisSubscribe(device={self.device!r}, channel={self.channel!r}, type={self.type.__name__}, ' \
+               f'pattern={self.pattern})'
 
     def add_tag(self, tag: Tag) -> None:
         # warn user of type mismatch between initial tag value and this datasource
@@ -165,12 +273,22 @@ class RedisGetKey(RedisDS):
             self.ttl = TTL(self.redis_key.device.cancel_delay)
 
     def __init__(self, device: "RedisDevice", name: Union[bytes, str], type: KEY_TYPE_CLASS,
-                 cyclic: bool = False) -> None:
+                 cyclic: bool = False, period: Optional[float] = None, notify: bool = False,
+                 codec: Optional[RedisCodec] = None) -> None:
+        """ A data source to read a redis key.
+
+        With notify, the key is read on redis keyspace notifications (server notify-keyspace-events must include
+        "K" and the classes of events of interest, like "K$gx"), a cyclic key is then only polled for
+        resynchronization every notify_resync_period of the device (unless period is set).
+        """
         # args
         self.device = device
         self.name = _normalized_for_redis(name)
         self.type = type
         self.cyclic = cyclic
+        self.notify = notify
+        self.period = device.notify_resync_period if notify and period is None else period
+        self.codec = device.codec if codec is None else codec
         # public
         self.is_sync_evt = Event()
         self.raw_value: Optional[bytes] = None
@@ -179,10 +297,17 @@ class RedisGetKey(RedisDS):
         self.fmt_error = False
         # reference this in thread I/O
         self.device.key_cyclic_thread.add_key(self)
+        if self.notify:
+            self.device.subscribe_thread.add_key_notify(self)
 
     def __repr__(self):
         return f'RedisGetKey(device={self.device!r}, name={self.name!r}, type={self.type.__name__})'
 
+    @property
+    def notify_channel(self) -> bytes:
+        """ The keyspace notifications channel of this key. """
+        return f'__keyspace@{self.device.db}__:'.encode() + self.name
+
     def add_tag(self, tag: Tag) -> None:
         # warn user of type mismatch between initial tag value and this datasource
         if not isinstance(tag.init_value, self.type):
@@ -201,19 +326,14 @@ class RedisGetKey(RedisDS):
         """ Try to sync key value with redis.
 
         Any pending execution will be canceled after the delay specified at device level in
-        cancel_delay (defaults to 5.0 seconds).
+        cancel_delay (defaults to 5.0 seconds). A request replaces the pending one of this key.
 
         Return True if the sync request is queued.
         """
-        # accept this request when device is actually connected or if the key-update-queue is empty
-        if self.device.connected or (self.device.key_sync_thread.sync_req_q.qsize() == 0):
-            # set an expiration stamp (avoid single-update-key thread process outdated request)
-            try:
-                self.device.key_sync_thread.sync_req_q.put_nowait(RedisGetKey.SyncReq(self))
-                self.is_sync_evt.clear()
-                return True
-            except queue.Full:
-                logger.warning(f'sync request key queue full: drop a get on key "{self.name}"')
+        # set an expiration stamp (avoid single-update-key thread process outdated request)
+        if self.device.key_sync_thread.add_req(RedisGetKey.SyncReq(self)):
+            return True
+        logger.warning(f'sync request key queue full: drop a get on key "{self.name}"')
         # error reporting
         return False
 
@@ -230,14 +350,17 @@ class RedisSetKey(RedisDS):
 
     def __init__(self, device: "RedisDevice", name: Union[bytes, str], type: KEY_TYPE_CLASS,
                  cyclic: bool = False, on_set: bool = False,
-                 ex: Optional[int] = None) -> None:
+                 ex: Optional[int] = None, period: Optional[float] = None,
+                 codec: Optional[RedisCodec] = None) -> None:
         # args
         self.device = device
         self.name = _normalized_for_redis(name)
         self.type = type
         self.cyclic = cyclic
+        self.period = period
         self.on_set = on_set
         self.ex = ex
+        self.codec = device.codec if codec is None else codec
         # public
         self.is_sync_evt = Event()
         self.raw_value: Optional[bytes] = None
@@ -263,7 +386,7 @@ class RedisSetKey(RedisDS):
         # check type
         try:
             # format raw for redis
-            self.raw_value = _encode_to_redis(value, type=self.type)
+            self.raw_value = self.codec.encode(value, self.type)
             # write query executed on set
             if self.on_set:
                 self.sync()
@@ -277,22 +400,208 @@ class RedisSetKey(RedisDS):
         """ Attempt immediate update of the key on redis db using the request key thread.
 
         Any pending execution will be canceled after the delay specified at device level in
-        cancel_delay (defaults to 5.0 seconds).
+        cancel_delay (defaults to 5.0 seconds). A request replaces the pending one of this key, so
+        only the last value set is written.
 
         Return True if the request is queued.
         """
-        # accept this request when device is actually connected or if the key-update-queue is empty
-        if self.device.connected or (self.device.key_sync_thread.sync_req_q.qsize() == 0):
-            try:
-                self.device.key_sync_thread.sync_req_q.put_nowait(RedisSetKey.SyncReq(self))
-                self.is_sync_evt.clear()
-                return True
-            except queue.Full:
-                logger.warning(f'sync request key queue full: drop a set on key "{self.name}"')
+        if self.device.key_sync_thread.add_req(RedisSetKey.SyncReq(self)):
+            return True
+        logger.warning(f'sync request key queue full: drop a set on key "{self.name}"')
         # error reporting
         return False
 
 
+class RedisHashGetField(RedisGetKey):
+    """ A data source to read a field of a redis hash (fields of the same hash are read with a single HMGET). """
+
+    def __init__(self, device: "RedisDevice", name: Union[bytes, str], field: Union[bytes, str],
+                 type: KEY_TYPE_CLASS, cyclic: bool = False, period: Optional[float] = None,
+                 notify: bool = False, codec: Optional[RedisCodec] = None) -> None:
+        # args
+        self.field = _normalized_for_redis(field)
+        super().__init__(device, name, type, cyclic=cyclic, period=period, notify=notify, codec=codec)
+
+    def __repr__(self):
+        return f'RedisHashGetField(device={self.device!r}, name={self.name!r}, field={self.field!r}, ' \
+               f'type={self.type.__name__})'
+
+
+class RedisHashSetField(RedisSetKey):
+    """ A data source to write a field of a redis hash (fields of the same hash are written with a single HSET). """
+
+    def __init__(self, device: "RedisDevice", name: Union[bytes, str], field: Union[bytes, str],
+                 type: KEY_TYPE_CLASS, cyclic: bool = False, on_set: bool = False,
+                 period: Optional[float] = None, codec: Optional[RedisCodec] = None) -> None:
+        # args
+        self.field = _normalized_for_redis(field)
+        super().__init__(device, name, type, cyclic=cyclic, on_set=on_set, period=period, codec=codec)
+
+    def __repr__(self):
+        return f'RedisHashSetField(device={self.device!r}, name={self.name!r}, field={self.field!r}, ' \
+               f'type={self.type.__name__})'
+
+
+class RedisStreamAppend(RedisDS):
+    def __init__(self, device: "RedisDevice", stream: Union[bytes, str], type: KEY_TYPE_CLASS,
+                 field: Union[bytes, str] = b'value', maxlen: Optional[int] = 10_000,
+                 codec: Optional[RedisCodec] = None) -> None:
+        """ A data source to append values to a redis stream (XADD with MAXLEN ~ trimming).
+
+        Unlike publish, values are kept in the stream until a reader gets them. Pending appends are
+        queued and sent by the I/O thread in pipelines: when this queue is full, set() drops the value
+        (and sets io_error) while append() can wait for a free slot.
+        """
+        # args
+        self.device = device
+        self.stream = _normalized_for_redis(stream)
+        self.type = type
+        self.field = _normalized_for_redis(field)
+        self.maxlen = maxlen
+        self.codec = device.codec if codec is None else codec
+        # public
+        self.last_id: Optional[bytes] = None
+        self.io_error = False
+
+    def __repr__(self):
+        return f'RedisStreamAppend(device={self.device!r}, stream={self.stream!r}, type={self.type.__name__}, ' \
+               f'field={self.field!r}, maxlen={self.maxlen})'
+
+    def add_tag(self, tag: Tag) -> None:
+        # warn user of type mismatch between initial tag value and this datasource
+        if not isinstance(tag.init_value, self.type):
+            raise TypeError(f'init_value must be a {self.type.__name__}')
+
+    def append(self, value: KEY_TYPE, timeout: Optional[float] = 0.0) -> bool:
+        """ Queue value for append to the stream, wait up to timeout (None for ever) if the queue is full.
+
+        Return True if the value is queued.
+        """
+        try:
+            raw_value = self.codec.encode(value, self.type)
+        except TypeError:
+            raise TypeError(f'unsupported type for value {self!r}')
+        try:
+            self.device.stream_append_thread.entry_q.put((self, raw_value), block=timeout != 0.0, timeout=timeout)
+            return True
+        except queue.Full:
+            logger.warning(f'stream queue full: drop an append on stream "{self.stream}"')
+            self.io_error = True
+            return False
+
+    def get(self) -> None:
+        return None
+
+    def set(self, value: KEY_TYPE) -> None:
+        self.append(value)
+
+    def error(self) -> bool:
+        return self.io_error
+
+
+class RedisStreamRead(RedisDS):
+    def __init__(self, device: "RedisDevice", stream: Union[bytes, str], type: KEY_TYPE_CLASS,
+                 field: Union[bytes, str] = b'value', group: Optional[Union[bytes, str]] = None,
+                 consumer: Optional[Union[bytes, str]] = None, start_id: Union[bytes, str] = b'$',
+                 count: int = 100, buffer_size: int = 10_000, codec: Optional[RedisCodec] = None) -> None:
+        """ A data source to read values of a redis stream (XREAD or XREADGROUP with a consumer group).
+
+        Entries are read by the I/O thread in batches of up to count entries and kept in a local buffer
+        for read(). The stream is not read while this buffer is full, so pending entries stay in redis.
+        The tag value is the last value received. With a group, entries are acknowledged once buffered.
+        """
+        # args
+        self.device = device
+        self.stream = _normalized_for_redis(stream)
+        self.type = type
+        self.field = _normalized_for_redis(field)
+        self.group = None if group is None else _normalized_for_redis(group)
+        self.consumer = None if consumer is None else _normalized_for_redis(consumer)
+        self.start_id = _normalized_for_redis(start_id)
+        self.count = count
+        self.buffer_size = buffer_size
+        self.codec = device.codec if codec is None else codec
+        # check args
+        if (self.group is None) != (self.consumer is None):
+            raise ValueError('group and consumer must be set together')
+        if self.count < 1:
+            raise ValueError('count must be at least 1')
+        # public
+        self.receive_evt = Event()
+        self.last_id: Optional[bytes] = None
+        self.value: Any = None
+        self.io_error = True
+        self.fmt_error = False
+        # private
+        self._entries_q: queue.Queue[Tuple[bytes, KEY_TYPE]] = queue.Queue(maxsize=self.buffer_size)
+        self._position_ok = False
+        # set the read position now to not miss entries appended after this call (or retry in I/O thread)
+        try:
+            self._init_position()
+        except redis.RedisError as e:
+            logger.warning(f'redis error: {e}')
+        # reference this in I/O thread
+        self.device._stream_read_thread(self.group, self.consumer).add_reader(self)
+
+    def __repr__(self):
+        return f'RedisStreamRead(device={self.device!r}, stream={self.stream!r}, type={self.type.__name__}, ' \
+               f'field={self.field!r}, group={self.group!r}, consumer={self.consumer!r})'
+
+    def _init_position(self) -> None:
+        if self.group is not None:
+            try:
+                self.device.redis_cli.xgroup_create(self.stream, self.group, id=self.start_id, mkstream=True)
+            except redis.ResponseError as e:
+                if not str(e).startswith('BUSYGROUP'):
+                    raise
+        elif self.start_id == b'$':
+            last_entry_l = self.device.redis_cli.xrevrange(self.stream, count=1)
+            self.start_id = last_entry_l[0][0] if last_entry_l else b'0-0'
+        self._position_ok = True
+
+    @property
+    def buffer_room(self) -> int:
+        return self.buffer_size - self._entries_q.qsize()
+
+    def add_tag(self, tag: Tag) -> None:
+        # warn user of type mismatch between initial tag value and this datasource
+        if type(tag.init_value) is not self.type:
+            raise TypeError(f'init_value must be a {self.type.__name__}')
+
+    def get(self) -> Optional[KEY_TYPE]:
+        return self.value
+
+    def set(self, value) -> None:
+        raise ValueError(f'cannot write read-only {self!r}')
+
+    def error(self) -> bool:
+        return self.io_error or self.fmt_error
+
+    def read(self, max_count: Optional[int] = None, timeout: Optional[float] = 0.0) -> List[Tuple[bytes, KEY_TYPE]]:
+        """ Pop buffered entries as a list of (id, value), wait up to timeout (None for ever) for the first one. """
+        entries_l: List[Tuple[bytes, KEY_TYPE]] = []
+        try:
+            entries_l.append(self._entries_q.get(block=timeout != 0.0, timeout=timeout))
+            while max_count is None or len(entries_l) < max_count:
+                entries_l.append(self._entries_q.get_nowait())
+        except queue.Empty:
+            pass
+        return entries_l
+
+    def _receive(self, entry_id: bytes, fields_d: Dict[bytes, bytes]) -> None:
+        self.last_id = entry_id
+        try:
+            value = self.codec.decode(fields_d[self.field], self.type)
+            self.fmt_error = False
+        except (KeyError, TypeError):
+            self.fmt_error = True
+            logger.warning(f'unable to decode entry {entry_id!r} of stream "{self.stream}"')
+            return
+        self.value = value
+        # the I/O thread only reads what fits in the buffer
+        self._entries_q.put_nowait((entry_id, value))
+
+
 class _KeyCyclicThread(Thread):
     """ This thread process every I/O for keys on redis DB. """
 
@@ -300,68 +609,117 @@ class _KeyCyclicThread(Thread):
         super().__init__(daemon=True)
         # args
         self.redis_device = redis_device
-        # private
-        self._key_d_lock = Lock()
-        self._key_d: WeakValueDictionary[int, Union[RedisGetKey, RedisSetKey]] = WeakValueDictionary()
-        self._key_d_pos = 0
+        # public
+        self.scheduler = CyclicScheduler(self.redis_device)
+        self.stats = LoopStats()
 
     def add_key(self, redis_key: Union[RedisGetKey, RedisSetKey]):
-        with self._key_d_lock:
-            self._key_d[self._key_d_pos] = redis_key
-            self._key_d_pos += 1
+        self.scheduler.add(redis_key)
 
     def run(self):
         # thread loop
         while True:
-            # prevent request dictionnary change during iteration
-            with self._key_d_lock:
-                cp_key_d = self._key_d.copy()
-            # iterate over all keys
-            for redis_key in cp_key_d.values():
-                if redis_key.cyclic:
-                    try:
-                        self.redis_device._get_key(redis_key)
-                        self.redis_device._set_key(redis_key)
-                    except redis.RedisError:
-                        redis_key.io_error = True
-            # set connected flag
+            t_start = time.monotonic()
+            # gather cyclic keys due now
+            due_keys_l = [k for k in self.scheduler.pop_due() if k.cyclic]
+            get_keys_l = [k for k in due_keys_l if isinstance(k, RedisGetKey)]
+            set_keys_l = [k for k in due_keys_l if isinstance(k, RedisSetKey)]
             try:
-                self._connected = self.redis_device.redis_cli.ping()
+                # process them by batches (one pipeline round-trip for the gets and one for the sets)
+                batch_size = self.redis_device.batch_size
+                for i in range(0, len(get_keys_l), batch_size):
+                    self.redis_device._get_keys(get_keys_l[i:i + batch_size])
+                for i in range(0, len(set_keys_l), batch_size):
+                    self.redis_device._set_keys(set_keys_l[i:i + batch_size])
+                # set connected flag (ping only an idle link)
+                if due_keys_l:
+                    self.redis_device._connected = True
+                else:
+                    self.redis_device._connected = self.redis_device.redis_cli.ping()
             except redis.RedisError as e:
-                self._connected = False
+                for redis_key in due_keys_l:
+                    redis_key.io_error = True
+                self.redis_device._connected = False
                 logger.warning(f'redis error: {e}')
                 time.sleep(1.0)
+            # update stats
+            self.stats.add(time.monotonic() - t_start)
+            # wait for the next deadline
+            time.sleep(self.scheduler.wait_time())
 
 
 class _KeySyncReqThread(Thread):
-    """ This thread executes all keys get/set from the sync request queue. """
+    """ This thread executes all keys get/set sync requests.
 
-    def __init__(self, redis_device: "RedisDevice") -> None:
+    There is at most one pending request by key (a new one replaces it), every pending request is
+    processed at once in pipelined batches.
+    """
+
+    def __init__(self, redis_device: "RedisDevice", max_pending: int = 255) -> None:
         super().__init__(daemon=True)
         # args
         self.redis_device = redis_device
+        self.max_pending = max_pending
         # public
-        self.sync_req_q: queue.Queue[Union[RedisGetKey.SyncReq, RedisSetKey.SyncReq]] = queue.Queue(maxsize=255)
+        self.executed_count = 0
+        self.coalesced_count = 0
+        self.expired_count = 0
         # private
-        self._redis_cli = self.redis_device.redis_cli
+        self._pending_cond = Condition()
+        self._pending_d: Dict[Union[RedisGetKey, RedisSetKey], Union[RedisGetKey.SyncReq, RedisSetKey.SyncReq]] = {}
+
+    def add_req(self, sync_req: Union[RedisGetKey.SyncReq, RedisSetKey.SyncReq]) -> bool:
+        """ Queue a sync request, replace the pending one of the same key. Return False if it's rejected. """
+        redis_key = sync_req.redis_key
+        with self._pending_cond:
+            if redis_key in self._pending_d:
+                self.coalesced_count += 1
+            # accept a new key when device is actually connected or if there is no pending request
+            elif len(self._pending_d) >= self.max_pending or \
+                    (self._pending_d and not self.redis_device.connected):
+                return False
+            redis_key.is_sync_evt.clear()
+            self._pending_d[redis_key] = sync_req
+            self._pending_cond.notify()
+        return True
 
     def run(self):
         while True:
-            # wait next request from queue
-            sync_req = self.sync_req_q.get()
-            # process it (reject an outdated request)
-            if sync_req.ttl.is_not_expired:
+            # wait for requests, then take every pending one
+            with self._pending_cond:
+                while not self._pending_d:
+                    self._pending_cond.wait()
+                sync_req_l = list(self._pending_d.values())
+                self._pending_d.clear()
+            # reject outdated requests
+            keys_l: List[Union[RedisGetKey, RedisSetKey]] = []
+            for sync_req in sync_req_l:
+                if sync_req.ttl.is_not_expired:
+                    keys_l.append(sync_req.redis_key)
+                else:
+                    sync_req.redis_key.io_error = True
+                    self.expired_count += 1
+            # process them in batches (get and set of a batch are each pipelined)
+            batch_size = self.redis_device.batch_size
+            for i in range(0, len(keys_l), batch_size):
+                batch_l = keys_l[i:i + batch_size]
                 try:
-                    self.redis_device._get_key(sync_req.redis_key)
-                    self.redis_device._set_key(sync_req.redis_key)
+                    get_l = [redis_key for redis_key in batch_l if isinstance(redis_key, RedisGetKey)]
+                    set_l = [redis_key for redis_key in batch_l if isinstance(redis_key, RedisSetKey)]
+                    if get_l:
+                        self.redis_device._get_keys(get_l)
+                    if set_l:
+                        self.redis_device._set_keys(set_l)
                 except redis.RedisError as e:
-                    sync_req.redis_key.io_error = True
-            else:
-                sync_req.redis_key.io_error = True
-            # mark sync as done
-            sync_req.redis_key.is_sync_evt.set()
-            # mark queue task as done
-            self.sync_req_q.task_done()
+                    for redis_key in batch_l:
+                        redis_key.io_error = True
+                    logger.warning(f'redis error: {e}')
+            self.executed_count += len(keys_l)
+            # mark sync as done (unless a new request of the key is pending)
+            with self._pending_cond:
+                for sync_req in sync_req_l:
+                    if sync_req.redis_key not in self._pending_d:
+                        sync_req.redis_key.is_sync_evt.set()
 
 
 class _PublishThread(Thread):
@@ -378,24 +736,307 @@ class _PublishThread(Thread):
 
     def run(self):
         while True:
-            # get next publish request from publish io thread queue
-            msg = self.msg_q.get()
-            # publish it on redis
-            if not msg.ttl.is_expired:
+            # wait next publish request from publish io thread queue, then drain every pending one
+            msg_l = [self.msg_q.get()]
+            while True:
+                try:
+                    msg_l.append(self.msg_q.get_nowait())
+                except queue.Empty:
+                    break
+            # skip outdated messages
+            send_l = [msg for msg in msg_l if not msg.ttl.is_expired]
+            # coalesce: only the last message of each channel is sent
+            if self.redis_device.publish_coalesce:
+                last_msg_d = {msg.redis_pub.channel: msg for msg in send_l}
+                for msg in send_l:
+                    if last_msg_d[msg.redis_pub.channel] is not msg:
+                        msg.coalesced = True
+                        msg.send_evt.set()
+                send_l = [msg for msg in send_l if not msg.coalesced]
+            # publish them on redis (in a single pipeline round-trip)
+            if send_l:
+                try:
+                    pipe = self._redis_cli.pipeline(transaction=False)
+                    for msg in send_l:
+                        pipe.publish(msg.redis_pub.channel, msg.message)
+                    for msg, pub_ret in zip(send_l, pipe.execute(raise_on_error=False)):
+                        if isinstance(pub_ret, Exception):
+                            msg.redis_pub.io_error = True
+                            logger.warning(f'redis error: {pub_ret}')
+                        else:
+                            msg.delivery_count = pub_ret
+                            msg.redis_pub.io_error = False
+                            msg.send_evt.set()
+                except redis.RedisError as e:
+                    for msg in send_l:
+                        msg.redis_pub.io_error = True
+                    logger.warning(f'redis error: {e}')
+                    time.sleep(1.0)
+            # mark as done
+            for _ in msg_l:
+                self.msg_q.task_done()
+
+
+class _StreamAppendThread(Thread):
+    """ This thread process every append on redis streams. """
+
+    def __init__(self, redis_device: "RedisDevice") -> None:
+        super().__init__(daemon=True)
+        # args
+        self.redis_device = redis_device
+        # public
+        self.entry_q: queue.Queue[Tuple[RedisStreamAppend, bytes]] = \
+            queue.Queue(maxsize=self.redis_device.stream_queue_size)
+        # private
+        self._redis_cli = self.redis_device.redis_cli
+
+    def run(self):
+        while True:
+            # wait next entry, then drain up to a batch of pending ones
+            entry_l = [self.entry_q.get()]
+            while len(entry_l) < self.redis_device.batch_size:
                 try:
-                    msg.delivery_count = self._redis_cli.publish(msg.redis_pub.channel, msg.message)
-                    msg.redis_pub.io_error = False
-                    msg.send_evt.set()
+                    entry_l.append(self.entry_q.get_nowait())
+                except queue.Empty:
+                    break
+            # append them on redis (in a single pipeline round-trip), retry the batch on connection error
+            while True:
+                try:
+                    pipe = self._redis_cli.pipeline(transaction=False)
+                    for stream_append, raw_value in entry_l:
+                        pipe.xadd(stream_append.stream, {stream_append.field: raw_value},
+                                  maxlen=stream_append.maxlen, approximate=True)
+                    for (stream_append, _), xadd_ret in zip(entry_l, pipe.execute(raise_on_error=False)):
+                        if isinstance(xadd_ret, Exception):
+                            stream_append.io_error = True
+                            logger.warning(f'redis error: {xadd_ret}')
+                        else:
+                            stream_append.last_id = xadd_ret
+                            stream_append.io_error = False
+                    break
                 except redis.RedisError as e:
-                    msg.redis_pub.io_error = True
+                    for stream_append, _ in entry_l:
+                        stream_append.io_error = True
                     logger.warning(f'redis error: {e}')
                     time.sleep(1.0)
             # mark as done
-            self.msg_q.task_done()
+            for _ in entry_l:
+                self.entry_q.task_done()
+
+
+class _StreamReadThread(Thread):
+    """ This thread reads redis streams for every reader without a group or of the same group and consumer. """
+
+    def __init__(self, redis_device: "RedisDevice", group: Optional[bytes], consumer: Optional[bytes]) -> None:
+        super().__init__(daemon=True)
+        # args
+        self.redis_device = redis_device
+        self.group = group
+        self.consumer = consumer
+        # private
+        _readers: WeakSet[RedisStreamRead] = WeakSet()
+        self._safe_readers = SafeObject(_readers)
+        self._redis_cli = self.redis_device.redis_cli
+        # a blocking read must end before the socket timeout
+        self._block_ms = max(int(self.redis_device.timeout * 500), 1)
+
+    def add_reader(self, stream_read: RedisStreamRead) -> None:
+        with self._safe_readers as readers:
+            readers.add(stream_read)
+
+    @staticmethod
+    def _id_key(entry_id: bytes) -> Tuple[int, int]:
+        ms, _, seq = entry_id.partition(b'-')
+        return int(ms), int(seq or 0)
+
+    def run(self):
+        while True:
+            # group readers by stream, skip streams with a full reader buffer or without a read position
+            with self._safe_readers as readers:
+                readers_l = [stream_read for stream_read in readers if stream_read._position_ok]
+                init_l = [stream_read for stream_read in readers if not stream_read._position_ok]
+            try:
+                for stream_read in init_l:
+                    stream_read._init_position()
+                    readers_l.append(stream_read)
+            except redis.RedisError as e:
+                logger.warning(f'redis error: {e}')
+            readers_d: Dict[bytes, List[RedisStreamRead]] = {}
+            for stream_read in readers_l:
+                readers_d.setdefault(stream_read.stream, []).append(stream_read)
+            count = min([stream_read.count for stream_read in readers_l], default=1)
+            streams_d: Dict[bytes, bytes] = {}
+            for stream, s_readers_l in readers_d.items():
+                room = min(stream_read.buffer_room for stream_read in s_readers_l)
+                if room > 0:
+                    count = min(count, room)
+                    if self.group is None:
+                        # read from the oldest position of stream readers
+                        streams_d[stream] = min((stream_read.last_id or stream_read.start_id
+                                                 for stream_read in s_readers_l), key=self._id_key)
+                    else:
+                        streams_d[stream] = b'>'
+            if not streams_d:
+                time.sleep(self._block_ms / 1000)
+                continue
+            # read a batch of entries for every stream in a single (blocking) command
+            try:
+                if self.group is None:
+                    resp_l = self._redis_cli.xread(streams_d, count=count, block=self._block_ms)
+                else:
+                    resp_l = self._redis_cli.xreadgroup(self.group, self.consumer, streams_d,
+                                                        count=count, block=self._block_ms)
+                for stream in streams_d:
+                    for stream_read in readers_d[stream]:
+                        stream_read.io_error = False
+                for stream, entries_l in resp_l or []:
+                    for stream_read in readers_d[stream]:
+                        # without a group, a reader only gets entries after its own position
+                        from_key = (-1, -1) if self.group else self._id_key(stream_read.last_id or stream_read.start_id)
+                        for entry_id, fields_d in entries_l:
+                            if self._id_key(entry_id) > from_key:
+                                stream_read._receive(entry_id, fields_d)
+                    if entries_l:
+                        if self.group is not None:
+                            self._redis_cli.xack(stream, self.group, *[entry_id for entry_id, _ in entries_l])
+                        for stream_read in readers_d[stream]:
+                            stream_read.receive_evt.set()
+            except redis.RedisError as e:
+                for stream_read in readers_l:
+                    stream_read.io_error = True
+                logger.warning(f'redis error: {e}')
+                time.sleep(1.0)
+
+
+def _glob_prefix(pattern: bytes) -> bytes:
+    """ Return the literal prefix of a glob-style pattern. """
+    for i, char in enumerate(pattern):
+        if char in b'*?[\\':
+            return pattern[:i]
+    return pattern
+
+
+def _glob_to_regex(pattern: bytes) -> "re.Pattern[bytes]":
+    """ Compile a glob-style pattern (as redis PSUBSCRIBE does: *, ?, [abc], [^a], [a-z] and escape with \\). """
+    regex = b''
+    i = 0
+    while i < len(pattern):
+        char = pattern[i:i + 1]
+        if char == b'*':
+            regex += b'.*'
+        elif char == b'?':
+            regex += b'.'
+        elif char == b'\\' and i + 1 < len(pattern):
+            i += 1
+            regex += re.escape(pattern[i:i + 1])
+        elif char == b'[' and pattern.find(b']', i + 2) != -1:
+            end = pattern.find(b']', i + 2)
+            regex += b'[' + pattern[i + 1:end].replace(b'\\', b'\\\\') + b']'
+            i = end
+        else:
+            regex += re.escape(char)
+        i += 1
+    return re.compile(regex, re.DOTALL)
+
+
+class _PatternTrie:
+    """ A trie of glob-style patterns keyed by their literal prefix.
+
+    Matching a channel walks the trie along the channel bytes: only patterns with a prefix of the channel
+    are checked, and "prefix*" patterns match without any regex.
+    """
+
+    class Node:
+        def __init__(self) -> None:
+            self.children: Dict[int, _PatternTrie.Node] = {}
+            self.patterns_d: Dict[bytes, Optional[re.Pattern]] = {}
+
+    def __init__(self) -> None:
+        self.root = _PatternTrie.Node()
+
+    def _node(self, prefix: bytes, create: bool = False) -> Optional["_PatternTrie.Node"]:
+        node = self.root
+        for char in prefix:
+            if char not in node.children:
+                if not create:
+                    return None
+                node.children[char] = _PatternTrie.Node()
+            node = node.children[char]
+        return node
+
+    def add(self, pattern: bytes) -> None:
+        prefix = _glob_prefix(pattern)
+        node = self._node(prefix, create=True)
+        assert node
+        node.patterns_d[pattern] = None if pattern[len(prefix):] == b'*' else _glob_to_regex(pattern)
+
+    def remove(self, pattern: bytes) -> None:
+        node = self._node(_glob_prefix(pattern))
+        if node:
+            node.patterns_d.pop(pattern, None)
+
+    def match(self, channel: bytes) -> List[bytes]:
+        """ Return every pattern that matches channel. """
+        matches_l = []
+        node: Optional[_PatternTrie.Node] = self.root
+        for depth in range(len(channel) + 1):
+            assert node
+            for pattern, regex in node.patterns_d.items():
+                if regex is None or regex.fullmatch(channel):
+                    matches_l.append(pattern)
+            if depth == len(channel):
+                break
+            node = node.children.get(channel[depth])
+            if node is None:
+                break
+        return matches_l
+
+
+class _SubscribeIndex:
+    """ Index RedisSubscribe by exact channel and by pattern (any number of subscribers for each). """
+
+    def __init__(self) -> None:
+        self.channels_d: Dict[bytes, WeakSet[RedisSubscribe]] = {}
+        self.patterns_d: Dict[bytes, WeakSet[RedisSubscribe]] = {}
+        self._trie = _PatternTrie()
+
+    def add(self, redis_subscribe: RedisSubscribe) -> None:
+        if redis_subscribe.pattern:
+            if redis_subscribe.channel not in self.patterns_d:
+                self.patterns_d[redis_subscribe.channel] = WeakSet()
+                self._trie.add(redis_subscribe.channel)
+            self.patterns_d[redis_subscribe.channel].add(redis_subscribe)
+        else:
+            self.channels_d.setdefault(redis_subscribe.channel, WeakSet()).add(redis_subscribe)
+
+    def purge(self) -> None:
+        """ Remove channels and patterns without subscribers (removed by the garbage collector). """
+        for channel in [c for c, subs in self.channels_d.items() if not subs]:
+            del self.channels_d[channel]
+        for pattern in [p for p, subs in self.patterns_d.items() if not subs]:
+            del self.patterns_d[pattern]
+            self._trie.remove(pattern)
+
+    def match_patterns(self, channel: bytes) -> List[bytes]:
+        return self._trie.match(channel)
+
+    def subscribers(self, channel: bytes) -> List[RedisSubscribe]:
+        """ Return every subscriber of channel (on this exact channel or on a matching pattern). """
+        subs_l = list(self.channels_d.get(channel, ()))
+        for pattern in self.match_patterns(channel):
+            subs_l.extend(self.patterns_d[pattern])
+        return subs_l
+
+    def all(self) -> List[RedisSubscribe]:
+        return [sub for subs in (*self.channels_d.values(), *self.patterns_d.values()) for sub in subs]
 
 
 class _SubscribeThread(Thread):
-    """ This thread process every I/O for subscribe on redis DB. """
+    """ This thread process every I/O for subscribe on redis DB.
+
+    It waits on the pubsub socket and on a wake-up socket together: subscribe changes apply immediately and
+    every available message is processed on each wake-up.
+    """
 
     def __init__(self, redis_device: "RedisDevice") -> None:
         super().__init__(daemon=True)
@@ -403,14 +1044,54 @@ class _SubscribeThread(Thread):
         self.redis_device = redis_device
         # private
         self._reload_evt = Event()
-        _subscribes_d: WeakValueDictionary[bytes, RedisSubscribe] = WeakValueDictionary()
-        self._safe_subs_d = SafeObject(_subscribes_d)
+        self._safe_index = SafeObject(_SubscribeIndex())
+        _notify_keys_d: Dict[bytes, WeakSet[RedisGetKey]] = {}
+        self._safe_notify_keys_d = SafeObject(_notify_keys_d)
+        self._resync_notify_keys = False
         self._pubsub = self.redis_device.redis_cli.pubsub()
+        self._wake_rx, self._wake_tx = socket.socketpair()
+        self._wake_rx.setblocking(False)
+        self._wake_tx.setblocking(False)
 
     def add_subscribe(self, redis_subscribe: RedisSubscribe):
-        with self._safe_subs_d as subs_d:
-            subs_d[redis_subscribe.channel] = redis_subscribe
+        with self._safe_index as index:
+            index.add(redis_subscribe)
+        self._reload_evt.set()
+        self.wake_up()
+
+    def add_key_notify(self, redis_key: RedisGetKey):
+        with self._safe_notify_keys_d as notify_keys_d:
+            notify_keys_d.setdefault(redis_key.notify_channel, WeakSet()).add(redis_key)
         self._reload_evt.set()
+        self.wake_up()
+
+    def wake_up(self) -> None:
+        """ Interrupt the wait of thread I/O. """
+        try:
+            self._wake_tx.send(b'\x00')
+        except BlockingIOError:
+            # wake-up socket is full of pending wake-ups
+            pass
+
+    def _wait_io(self, timeout: float) -> None:
+        """ Wait for data on the pubsub socket or for a wake-up. """
+        rlist = [self._wake_rx]
+        # the pubsub socket is private to redis-py connection (not set before the first subscribe)
+        pubsub_sock = getattr(self._pubsub.connection, '_sock', None)
+        if self._pubsub.subscribed and pubsub_sock is not None:
+            rlist.append(pubsub_sock)
+        select.select(rlist, [], [], timeout)
+        # clear wake-up socket
+        try:
+            while self._wake_rx.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _process_all_pending_msg(self) -> None:
+        # messages may be buffered by redis-py: process them until connection is clear
+        while self._pubsub.subscribed and self._pubsub.connection and self._pubsub.connection.can_read(timeout=0):
+            self._process_pending_msg()
 
     def _do_subscribe(self, channel: bytes) -> None:
         # debug
@@ -418,11 +1099,14 @@ class _SubscribeThread(Thread):
         # send subscribe to redis server
         self._pubsub.subscribe(channel)
         # notify RedisSubscribe
-        try:
-            with self._safe_subs_d as subs_d:
-                subs_d[channel].subscribe_evt.set()
-        except KeyError:
-            pass
+        with self._safe_index as index:
+            for redis_subscribe in index.channels_d.get(channel, ()):
+                redis_subscribe.subscribe_evt.set()
+        # resync notified keys (they may have changed before this subscribe)
+        with self._safe_notify_keys_d as notify_keys_d:
+            redis_keys_l = list(notify_keys_d.get(channel, ()))
+        for redis_key in redis_keys_l:
+            redis_key.sync()
 
     def _do_unsubscribe(self, channel: bytes) -> None:
         # debug
@@ -430,70 +1114,148 @@ class _SubscribeThread(Thread):
         # send unsubscribe to redis server
         self._pubsub.unsubscribe(channel)
 
-    def _process_pending_msg(self, wait_s: float = 0.0) -> None:
+    def _do_psubscribe(self, pattern: bytes) -> None:
+        # debug
+        logger.debug(f'psubscribe to {pattern}')
+        # send psubscribe to redis server
+        self._pubsub.psubscribe(pattern)
+        # notify RedisSubscribe of this pattern (channels covered by it are notified at end of reload)
+        with self._safe_index as index:
+            for redis_subscribe in index.patterns_d.get(pattern, ()):
+                redis_subscribe.subscribe_evt.set()
+
+    def _do_punsubscribe(self, pattern: bytes) -> None:
+        # debug
+        logger.debug(f'punsubscribe from {pattern}')
+        # send punsubscribe to redis server
+        self._pubsub.punsubscribe(pattern)
+
+    def _process_pending_msg(self) -> None:
         # get message from inbox
-        msg_d = self._pubsub.get_message(timeout=wait_s)
+        msg_d = self._pubsub.get_message(timeout=0.0)
         # skip when inbox is clear
         if not msg_d:
             return
         # process new message
-        if msg_d['type'] == 'message':
+        if msg_d['type'] in ('message', 'pmessage'):
             # debug
             logger.debug(f'rx pub message: {msg_d}')
-            # update RedisSubcribe with new rx data
-            try:
-                with self._safe_subs_d as subs_d:
-                    redis_subscribe = subs_d[msg_d['channel']]
+            channel = msg_d['channel']
+            # a keyspace notification: the payload is the name of the event
+            if msg_d['type'] == 'message':
+                with self._safe_notify_keys_d as notify_keys_d:
+                    redis_keys_l = list(notify_keys_d.get(channel, ()))
+                if redis_keys_l:
+                    for redis_key in redis_keys_l:
+                        if msg_d['data'] in (b'del', b'expired', b'evicted'):
+                            # key removed: no need to read it
+                            self.redis_device._update_get_key(redis_key, None)
+                        else:
+                            redis_key.sync()
+                    return
+            with self._safe_index as index:
+                # redis sends a message for each matching subscription: to dispatch a published message once,
+                # only the one received through the first matching server pattern is kept (if any)
+                patterns_l = sorted(p for p in index.match_patterns(channel) if p in self._pubsub.patterns)
+                first_pattern = patterns_l[0] if patterns_l else None
+                if msg_d['type'] == 'message' and first_pattern is not None:
+                    return
+                if msg_d['type'] == 'pmessage' and msg_d['pattern'] != first_pattern:
+                    return
+                subs_l = index.subscribers(channel)
+            # update every RedisSubcribe of this channel with new rx data
+            for redis_subscribe in subs_l:
+                redis_subscribe.last_channel = channel
                 redis_subscribe.io_error = False
-                redis_subscribe.receive_evt.set()
                 # decode payload
                 try:
-                    redis_subscribe.value = _decode_from_redis(msg_d['data'], type=redis_subscribe.type)
+                    redis_subscribe.value = redis_subscribe.codec.decode(msg_d['data'], redis_subscribe.type)
                     redis_subscribe.fmt_error = False
                 except TypeError:
                     redis_subscribe.fmt_error = True
-            except KeyError:
-                pass
+                redis_subscribe.receive_evt.set()
 
     def run(self):
-        # init thread var(s)
-        want_channels_s: Set[bytes] = set()
         # thread loop
         while True:
-            #  thread will block here until a first (or another one) subscribe is set
-            if self._reload_evt.wait():
-                # reset reload event
-                self._reload_evt.clear()
-                # do a thread safe copy of wanted channels
-                with self._safe_subs_d as subs_d:
-                    want_channels_s = set(subs_d.keys())
             # redis I/O jobs (on redis error: restart here)
-            while not self._reload_evt.is_set():
-                try:
+            try:
+                # apply subscribe changes
+                if self._reload_evt.is_set():
+                    # reset reload event
+                    self._reload_evt.clear()
+                    # do a thread safe copy of wanted patterns and channels (skip channels covered by a pattern)
+                    with self._safe_index as index:
+                        index.purge()
+                        want_patterns_s = set(index.patterns_d.keys())
+                        want_channels_s = {c for c in index.channels_d.keys() if not index.match_patterns(c)}
+                    with self._safe_notify_keys_d as notify_keys_d:
+                        for channel in [c for c, redis_keys in notify_keys_d.items() if not redis_keys]:
+                            del notify_keys_d[channel]
+                        want_channels_s.update(notify_keys_d.keys())
                     # subscribe/unsubscribe
+                    sub_patterns_s = set(self._pubsub.patterns)
+                    for pattern in want_patterns_s.difference(sub_patterns_s):
+                        self._do_psubscribe(pattern)
+                    for pattern in sub_patterns_s.difference(want_patterns_s):
+                        self._do_punsubscribe(pattern)
                     sub_channels_s = set(self._pubsub.channels)
                     for channel in want_channels_s.difference(sub_channels_s):
                         self._do_subscribe(channel)
                     for channel in sub_channels_s.difference(want_channels_s):
                         self._do_unsubscribe(channel)
-                    # process all pending messages (exit on reload event)
-                    while not self._reload_evt.is_set():
-                        self._process_pending_msg(wait_s=0.2)
-                except redis.RedisError as e:
-                    # set error flags of all RedisSubscribe
-                    with self._safe_subs_d as subs_d:
-                        for redis_subscribe in subs_d.values():
-                            redis_subscribe.io_error = True
-                    # warn user
-                    logger.warning(f'redis error: {e}')
-                    # wait before next db try
-                    time.sleep(1.0)
+                    # notify RedisSubscribe of channels covered by an active pattern (including ones added after it)
+                    with self._safe_index as index:
+                        for channel, subs in index.channels_d.items():
+                            if any(p in self._pubsub.patterns for p in index.match_patterns(channel)):
+                                for redis_subscribe in subs:
+                                    redis_subscribe.subscribe_evt.set()
+                # wait for messages or for a wake-up, then process all pending messages
+                self._wait_io(timeout=1.0)
+                self._process_all_pending_msg()
+                # connection is back: notified keys may have changed during the outage
+                if self._resync_notify_keys:
+                    self._resync_notify_keys = False
+                    with self._safe_notify_keys_d as notify_keys_d:
+                        redis_keys_l = [k for redis_keys in notify_keys_d.values() for k in redis_keys]
+                    for redis_key in redis_keys_l:
+                        redis_key.sync()
+            except redis.RedisError as e:
+                # set error flags of all RedisSubscribe and notified keys
+                with self._safe_index as index:
+                    for redis_subscribe in index.all():
+                        redis_subscribe.io_error = True
+                with self._safe_notify_keys_d as notify_keys_d:
+                    for redis_keys in notify_keys_d.values():
+                        for redis_key in redis_keys:
+                            redis_key.io_error = True
+                self._resync_notify_keys = True
+                # warn user
+                logger.warning(f'redis error: {e}')
+                # drop the connection: redis-py opens a new one (and subscribes again) on next use
+                if self._pubsub.connection:
+                    self._pubsub.connection.disconnect()
+                # wait before next db try, then apply subscriptions again
+                time.sleep(1.0)
+                self._reload_evt.set()
 
 
 class RedisDevice(Device):
+    # shared devices registry: the I/O device of each (host, port, db) target
+    _shared_io_d: Dict[Tuple[str, int, int], "RedisDevice"] = {}
+    _shared_io_lock = Lock()
+
     def __init__(self, host: str = 'localhost', port: int = 6379, db: int = 0,
                  refresh: float = 1.0, cancel_delay=5.0, timeout: float = 1.0,
-                 client_adv_args: Optional[dict] = None):
+                 client_adv_args: Optional[dict] = None, batch_size: int = 500, publish_coalesce: bool = False,
+                 notify_resync_period: float = 60.0, stream_queue_size: int = 10_000,
+                 codec: Optional[RedisCodec] = None, shared: bool = False):
+        """ A redis server device.
+
+        With shared, every shared device of the same (host, port, db) use the redis client (and its connection
+        pool) and the I/O threads of the first one: client args (timeout, client_adv_args) and I/O threads args
+        (batch_size, publish_coalesce, stream_queue_size) of this first device apply to all of them.
+        """
         super().__init__()
         # args
         self.host = host
@@ -503,8 +1265,30 @@ class RedisDevice(Device):
         self.cancel_delay = cancel_delay
         self.timeout = timeout
         self.client_adv_args = client_adv_args
+        self.batch_size = batch_size
+        self.publish_coalesce = publish_coalesce
+        self.notify_resync_period = notify_resync_period
+        self.stream_queue_size = stream_queue_size
+        self.codec = TextCodec() if codec is None else codec
+        self.shared = shared
         # private
         self._connected = False
+        self._io_dev = self
+        # start I/O or reuse the one of the shared device of this target
+        if self.shared:
+            with RedisDevice._shared_io_lock:
+                io_dev = RedisDevice._shared_io_d.get((self.host, self.port, self.db))
+                if io_dev is None:
+                    self._start_io()
+                    RedisDevice._shared_io_d[(self.host, self.port, self.db)] = self
+                else:
+                    self._share_io(io_dev)
+        else:
+            self._start_io()
+
+    def _start_io(self) -> None:
+        _stream_read_threads_d: Dict[Tuple[Optional[bytes], Optional[bytes]], _StreamReadThread] = {}
+        self._safe_stream_read_threads_d = SafeObject(_stream_read_threads_d)
         # redis client
         args_d = {} if self.client_adv_args is None else self.client_adv_args
         self.redis_cli = redis.Redis(host=self.host, port=self.port, db=self.db,
@@ -523,6 +1307,19 @@ class RedisDevice(Device):
         # subscribe I/O
         self.subscribe_thread = _SubscribeThread(self)
         self.subscribe_thread.start()
+        # streams I/O (read threads start with their first reader)
+        self.stream_append_thread = _StreamAppendThread(self)
+        self.stream_append_thread.start()
+
+    def _share_io(self, io_dev: "RedisDevice") -> None:
+        self._io_dev = io_dev
+        self._safe_stream_read_threads_d = io_dev._safe_stream_read_threads_d
+        self.redis_cli = io_dev.redis_cli
+        self.key_cyclic_thread = io_dev.key_cyclic_thread
+        self.key_sync_thread = io_dev.key_sync_thread
+        self.publish_thread = io_dev.publish_thread
+        self.subscribe_thread = io_dev.subscribe_thread
+        self.stream_append_thread = io_dev.stream_append_thread
 
     def __repr__(self):
         return f'RedisDevice(host={self.host!r}, port={self.port}, db={self.db}, refresh={self.refresh:.1f}, ' \
@@ -530,34 +1327,93 @@ class RedisDevice(Device):
 
     @property
     def connected(self):
-        return self._connected
+        return self._io_dev._connected
 
-    def _get_key(self, redis_key: Union[RedisGetKey, RedisSetKey]) -> None:
-        # skip other keys
-        if not isinstance(redis_key, RedisGetKey):
-            return
-        # redis I/O
-        redis_key.raw_value = self.redis_cli.get(redis_key.name)
+    @property
+    def sync_stats(self) -> dict:
+        """ Counters of keys sync requests (shared by devices sharing I/O). """
+        return dict(executed=self.key_sync_thread.executed_count, coalesced=self.key_sync_thread.coalesced_count,
+                    expired=self.key_sync_thread.expired_count)
+
+    @property
+    def cyclic_stats(self) -> dict:
+        """ Timing statistics of the keys cyclic loop (durations in seconds). """
+        return dict(**self.key_cyclic_thread.stats.as_dict(),
+                    missed_deadlines=self.key_cyclic_thread.scheduler.missed_count)
+
+    def _stream_read_thread(self, group: Optional[bytes], consumer: Optional[bytes]) -> _StreamReadThread:
+        """ Return the stream read thread of this group and consumer (start it if need). """
+        with self._safe_stream_read_threads_d as threads_d:
+            if (group, consumer) not in threads_d:
+                threads_d[(group, consumer)] = _StreamReadThread(self._io_dev, group, consumer)
+                threads_d[(group, consumer)].start()
+            return threads_d[(group, consumer)]
+
+    def _get_keys(self, redis_keys_l: List[RedisGetKey]) -> None:
+        # a single MGET for all keys and one HMGET for each hash
+        keys_l = [redis_key for redis_key in redis_keys_l if not isinstance(redis_key, RedisHashGetField)]
+        fields_d: Dict[bytes, List[RedisHashGetField]] = {}
+        for redis_key in redis_keys_l:
+            if isinstance(redis_key, RedisHashGetField):
+                fields_d.setdefault(redis_key.name, []).append(redis_key)
+        groups_l: List[List[RedisGetKey]] = [keys_l] if keys_l else []
+        groups_l.extend(fields_d.values())
+        # redis I/O (all commands in a single pipeline round-trip)
+        pipe = self.redis_cli.pipeline(transaction=False)
+        for group_l in groups_l:
+            if isinstance(group_l[0], RedisHashGetField):
+                pipe.hmget(group_l[0].name, [redis_field.field for redis_field in group_l])
+            else:
+                pipe.mget([redis_key.name for redis_key in group_l])
+        for group_l, raw_values_l in zip(groups_l, pipe.execute(raise_on_error=False)):
+            if isinstance(raw_values_l, Exception):
+                logger.warning(f'redis error: {raw_values_l}')
+                raw_values_l = [None] * len(group_l)
+            for redis_key, raw_value in zip(group_l, raw_values_l):
+                self._update_get_key(redis_key, raw_value)
+
+    def _update_get_key(self, redis_key: RedisGetKey, raw_value: Optional[bytes]) -> None:
+        redis_key.raw_value = raw_value
         redis_key.io_error = redis_key.raw_value is None
         # debug
         logger.debug(f'get key {redis_key.name}')
         # decode RAW value
         if redis_key.raw_value is not None:
             try:
-                redis_key.value = _decode_from_redis(redis_key.raw_value, redis_key.type)
+                redis_key.value = redis_key.codec.decode(redis_key.raw_value, redis_key.type)
                 redis_key.fmt_error = False
             except TypeError:
                 redis_key.fmt_error = True
 
-    def _set_key(self, redis_key: Union[RedisGetKey, RedisSetKey]) -> None:
-        # skip other keys
-        if not isinstance(redis_key, RedisSetKey):
-            return
+    def _set_keys(self, redis_keys_l: List[RedisSetKey]) -> None:
         # skip null value
-        if redis_key.raw_value is None:
+        redis_keys_l = [redis_key for redis_key in redis_keys_l if redis_key.raw_value is not None]
+        if not redis_keys_l:
             return
-        # redis I/O
-        set_ret = self.redis_cli.set(redis_key.name, redis_key.raw_value, ex=redis_key.ex)
-        redis_key.io_error = set_ret is not True
-        # debug
-        logger.debug(f'set key {redis_key.name} to {redis_key.raw_value}')
+        # one SET for each key and one HSET (with a mapping) for each hash
+        groups_l: List[List[RedisSetKey]] = []
+        fields_d: Dict[bytes, List[RedisSetKey]] = {}
+        for redis_key in redis_keys_l:
+            if isinstance(redis_key, RedisHashSetField):
+                if redis_key.name not in fields_d:
+                    fields_d[redis_key.name] = []
+                    groups_l.append(fields_d[redis_key.name])
+                fields_d[redis_key.name].append(redis_key)
+            else:
+                groups_l.append([redis_key])
+        # redis I/O (all commands in a single pipeline round-trip)
+        pipe = self.redis_cli.pipeline(transaction=False)
+        for group_l in groups_l:
+            if isinstance(group_l[0], RedisHashSetField):
+                mapping_d = {redis_field.field: redis_field.raw_value for redis_field in group_l}
+                pipe.hset(group_l[0].name, mapping=mapping_d)
+            else:
+                pipe.set(group_l[0].name, group_l[0].raw_value, ex=group_l[0].ex)
+        for group_l, set_ret in zip(groups_l, pipe.execute(raise_on_error=False)):
+            for redis_key in group_l:
+                if isinstance(redis_key, RedisHashSetField):
+                    redis_key.io_error = isinstance(set_ret, Exception)
+                else:
+                    redis_key.io_error = set_ret is not True
+                # debug
+                logger.debug(f'set key {redis_key.name} to {redis_key.raw_value}')
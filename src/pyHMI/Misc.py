@@ -1,9 +1,13 @@
 """Misc resources."""
 
+import bisect
+import heapq
+import itertools
 import math
 import threading
 import time
-from typing import List, Optional, Union
+import weakref
+from typing import Any, List, Optional, Tuple, Union
 
 
 def auto_repr(self: object, export_t: Optional[tuple] = None) -> str:
@@ -163,6 +167,41 @@ class SafeObject:
         self._lock.release()
 
 
+class FairLock:
+    """ A lock granted in the order of requests (unlike threading.Lock).
+
+    Usage:
+        lock = FairLock()
+
+        with lock:
+            ...
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._next_ticket = 0
+        self._serving = 0
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def acquire(self) -> None:
+        with self._cond:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            while ticket != self._serving:
+                self._cond.wait()
+
+    def release(self) -> None:
+        with self._cond:
+            self._serving += 1
+            self._cond.notify_all()
+
+
 class TTL:
     def __init__(self, value: float, reset: bool = True) -> None:
         # args
@@ -180,3 +219,151 @@ class TTL:
 
     def reset(self):
         self._expire_at = time.monotonic() + self.value
+
+
+class CyclicScheduler:
+    """ Schedule cyclic runs of items by deadline (a heap of next-due times).
+
+    Items are weakly referenced, their period attribute sets the run period (None for the refresh of the item
+    device, or of this scheduler device for an item without one).
+    """
+
+    def __init__(self, device: Any) -> None:
+        # args
+        self.device = device
+        # public
+        self.missed_count = 0
+        self.last_lag = 0.0
+        # private
+        self._lock = threading.Lock()
+        self._item_d: weakref.WeakValueDictionary[int, Any] = weakref.WeakValueDictionary()
+        self._item_d_pos = 0
+        self._due_heap: List[Tuple[float, int]] = []
+
+    def add(self, item: Any) -> None:
+        with self._lock:
+            self._item_d[self._item_d_pos] = item
+            # a new item is due now
+            heapq.heappush(self._due_heap, (time.monotonic(), self._item_d_pos))
+            self._item_d_pos += 1
+
+    def period_of(self, item: Any) -> float:
+        if item.period is None:
+            return getattr(item, 'device', self.device).refresh
+        return item.period
+
+    def pop_due(self) -> list:
+        """ Return every item due now and schedule its next run.
+
+        The last_lag attribute is set to the delay of the most overdue item of this call. Items with a false cyclic
+        attribute are returned too, but not accounted for in last_lag and missed_count.
+        """
+        now = time.monotonic()
+        due_l = []
+        with self._lock:
+            self.last_lag = 0.0
+            while self._due_heap and self._due_heap[0][0] <= now:
+                due_at, item_id = heapq.heappop(self._due_heap)
+                item = self._item_d.get(item_id)
+                # skip items removed by the garbage collector
+                if item is None:
+                    continue
+                due_l.append(item)
+                cyclic = getattr(item, 'cyclic', True)
+                if cyclic:
+                    self.last_lag = max(self.last_lag, now - due_at)
+                # next deadline is based on the previous one (no drift due to execution time),
+                # missed deadlines are skipped rather than run in burst
+                period = self.period_of(item)
+                next_at = due_at + period
+                if next_at <= now:
+                    next_at = now + period
+                    if cyclic:
+                        self.missed_count += 1
+                heapq.heappush(self._due_heap, (next_at, item_id))
+        return due_l
+
+    def wait_time(self) -> float:
+        """ Time to wait until the next deadline (bounded by device refresh to check device state). """
+        with self._lock:
+            if not self._due_heap:
+                return self.device.refresh
+            return max(0.0, min(self._due_heap[0][0] - time.monotonic(), self.device.refresh))
+
+
+class LoopStats:
+    """ Timing statistics of an I/O loop. """
+
+    def __init__(self) -> None:
+        # public
+        self.loop_count = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+
+    def __repr__(self) -> str:
+        return f'LoopStats(loop_count={self.loop_count}, last_duration={self.last_duration:.6f}, ' \
+               f'avg_duration={self.avg_duration:.6f}, max_duration={self.max_duration:.6f})'
+
+    @property
+    def avg_duration(self) -> float:
+        return self.total_duration / self.loop_count if self.loop_count else 0.0
+
+    def add(self, duration: float) -> None:
+        """ Account for a loop of duration seconds. """
+        self.loop_count += 1
+        self.last_duration = duration
+        self.max_duration = max(self.max_duration, duration)
+        self.total_duration += duration
+
+    def as_dict(self) -> dict:
+        return dict(loop_count=self.loop_count, last_duration=self.last_duration,
+                    avg_duration=self.avg_duration, max_duration=self.max_duration)
+
+
+class LatencyHistogram:
+    """ Latency histogram with fixed buckets (HDR-style log scale: 1-2-5 steps from 100 us to 10 s).
+
+    Updates take no lock: a sample lost by a race between two I/O threads doesn't matter for statistics.
+    """
+
+    bounds = (0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0)
+
+    def __init__(self) -> None:
+        # public
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        # private
+        self._counts = [0] * (len(self.bounds) + 1)
+
+    def __repr__(self) -> str:
+        return f'LatencyHistogram(count={self.count}, avg={self.avg:.6f}, p99={self.percentile(99):.6f}, ' \
+               f'max={self.max:.6f})'
+
+    @property
+    def avg(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def add(self, duration: float) -> None:
+        """ Account for a sample of duration seconds. """
+        self._counts[bisect.bisect_left(self.bounds, duration)] += 1
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+    def buckets(self) -> List[Tuple[float, int]]:
+        """ Return the cumulative count of samples at every bucket upper bound (the last one is inf). """
+        return list(zip((*self.bounds, math.inf), itertools.accumulate(self._counts)))
+
+    def percentile(self, pct: float) -> float:
+        """ Return the upper bound of the bucket of the pct percentile (bounded by the max sample). """
+        rank = max(math.ceil(self.count * pct / 100), 1)
+        for bound, count in self.buckets():
+            if count >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self) -> dict:
+        return dict(count=self.count, total=self.total, avg=self.avg, max=self.max,
+                    p50=self.percentile(50), p90=self.percentile(90), p99=self.percentile(99))
@@ -1,6 +1,6 @@
 import tkinter as tk
 from tkinter.font import Font
-from typing import Optional
+from typing import List, Optional, Set
 
 from .Colors import SynColors
 from .Tag import Tag
@@ -16,6 +16,11 @@ class SynWidget:
         # add this widget to Synoptic
         self.synoptic.record_widget(self)
 
+    @property
+    def tags(self) -> List[Tag]:
+        """ Tags used by this widget. """
+        return [value for value in vars(self).values() if isinstance(value, Tag)]
+
     def build(self):
         pass
 
@@ -384,7 +389,8 @@ class SynGeo:
 
 
 class Synoptic:
-    def __init__(self, master=None, width: int = 400, height: int = 400, update_ms: int = 500, debug: bool = False):
+    def __init__(self, master=None, width: int = 400, height: int = 400, update_ms: int = 500, debug: bool = False,
+                 dirty_only: bool = False):
         """
         Synoptic class: build and update a Tk canvas with all kind of industrial widget.
 
@@ -393,6 +399,7 @@ class Synoptic:
         :param height: canvas height in pixels (default is 400)
         :param update_ms: refresh rate in ms (default is 500)
         :param debug: debug mode display all widgets names on canvas (default is False)
+        :param dirty_only: auto-refresh only redraw widgets with changed tags (default is False)
         """
         # args
         self.master = master
@@ -400,6 +407,7 @@ class Synoptic:
         self.height = height
         self.update_ms = update_ms
         self.debug = debug
+        self.dirty_only = dirty_only
         # default colors palette
         self.colors = SynColors()
         # default geometry
@@ -408,6 +416,9 @@ class Synoptic:
         self.tk_canvas = tk.Canvas(self.master, width=width, height=height)
         # dict of widgets mapped on this synoptic
         self.widgets = {}
+        # names of widgets to redraw (dirty_only mode) and of widgets with tags that can't report changes
+        self._dirty_names: Set[str] = set()
+        self._polled_names: Set[str] = set()
         # setup auto-refresh of update method (on-visibility and every update_ms)
         self.tk_canvas.bind('<Visibility>', lambda evt: self.update())
         if self.update_ms:
@@ -415,7 +426,10 @@ class Synoptic:
 
     def _auto_update(self):
         if self.tk_canvas.winfo_ismapped():
-            self.update()
+            if self.dirty_only:
+                self.update_dirty()
+            else:
+                self.update()
         self.tk_canvas.after(ms=self.update_ms, func=self._auto_update)
 
     def record_widget(self, widget: SynWidget):
@@ -442,6 +456,13 @@ class Synoptic:
         for widget in self.widgets.values():
             if isinstance(widget, (SynButton, SynValve, SynFlowValve, SynPoint, SynValue)):
                 widget.build()
+        # in dirty_only mode, tags changes mark their widgets as dirty
+        if self.dirty_only:
+            for widget in self.widgets.values():
+                self._dirty_names.add(widget.name)
+                for tag in widget.tags:
+                    if not tag.subscribe(lambda _tag, name=widget.name: self._dirty_names.add(name)):
+                        self._polled_names.add(widget.name)
         # apply background color
         self.tk_canvas.configure(background=self.colors.bg)
         # pack canvas
@@ -455,3 +476,16 @@ class Synoptic:
     def update(self):
         for widget in self.widgets.values():
             widget.update()
+
+    def update_dirty(self):
+        """ Update only widgets whose tags have changed since last call (and polled widgets). """
+        for name in self._polled_names:
+            self.widgets[name].update()
+        # pop names one by one (I/O threads may add some during this loop)
+        while True:
+            try:
+                name = self._dirty_names.pop()
+            except KeyError:
+                break
+            if name not in self._polled_names:
+                self.widgets[name].update()
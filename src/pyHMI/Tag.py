@@ -1,7 +1,7 @@
 import logging
 import sys
 import traceback
-from typing import Any, Callable, Optional, Union, get_args
+from typing import Any, Callable, List, Optional, Union, get_args
 
 TAG_TYPE = Union[bool, int, float, str, bytes]
 
@@ -38,6 +38,13 @@ class DataSource:
         """ Method call by Tag class to retrieve error status from datasource. """
         return False
 
+    def watch(self, tag: "Tag") -> bool:
+        """ Method call by Tag class to be notified (by tag._notify()) of value or error changes.
+
+        Return False if this datasource cannot report changes.
+        """
+        return False
+
     def sync(self) -> bool:
         """ Try to synchronize the data source with its target. (e.g. trigger an immediate write to a DB). """
         raise NotImplemented('this method is not implemented in this data source')
@@ -69,6 +76,8 @@ class Tag:
         self._value = self.init_value
         self._error = self.init_error
         self._chg_cmd_error = False
+        self._subscribers: List[Callable[["Tag"], None]] = []
+        self._src_watched = False
         # notify tag creation to external source
         if isinstance(self.src, DataSource):
             self.src.add_tag(self)
@@ -135,6 +144,8 @@ class Tag:
         # notify external source if set
         if self.src and self.src_enabled:
             self._set_src(self._value)
+        elif self._value != prev_value:
+            self._notify()
         # notify user
         self.on_set(value, prev_value)
 
@@ -151,7 +162,39 @@ class Tag:
     @error.setter
     def error(self, value: bool) -> None:
         """ Set the error status of tag (useless for externally sourced). """
+        prev_error = self._error
         self._error = value
+        if not (self.src and self.src_enabled) and self._error != prev_error:
+            self._notify()
+
+    def subscribe(self, callback: Callable[["Tag"], None]) -> bool:
+        """ Register callback(tag) to be called on value or error changes.
+
+        For an externally sourced tag, the callback is called by the I/O thread of the data source.
+
+        Return False if the data source cannot report changes (tag must be polled as usual).
+        """
+        if callback not in self._subscribers:
+            self._subscribers.append(callback)
+        # internal tags always report changes
+        if not isinstance(self.src, DataSource):
+            return True
+        if not self._src_watched:
+            self._src_watched = self.src.watch(self)
+        return self._src_watched
+
+    def unsubscribe(self, callback: Callable[["Tag"], None]) -> None:
+        """ Remove a callback registered by subscribe(). """
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def _notify(self) -> None:
+        """ Call every subscriber (call by data sources on value or error changes). """
+        for callback in list(self._subscribers):
+            try:
+                callback(self)
+            except Exception as e:
+                logger.warning(f'subscriber callback {callback!r} failed (except "{e}")')
 
     def set(self, value: Optional[TAG_TYPE]) -> None:
         """ An helper to let user set the val property in lambda usage context. """
@@ -1,5 +1,5 @@
 import tkinter as tk
-from typing import Callable, List, Optional
+from typing import Any, Callable, List, Optional, Set
 
 from .Colors import UIColors
 from .Tag import Tag
@@ -16,12 +16,16 @@ ui_def_ctx = UIContext()
 
 
 class UIFrameWidget:
-    def __init__(self, master: tk.Widget, ctx: UIContext):
+    def __init__(self, master: tk.Widget, ctx: UIContext, dirty_only: bool = False):
         # args
         self.master = master
         self.ctx = ctx
+        self.dirty_only = dirty_only
         # public
         self.frame = tk.Frame(self.master)
+        # private
+        self._dirty_items: Set[Any] = set()
+        self._polled_items: List[Any] = []
         # setup auto-refresh of update method (on-visibility and every update_ms)
         self.frame.bind('<Visibility>', lambda evt: self.update())
         self._auto_update()
@@ -31,12 +35,34 @@ class UIFrameWidget:
             self.frame.after(ms=1000, func=self._auto_update)
         else:
             if self.frame.winfo_ismapped():
-                self.update()
+                if self.dirty_only:
+                    self.update_dirty()
+                else:
+                    self.update()
             self.frame.after(ms=self.ctx.update_ms, func=self._auto_update)
 
+    def _track_item(self, item: Any, tag: Optional[Tag]) -> None:
+        """ With dirty_only, mark item as dirty on every change of tag (poll it if tag can't report changes). """
+        if self.dirty_only and tag:
+            self._dirty_items.add(item)
+            if not tag.subscribe(lambda _tag: self._dirty_items.add(item)):
+                self._polled_items.append(item)
+
     def update(self):
         pass
 
+    def update_dirty(self):
+        """ Update only items whose tags have changed since last call (and polled items). """
+        for item in self._polled_items:
+            item.update()
+        # pop items one by one (I/O threads may add some during this loop)
+        while True:
+            try:
+                item = self._dirty_items.pop()
+            except KeyError:
+                break
+            item.update()
+
 
 class UIBoolItem:
     def __init__(self, b_list: 'UIBoolListFrame', label_0: str, tag: Optional[Tag] = None, label_1: str = '',
@@ -75,8 +101,8 @@ class UIBoolItem:
 class UIBoolListFrame(UIFrameWidget):
     """An helper to map a UI array of bool values (auto-refresh by update method)."""
 
-    def __init__(self, master: tk.Widget, ctx: UIContext = ui_def_ctx, head_str: str = ''):
-        super().__init__(master, ctx)
+    def __init__(self, master: tk.Widget, ctx: UIContext = ui_def_ctx, head_str: str = '', dirty_only: bool = False):
+        super().__init__(master, ctx, dirty_only=dirty_only)
         # public
         self.items: List[UIBoolItem] = []
         # init tk labels
@@ -88,6 +114,7 @@ class UIBoolListFrame(UIFrameWidget):
             state: bool = True, alarm: bool = False) -> UIBoolItem:
         bool_item = UIBoolItem(self, label_0=label_0, tag=tag, label_1=label_1, state=state, alarm=alarm)
         self.items.append(bool_item)
+        self._track_item(bool_item, tag)
         return bool_item
 
     def build(self) -> tk.Frame:
@@ -147,14 +174,15 @@ class UIAnalogItem:
 class UIAnalogListFrame(UIFrameWidget):
     """An helper to map a UI array of analog values (auto-refresh by update method)."""
 
-    def __init__(self, master: tk.Widget, ctx: UIContext = ui_def_ctx) -> None:
-        super().__init__(master, ctx)
+    def __init__(self, master: tk.Widget, ctx: UIContext = ui_def_ctx, dirty_only: bool = False) -> None:
+        super().__init__(master, ctx, dirty_only=dirty_only)
         # public
         self.items: List[UIAnalogItem] = []
 
     def add(self, name: str, tag: Tag, unit: str = '', fmt: str = '') -> UIAnalogItem:
         analog_item = UIAnalogItem(self, name=name, tag=tag, unit=unit, fmt=fmt)
         self.items.append(analog_item)
+        self._track_item(analog_item, tag)
         return analog_item
 
     def build(self) -> tk.Frame:
@@ -199,8 +227,9 @@ class UIButtonItem:
 class UIButtonListFrame(UIFrameWidget):
     """An helper to map a UI array of tk buttons (auto-refresh by update method)."""
 
-    def __init__(self, master: tk.Widget, ctx: UIContext = ui_def_ctx, n_cols: int = 1) -> None:
-        super().__init__(master, ctx)
+    def __init__(self, master: tk.Widget, ctx: UIContext = ui_def_ctx, n_cols: int = 1,
+                 dirty_only: bool = False) -> None:
+        super().__init__(master, ctx, dirty_only=dirty_only)
         # args
         self.n_cols = n_cols
         # public
@@ -209,6 +238,7 @@ class UIButtonListFrame(UIFrameWidget):
     def add(self, name: str, tag_valid: Optional[Tag] = None, cmd: Optional[Callable] = None) -> UIButtonItem:
         button_item = UIButtonItem(self, name=name, tag_valid=tag_valid, cmd=cmd)
         self.items.append(button_item)
+        self._track_item(button_item, tag_valid)
         return button_item
 
     def build(self) -> tk.Frame:
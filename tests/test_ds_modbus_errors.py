@@ -2,8 +2,8 @@
 
 import pytest
 
-from pyHMI.DS_ModbusTCP import (ModbusBool, ModbusFloat, ModbusInt,
-                                ModbusTCPDevice)
+from pyHMI.DS_ModbusTCP import (ModbusBool, ModbusDevice, ModbusFloat,
+                                ModbusInt, ModbusTCPDevice)
 
 
 class FakeConf:
@@ -50,6 +50,16 @@ def test_errors_requests():
         FakeConf.md.add_write_regs_request(0, size=124)
 
 
+def test_errors_device_subclass():
+    """ Test that a device without its I/O engine methods can't be built """
+    class NoEngineDevice(ModbusDevice):
+        def _single_run_q_size(self) -> int:
+            return 0
+
+    with pytest.raises(TypeError):
+        NoEngineDevice()
+
+
 def test_errors_modbus_bool():
     """ Test ModbusBool errors """
     # === shouldn't raise exception ===
@@ -2,12 +2,19 @@
 
 import itertools
 import random
+import threading
+import time
 
 import pytest
-from pyModbusTCP.server import ModbusServer
+from pyModbusTCP.server import DataBank, DataHandler, ModbusServer
 
-from pyHMI.DS_ModbusTCP import (ModbusBool, ModbusBoolRegister, ModbusFloat,
-                                ModbusInt, ModbusRequest, ModbusTCPDevice)
+from pyHMI.DS_ModbusTCP import (AsyncModbusTCPDevice, ModbusBool,
+                                ModbusBoolRegister, ModbusFloat,
+                                ModbusFloatArray, ModbusInt, ModbusIntArray,
+                                ModbusRequest, ModbusTCPDevice, ModbusTCPGateway,
+                                Priority, _plan_read_blocks, _WriteReadPair,
+                                prometheus_text)
+from pyHMI.Tag import Tag
 
 from .utils import (bool_list_to_16b_list, build_bool_data_l,
                     build_float_data_l, build_int_data_l, cut_bytes,
@@ -100,6 +107,8 @@ def test_read_modbus_int_src(modbus_srv):
         request = ModbusTCPDevice(port=5020).add_read_regs_request(addr, nb_reg, i_regs=i_regs)
         ds_args = {'bit_length': bit_length, 'signed': signed}
         src_l = [ModbusInt(request, addr+off, **ds_args) for off in range(0, nb_reg, to_reg_length(bit_length))]
+        # data space is unset before the first run
+        assert all(src.get() is None for src in src_l)
         # run request
         run_and_wait_ok(request)
         # read dataset
@@ -138,6 +147,227 @@ def test_read_modbus_float_src(modbus_srv):
         assert srv_float_l == pytest.approx(ds_float_l, abs=1e-6, nan_ok=True)
 
 
+def test_read_modbus_swap_options(modbus_srv):
+    """ Test byte order and swap options of ModbusInt and ModbusFloat """
+    # float 42.0 is 0x42280000 and int 0x11223344 in every supported registers layout
+    layouts_l = [(dict(), [0x4228, 0x0000], [0x1122, 0x3344]),
+                 (dict(swap_word=True), [0x0000, 0x4228], [0x3344, 0x1122]),
+                 (dict(swap_bytes=True), [0x2842, 0x0000], [0x2211, 0x4433]),
+                 (dict(swap_bytes=True, swap_word=True), [0x0000, 0x2842], [0x4433, 0x2211]),
+                 (dict(byte_order='little'), [0x0000, 0x2842], [0x4433, 0x2211]),
+                 (dict(byte_order='little', swap_word=True), [0x2842, 0x0000], [0x2211, 0x4433])]
+    device = ModbusTCPDevice(port=5020)
+    for swap_d, float_regs_l, int_regs_l in layouts_l:
+        modbus_srv.data_bank.set_holding_registers(0, float_regs_l + int_regs_l)
+        request = device.add_read_regs_request(0, 4)
+        run_and_wait_ok(request)
+        assert ModbusFloat(request, 0, **swap_d).get() == 42.0
+        assert ModbusInt(request, 2, bit_length=32, **swap_d).get() == 0x11223344
+        # write back with the same layout
+        w_request = device.add_write_regs_request(10, 4)
+        ModbusFloat(w_request, 10, **swap_d).set(42.0)
+        ModbusInt(w_request, 12, bit_length=32, **swap_d).set(0x11223344)
+        run_and_wait_ok(w_request)
+        assert modbus_srv.data_bank.get_holding_registers(10, 4) == float_regs_l + int_regs_l
+
+
+def test_decode_cache(modbus_srv):
+    """ Test data sources cache decoded values until the next data space update """
+    modbus_srv.data_bank.set_holding_registers(0, [0x1234, 0x5678])
+    device = ModbusTCPDevice(port=5020)
+    request = device.add_read_regs_request(0, 2)
+    int_src = ModbusInt(request, 0, bit_length=32)
+    assert int_src.get() is None
+    generation = request.generation
+    run_and_wait_ok(request)
+    assert request.generation == generation + 1
+    assert int_src.get() == 0x12345678
+    # cached value is reset on option change
+    int_src.swap_word = True
+    assert int_src.get() == 0x56781234
+    # and on data update
+    modbus_srv.data_bank.set_holding_registers(0, [0xabcd])
+    run_and_wait_ok(request)
+    assert int_src.get() == 0x5678abcd
+
+
+def test_read_modbus_array_src(modbus_srv):
+    """ Test ModbusFloatArray and ModbusIntArray reading operations (ModbusServer -> DataSource) """
+    pytest.importorskip('numpy')
+    for bit_length, swap_word in itertools.product([32, 64], [False, True]):
+        size = random.randint(1, 125//to_reg_length(bit_length))
+        srv_float_l = build_float_data_l(size=size, bit_length=bit_length)
+        srv_int_l = build_int_data_l(size=size, bit_length=bit_length, signed=True)
+        # encode float to IEEE format
+        ieee_l = []
+        for value in srv_float_l:
+            ieee_l.append(single_float_to_int(value) if bit_length == 32 else double_float_to_int(value))
+        # init server (apply word swaps to registers)
+        float_regs_l = to_16b_list(ieee_l, bit_length)
+        int_regs_l = [r & 0xffff for r in to_16b_list(srv_int_l, bit_length)]
+        if swap_word:
+            float_regs_l = list(itertools.chain(*zip(float_regs_l[1::2], float_regs_l[::2])))
+            int_regs_l = list(itertools.chain(*zip(int_regs_l[1::2], int_regs_l[::2])))
+        modbus_srv.data_bank.set_holding_registers(0, float_regs_l)
+        modbus_srv.data_bank.set_holding_registers(1000, int_regs_l)
+        # init datasource
+        device = ModbusTCPDevice(port=5020)
+        f_request = device.add_read_regs_request(0, len(float_regs_l))
+        i_request = device.add_read_regs_request(1000, len(int_regs_l))
+        float_src = ModbusFloatArray(f_request, 0, count=size, bit_length=bit_length, swap_word=swap_word)
+        int_src = ModbusIntArray(i_request, 1000, count=size, bit_length=bit_length, signed=True, swap_word=swap_word)
+        assert float_src.get() is None
+        # run requests
+        run_and_wait_ok(f_request)
+        run_and_wait_ok(i_request)
+        # check data match
+        assert srv_float_l == pytest.approx(float_src.get().tolist(), abs=1e-6, nan_ok=True)
+        assert srv_int_l == int_src.get().tolist()
+        # swap_word acts as in ModbusInt
+        reg_length = to_reg_length(bit_length)
+        int_l = [ModbusInt(i_request, 1000 + i * reg_length, bit_length=bit_length, signed=True,
+                           swap_word=swap_word).get() for i in range(size)]
+        assert int_l == int_src.get().tolist()
+    # 16-bit items (with an odd count of registers): swap_word is a no-op, as in ModbusInt
+    for swap_word in [False, True]:
+        size = random.choice([1, 3, 5, 7])
+        srv_int_l = build_int_data_l(size=size, bit_length=16, signed=True)
+        modbus_srv.data_bank.set_holding_registers(2000, [value & 0xffff for value in srv_int_l])
+        device = ModbusTCPDevice(port=5020)
+        request = device.add_read_regs_request(2000, size)
+        int_src = ModbusIntArray(request, 2000, count=size, bit_length=16, signed=True, swap_word=swap_word)
+        run_and_wait_ok(request)
+        assert srv_int_l == int_src.get().tolist()
+        int_l = [ModbusInt(request, 2000 + i, signed=True, swap_word=swap_word).get() for i in range(size)]
+        assert int_l == int_src.get().tolist()
+
+
+def test_read_coalesced_requests(modbus_srv):
+    """ Test the cyclic read planner (ModbusServer -> DataSource) """
+    # build a dataset
+    srv_regs_l = build_int_data_l(size=300, bit_length=16)
+    modbus_srv.data_bank.set_holding_registers(0, srv_regs_l)
+    # init some scattered cyclic requests
+    device = ModbusTCPDevice(port=5020, refresh=0.1, coalesce_reads=True, coalesce_max_gap=2)
+    req_l = []
+    for addr, size in [(0, 10), (5, 20), (26, 4), (40, 2), (100, 100), (200, 30)]:
+        req_l.append(device.add_read_regs_request(addr, size, cyclic=True))
+    # check the read plan: gap and size limit are respected
+    blocks_l = _plan_read_blocks(req_l, max_gap=2)
+    assert [(b.address, b.size) for b in blocks_l] == [(0, 30), (40, 2), (100, 100), (200, 30)]
+    # wait for a full cycle and check data match
+    for request in req_l:
+        request.run_done_evt.clear()
+    for request in req_l:
+        assert request.run_done_evt.wait(timeout=5.0)
+        assert not request.error
+        src_l = [ModbusInt(request, addr) for addr in range(request.address, request.address + request.size)]
+        assert [src.get() for src in src_l] == srv_regs_l[request.address:request.address + request.size]
+
+
+def test_cyclic_periods(modbus_srv):
+    """ Test cyclic requests polled at their own period """
+    device = ModbusTCPDevice(port=5020, refresh=0.05)
+    fast_req = device.add_read_regs_request(0, 10, cyclic=True, period=0.05)
+    slow_req = device.add_read_regs_request(100, 10, cyclic=True, period=30.0)
+    # both requests are due at startup
+    assert fast_req.run_done_evt.wait(timeout=5.0)
+    assert slow_req.run_done_evt.wait(timeout=5.0)
+    slow_req.run_done_evt.clear()
+    # fast request is polled several times, slow one is not polled again
+    for _ in range(3):
+        fast_req.run_done_evt.clear()
+        assert fast_req.run_done_evt.wait(timeout=5.0)
+    assert not slow_req.run_done_evt.is_set()
+    # bad period
+    with pytest.raises(ValueError):
+        device.add_read_regs_request(0, cyclic=True, period=0.0)
+
+
+def test_tag_change_events(modbus_srv):
+    """ Test change notifications from I/O thread to subscribed tags """
+    modbus_srv.data_bank.set_holding_registers(0, [0] * 10)
+    device = ModbusTCPDevice(port=5020)
+    request = device.add_read_regs_request(0, 10)
+    changes_l = []
+    tag = Tag(0, src=ModbusInt(request, 2))
+    assert tag.subscribe(changes_l.append)
+    # first valid read: value and error status change
+    run_and_wait_ok(request)
+    assert changes_l == [tag, tag]
+    # unwatched address change
+    changes_l.clear()
+    modbus_srv.data_bank.set_holding_registers(5, [42])
+    run_and_wait_ok(request)
+    assert changes_l == []
+    # watched address change
+    modbus_srv.data_bank.set_holding_registers(2, [42])
+    run_and_wait_ok(request)
+    assert changes_l == [tag]
+    assert tag.value == 42
+
+
+def test_pipelined_engine(modbus_srv):
+    """ Test requests processed by the pipelined engine (single-run and cyclic threads) """
+    # build a dataset
+    srv_regs_l = build_int_data_l(size=200, bit_length=16)
+    srv_bool_l = build_bool_data_l(size=200)
+    modbus_srv.data_bank.set_holding_registers(0, srv_regs_l)
+    modbus_srv.data_bank.set_coils(0, srv_bool_l)
+    # init requests
+    device = ModbusTCPDevice(port=5020, refresh=0.1, max_in_flight=4)
+    r_regs_l = [device.add_read_regs_request(addr, 20) for addr in range(0, 200, 20)]
+    r_bits_l = [device.add_read_bits_request(addr, 50, cyclic=True) for addr in range(0, 200, 50)]
+    w_regs_req = device.add_write_regs_request(1000, 10)
+    w_bits_req = device.add_write_bits_request(1000, single_func=True)
+    # wait for the first cyclic run (device is connected)
+    assert r_bits_l[0].run_done_evt.wait(timeout=5.0)
+    # single-run: read and write requests queued at once
+    for request in r_regs_l:
+        request.run()
+    ModbusInt(w_regs_req, 1005).set(0xc0ffee & 0xffff)
+    ModbusBool(w_bits_req, 1000).set(True)
+    for request in [*r_regs_l, w_regs_req, w_bits_req]:
+        run_and_wait_ok(request)
+    assert [ModbusInt(r, addr).get() for r in r_regs_l for addr in range(r.address, r.address + r.size)] == srv_regs_l
+    assert modbus_srv.data_bank.get_holding_registers(1000, 10) == [0] * 5 + [0xc0ffee & 0xffff] + [0] * 4
+    assert modbus_srv.data_bank.get_coils(1000) == [True]
+    # cyclic
+    for request in r_bits_l:
+        request.run_done_evt.clear()
+    for request in r_bits_l:
+        assert request.run_done_evt.wait(timeout=5.0)
+        assert not request.error
+    assert [ModbusBool(r, addr).get() for r in r_bits_l for addr in range(r.address, r.address + r.size)] == srv_bool_l
+    assert device.connected
+
+
+def test_async_device(modbus_srv):
+    """ Test AsyncModbusTCPDevice read/write (many devices on a single loop thread) """
+    # build a dataset
+    srv_regs_l = build_int_data_l(size=100, bit_length=16)
+    modbus_srv.data_bank.set_holding_registers(0, srv_regs_l)
+    # some devices share the same event loop thread
+    def io_threads_l():
+        return [t for t in threading.enumerate() if t.__module__ == 'pyHMI.DS_ModbusTCP']
+    AsyncModbusTCPDevice(port=5020)
+    io_threads_before_l = io_threads_l()
+    devices_l = [AsyncModbusTCPDevice(port=5020, refresh=0.1, max_in_flight=2) for _ in range(10)]
+    assert io_threads_l() == io_threads_before_l
+    for device in devices_l:
+        # cyclic read
+        request = device.add_read_regs_request(0, 100, cyclic=True)
+        request.run_done_evt.clear()
+        assert request.run_done_evt.wait(timeout=5.0)
+        assert [ModbusInt(request, addr).get() for addr in range(100)] == srv_regs_l
+        # single-run write
+        w_request = device.add_write_regs_request(200, 2)
+        ModbusFloat(w_request, 200).set(42.0)
+        run_and_wait_ok(w_request)
+        assert modbus_srv.data_bank.get_holding_registers(200, 2) == [0x4228, 0x0000]
+        assert device.connected
+
+
 def test_write_modbus_bool_src(modbus_srv):
     """ Test ModbusBool writing operations (DataSource -> ModbusServer) """
     # build a dataset
@@ -210,3 +440,209 @@ def test_write_modbus_float_src(modbus_srv):
                 srv_float_l.append(int_to_double_float(int.from_bytes(block, byteorder='big')))
         # check data match
         assert ds_float_l == pytest.approx(srv_float_l, abs=1e-6, nan_ok=True)
+
+
+def test_run_while_disabled(modbus_srv):
+    """ Test that a run dropped by a disabled device doesn't block the next runs """
+    modbus_srv.data_bank.set_holding_registers(600, [1, 2])
+    for device_cls, max_in_flight in [(ModbusTCPDevice, 1), (ModbusTCPDevice, 4), (AsyncModbusTCPDevice, 4)]:
+        device = device_cls(port=5020, max_in_flight=max_in_flight, enabled=False)
+        r_request = device.add_read_regs_request(600, 2)
+        w_request = device.add_write_regs_request(700, 1)
+        ModbusInt(w_request, 700).set(max_in_flight)
+        # a disconnected device queues a run on an empty queue only
+        for request in (r_request, w_request):
+            assert request.run()
+            time.sleep(0.1)
+            assert not request.run_done_evt.is_set()
+        # once enabled, the next runs are processed
+        device.enabled = True
+        run_and_wait_ok(r_request)
+        run_and_wait_ok(w_request)
+        assert r_request._get_data(600, 2) == [1, 2]
+        assert modbus_srv.data_bank.get_holding_registers(700, 1) == [max_in_flight]
+
+
+def test_write_dirty_spans():
+    """ Test that writes only send dirty spans and coalesce sets of the write window """
+    class LogDataHandler(DataHandler):
+        def write_h_regs(self, address, words_l, srv_info):
+            writes_l.append((address, len(words_l)))
+            return super().write_h_regs(address, words_l, srv_info)
+
+    writes_l = []
+    srv = ModbusServer(port=5021, no_block=True, data_hdl=LogDataHandler())
+    srv.start()
+    try:
+        for max_in_flight in (1, 4):
+            writes_l.clear()
+            request = ModbusTCPDevice(port=5021, max_in_flight=max_in_flight).add_write_regs_request(
+                100, 100, on_set=True, write_window=0.1)
+            # nothing set: the whole request is written
+            run_and_wait_ok(request)
+            assert writes_l == [(100, 100)]
+            writes_l.clear()
+            # sets in the write window are sent at once, as the smallest spans (near spans are merged)
+            for address in (110, 111, 115, 150, 151, 199):
+                ModbusInt(request, address).set(address)
+            assert request.run_done_evt.wait(timeout=5.0) and not request.error
+            assert sorted(writes_l) == [(110, 6), (150, 2), (199, 1)]
+            assert srv.data_bank.get_holding_registers(110, 6) == [110, 111, 0, 0, 0, 115]
+            assert srv.data_bank.get_holding_registers(199, 1) == [199]
+    finally:
+        srv.stop()
+
+
+def test_write_read_pairs(modbus_srv):
+    """ Test FC23 transactions for a write and a read of holding registers planned together """
+    modbus_srv.data_bank.set_holding_registers(300, list(range(20)))
+    engines_l = [(ModbusTCPDevice, 1), (ModbusTCPDevice, 4), (AsyncModbusTCPDevice, 4)]
+    for loop_idx, (device_cls, max_in_flight) in enumerate(engines_l):
+        device = device_cls(port=5020, refresh=0.1, max_in_flight=max_in_flight, pair_write_read=True)
+        # the planner pairs write and read of registers only (devices of previous loops still write theirs)
+        w_address = 200 + 10 * loop_idx
+        w_request = device.add_write_regs_request(w_address, 10, cyclic=True)
+        r_request = device.add_read_regs_request(300, 20, cyclic=True)
+        r_coils = device.add_read_bits_request(0, 8)
+        jobs_l = device._plan_cyclic_jobs([w_request, r_request, r_coils])
+        assert len(jobs_l) == 1 and isinstance(jobs_l[0], _WriteReadPair)
+        assert jobs_l[0].write_job.request is w_request and jobs_l[0].read_job is r_request
+        # cyclic write and read run together
+        for i in range(10):
+            ModbusInt(w_request, w_address + i).set(1000 * loop_idx + i)
+        time.sleep(0.5)
+        assert not w_request.error and not r_request.error
+        assert modbus_srv.data_bank.get_holding_registers(w_address, 10) == list(range(1000 * loop_idx,
+                                                                                       1000 * loop_idx + 10))
+        assert r_request._get_data(300, 20) == list(range(20))
+
+
+def test_gateway_devices():
+    """ Test devices of several unit ids sharing the connection of a gateway """
+    class LogDataHandler(DataHandler):
+        def read_h_regs(self, address, count, srv_info):
+            reads_l.append((srv_info.client.port, srv_info.recv_frame.mbap.unit_id))
+            return super().read_h_regs(address, count, srv_info)
+
+    reads_l = []
+    srv = ModbusServer(port=5022, no_block=True, data_hdl=LogDataHandler())
+    srv.start()
+    try:
+        srv.data_bank.set_holding_registers(0, list(range(10)))
+        for max_in_flight in (1, 4):
+            reads_l.clear()
+            gateway = ModbusTCPGateway(port=5022, max_in_flight=max_in_flight, turn_size=2)
+            devices_l = [ModbusTCPDevice(unit_id=unit_id, gateway=gateway) for unit_id in range(1, 11)]
+            requests_l = [device.add_read_regs_request(unit_id, 1)
+                          for unit_id, device in enumerate(devices_l)]
+            for request in requests_l:
+                request.run()
+            for unit_id, request in enumerate(requests_l):
+                assert request.run_done_evt.wait(timeout=5.0) and not request.error
+                assert request._get_data(unit_id) == [unit_id]
+            # a single TCP connection, with every unit id
+            assert len({port for port, _ in reads_l}) == 1
+            assert sorted(unit_id for _, unit_id in reads_l) == list(range(1, 11))
+    finally:
+        srv.stop()
+
+
+def test_single_run_priorities():
+    """ Test that single-run requests are processed by priority and the command latency is measured """
+    class LogDataHandler(DataHandler):
+        def read_h_regs(self, address, count, srv_info):
+            # the first read keeps the device busy while the next requests are queued
+            if address == 0:
+                time.sleep(0.2)
+            calls_l.append(('read', address))
+            return super().read_h_regs(address, count, srv_info)
+
+        def write_h_regs(self, address, words_l, srv_info):
+            calls_l.append(('write', address))
+            return super().write_h_regs(address, words_l, srv_info)
+
+    calls_l = []
+    srv = ModbusServer(port=5023, no_block=True, data_hdl=LogDataHandler())
+    srv.start()
+    try:
+        device = ModbusTCPDevice(port=5023)
+        busy_request = device.add_read_regs_request(0, 1)
+        bg_request = device.add_read_regs_request(10, 1, priority=Priority.BACKGROUND)
+        read_request = device.add_read_regs_request(20, 1)
+        cmd_request = device.add_write_regs_request(30, 1)
+        assert read_request.priority is Priority.READ and cmd_request.priority is Priority.COMMAND
+        # connect first (a disconnected device only queues a request on an empty queue)
+        assert cmd_request.run() and cmd_request.run_done_evt.wait(timeout=5.0) and device.connected
+        calls_l.clear()
+        busy_request.run()
+        time.sleep(0.1)
+        for request in (bg_request, read_request, cmd_request):
+            request.run()
+        for request in (busy_request, bg_request, read_request, cmd_request):
+            assert request.run_done_evt.wait(timeout=5.0) and not request.error
+        assert calls_l == [('read', 0), ('write', 30), ('read', 20), ('read', 10)]
+        # the command waited for the busy read only
+        stats = device.command_latency_stats
+        assert stats['count'] == 2 and 0.0 < stats['max'] < 1.0
+    finally:
+        srv.stop()
+
+
+def test_async_command_preemption():
+    """ Test that a command doesn't wait for the whole cyclic batch of an async device """
+    class SlowDataHandler(DataHandler):
+        def read_h_regs(self, address, count, srv_info):
+            time.sleep(0.05)
+            return super().read_h_regs(address, count, srv_info)
+
+    srv = ModbusServer(port=5025, no_block=True, data_hdl=SlowDataHandler())
+    srv.start()
+    try:
+        device = AsyncModbusTCPDevice(port=5025, refresh=10.0)
+        # a cyclic batch of 2 s
+        cyclic_l = [device.add_read_regs_request(address, 1, cyclic=True) for address in range(40)]
+        cmd_request = device.add_write_regs_request(100, 1)
+        time.sleep(0.5)
+        assert cmd_request.run() and cmd_request.run_done_evt.wait(timeout=5.0) and not cmd_request.error
+        # the command was sent at the end of the read in progress
+        assert device.command_latency_stats['max'] < 0.2
+        assert not all(request.run_done_evt.is_set() for request in cyclic_l)
+    finally:
+        srv.stop()
+
+
+def test_io_stats():
+    """ Test I/O statistics of devices and requests, and their Prometheus export """
+    srv = ModbusServer(port=5024, no_block=True, data_bank=DataBank(h_regs_size=1000))
+    srv.start()
+    try:
+        devices_l = []
+        for device_cls, max_in_flight in [(ModbusTCPDevice, 1), (ModbusTCPDevice, 4), (AsyncModbusTCPDevice, 4)]:
+            device = device_cls(port=5024, max_in_flight=max_in_flight)
+            devices_l.append(device)
+            r_request = device.add_read_regs_request(0, 10)
+            w_request = device.add_write_regs_request(0, 10)
+            # out of the address space of the server: an exception response
+            bad_request = device.add_read_regs_request(2000, 10)
+            for _ in range(3):
+                run_and_wait_ok(r_request)
+                run_and_wait_ok(w_request)
+            assert bad_request.run() and bad_request.run_done_evt.wait(timeout=5.0) and bad_request.error
+            snapshot = device.stats_snapshot()
+            assert snapshot['requests'] == 7 and snapshot['errors'] == 1 and snapshot['timeouts'] == 0
+            assert snapshot['latency']['count'] == 7 and 0.0 < snapshot['latency']['max'] < 1.0
+            # read PDUs: 12 bytes sent and 9 + 2 * 10 received, write PDUs: 12 + 1 + 2 * 10 sent and 12 received
+            assert snapshot['tx_bytes'] == 3 * 12 + 3 * 33 + 12
+            assert snapshot['rx_bytes'] == 3 * 29 + 3 * 12 + 9
+            assert snapshot['reconnects'] == 0 and snapshot['command_latency']['count'] == 3
+            req_stats_d = {d['request']: d for d in snapshot['requests_stats']}
+            assert req_stats_d['read_h_regs@0/10']['runs'] == 3 and req_stats_d['read_h_regs@0/10']['errors'] == 0
+            assert req_stats_d['read_h_regs@2000/10']['errors'] == 1
+            assert req_stats_d['write_h_regs@0/10']['latency']['count'] == 3
+        text = prometheus_text(devices_l)
+        assert '# TYPE pyhmi_modbus_latency_seconds histogram' in text
+        assert 'pyhmi_modbus_requests_total{device="localhost:5024:1"} 7' in text
+        assert 'pyhmi_modbus_request_errors_total{device="localhost:5024:1",request="read_h_regs@2000/10"} 1' in text
+        assert text.count('# TYPE pyhmi_modbus_latency_seconds histogram') == 1
+    finally:
+        srv.stop()
@@ -2,13 +2,17 @@
 
 import os
 import random
+import struct
+import time
 from typing import Any, List, Optional, Union
 
 import pytest
 import redis
 
-from pyHMI.DS_Redis import (KEY_TYPE, RedisDevice, RedisGetKey, RedisPublish,
-                            RedisSetKey, RedisSubscribe)
+from pyHMI.DS_Redis import (KEY_TYPE, RedisDevice, RedisGetKey,
+                            RedisHashGetField, RedisHashSetField, RedisPublish,
+                            RedisSetKey, RedisStreamAppend, RedisStreamRead,
+                            RedisSubscribe, StructCodec, TextCodec)
 
 from .utils import build_random_str
 
@@ -111,6 +115,130 @@ def test_redis_key(cli, dev):
     sync_key(RedisGetKey(dev, 'foo', type=bytes), assert_error=False, assert_get=b'ok')
 
 
+def test_redis_cyclic_batch(cli):
+    # a device with small batches (several MGET/pipelines per cycle)
+    dev = RedisDevice(host=REDIS_HOST, batch_size=3)
+    cli.mset({f'get_{i}': str(i) for i in range(10)})
+    get_keys_l = [RedisGetKey(dev, f'get_{i}', type=int, cyclic=True) for i in range(10)]
+    set_keys_l = [RedisSetKey(dev, f'set_{i}', type=int, cyclic=True) for i in range(10)]
+    for i, set_key in enumerate(set_keys_l):
+        set_key.set(i * 10)
+    # wait for cyclic updates
+    timeout = time.monotonic() + 2.0
+    while time.monotonic() < timeout:
+        if [k.get() for k in get_keys_l] == list(range(10)) and \
+           cli.mget([f'set_{i}' for i in range(10)]) == [str(i * 10).encode() for i in range(10)]:
+            break
+        time.sleep(0.05)
+    assert [k.get() for k in get_keys_l] == list(range(10))
+    assert not any(k.error() for k in [*get_keys_l, *set_keys_l])
+    assert cli.mget([f'set_{i}' for i in range(10)]) == [str(i * 10).encode() for i in range(10)]
+    assert dev.connected
+
+
+def test_redis_cyclic_periods(cli):
+    dev = RedisDevice(host=REDIS_HOST, refresh=0.05)
+    cli.mset({'fast': b'0', 'slow': b'0'})
+    fast_key = RedisGetKey(dev, 'fast', type=int, cyclic=True, period=0.05)
+    slow_key = RedisGetKey(dev, 'slow', type=int, cyclic=True, period=30.0)
+    time.sleep(0.2)
+    assert fast_key.get() == 0 and slow_key.get() == 0
+    # only the fast key is polled again
+    cli.mset({'fast': b'1', 'slow': b'1'})
+    time.sleep(0.5)
+    assert fast_key.get() == 1
+    assert slow_key.get() == 0
+    # the loop is rate-controlled
+    stats_d = dev.cyclic_stats
+    assert 5 < stats_d['loop_count'] < 30
+    assert stats_d['max_duration'] >= stats_d['avg_duration'] > 0.0
+
+
+def test_redis_hash(cli, dev):
+    # set fields of a hash in a single cycle
+    set_fields_l = [RedisHashSetField(dev, 'station', f'tag_{i}', type=int, cyclic=True) for i in range(10)]
+    set_fields_l.append(RedisHashSetField(dev, 'station', 'name', type=str))
+    for i, set_field in enumerate(set_fields_l[:10]):
+        set_field.set(i)
+    set_fields_l[10].set('st1')
+    assert set_fields_l[10].sync() and set_fields_l[10].is_sync_evt.wait(timeout=1.0)
+    timeout = time.monotonic() + 2.0
+    while len(cli.hgetall('station')) < 11 and time.monotonic() < timeout:
+        time.sleep(0.05)
+    assert cli.hgetall('station') == {**{f'tag_{i}'.encode(): str(i).encode() for i in range(10)}, b'name': b'st1'}
+    assert not any(f.error() for f in set_fields_l)
+    # read fields (cyclic and on sync)
+    get_fields_l = [RedisHashGetField(dev, 'station', f'tag_{i}', type=int, cyclic=True) for i in range(10)]
+    get_missing = RedisHashGetField(dev, 'station', 'missing', type=int, cyclic=True)
+    get_name = RedisHashGetField(dev, 'station', 'name', type=str)
+    assert get_name.sync() and get_name.is_sync_evt.wait(timeout=1.0)
+    assert get_name.get() == 'st1'
+    timeout = time.monotonic() + 2.0
+    while any(f.get() is None for f in get_fields_l) and time.monotonic() < timeout:
+        time.sleep(0.05)
+    assert [f.get() for f in get_fields_l] == list(range(10))
+    assert not any(f.error() for f in get_fields_l)
+    assert get_missing.error()
+
+
+def test_redis_key_notify(cli, dev):
+    # keyspace notifications must be enabled on server
+    cli.config_set('notify-keyspace-events', 'K$gx')
+
+    def wait_for(cond_func) -> bool:
+        timeout = time.monotonic() + 2.0
+        while not cond_func() and time.monotonic() < timeout:
+            time.sleep(0.05)
+        return cond_func()
+
+    try:
+        cli.set('setpoint', b'1')
+        # not cyclic: value is only updated by notifications
+        redis_key = RedisGetKey(dev, 'setpoint', type=int, notify=True)
+        assert wait_for(lambda: redis_key.get() == 1)
+        cli.set('setpoint', b'2')
+        assert wait_for(lambda: redis_key.get() == 2)
+        assert not redis_key.error()
+        # a change during a loss of the pubsub connection is read on reconnect
+        cli.client_kill_filter(_type='pubsub')
+        cli.set('setpoint', b'3')
+        assert wait_for(lambda: redis_key.error())
+        assert wait_for(lambda: redis_key.get() == 3 and not redis_key.error())
+        cli.delete('setpoint')
+        assert wait_for(lambda: redis_key.error())
+        # cyclic mode: a slow resync period is used
+        assert RedisGetKey(dev, 'setpoint', type=int, cyclic=True, notify=True).period == dev.notify_resync_period
+    finally:
+        cli.config_set('notify-keyspace-events', '')
+
+
+def test_redis_hash_notify(cli, dev):
+    # keyspace notifications must be enabled on server
+    cli.config_set('notify-keyspace-events', 'K$hgx')
+
+    def wait_for(cond_func) -> bool:
+        timeout = time.monotonic() + 2.0
+        while not cond_func() and time.monotonic() < timeout:
+            time.sleep(0.05)
+        return cond_func()
+
+    try:
+        cli.hset('station', mapping={'tag_a': b'1', 'tag_b': b'1'})
+        cli.set('setpoint', b'1')
+        # many notified sources share a channel: every one is updated
+        field_a = RedisHashGetField(dev, 'station', 'tag_a', type=int, notify=True)
+        field_b = RedisHashGetField(dev, 'station', 'tag_b', type=int, notify=True)
+        key_1 = RedisGetKey(dev, 'setpoint', type=int, notify=True)
+        key_2 = RedisGetKey(dev, 'setpoint', type=int, notify=True)
+        assert wait_for(lambda: [field_a.get(), field_b.get(), key_1.get(), key_2.get()] == [1, 1, 1, 1])
+        cli.hset('station', mapping={'tag_a': b'2', 'tag_b': b'3'})
+        assert wait_for(lambda: [field_a.get(), field_b.get()] == [2, 3])
+        cli.set('setpoint', b'5')
+        assert wait_for(lambda: [key_1.get(), key_2.get()] == [5, 5])
+    finally:
+        cli.config_set('notify-keyspace-events', '')
+
+
 def test_pubsub(cli, dev):
     # some class
     class SubTest:
@@ -167,3 +295,213 @@ def test_pubsub(cli, dev):
         # asserts
         assert red_sub.get() == tst.sub_get
         assert red_sub.error() == tst.sub_error
+
+
+def test_publish_coalesce(cli):
+    dev = RedisDevice(host=REDIS_HOST, publish_coalesce=True)
+    pubsub = cli.pubsub()
+    pubsub.subscribe('burst')
+    pubsub.get_message(timeout=1.0)
+    # wait for device connection
+    timeout = time.monotonic() + 2.0
+    while not dev.connected and time.monotonic() < timeout:
+        time.sleep(0.05)
+    # publish a burst of messages
+    red_pub = RedisPublish(dev, 'burst', type=int)
+    msg_l = []
+    for i in range(100):
+        red_pub.set(i)
+        assert red_pub.last_message
+        msg_l.append(red_pub.last_message)
+    for msg in msg_l:
+        assert msg.send_evt.wait(timeout=1.0)
+    # every message is either sent (and received by our subscriber) or replaced by a newer one
+    sent_l = [msg for msg in msg_l if not msg.coalesced]
+    assert sent_l[-1] is msg_l[-1]
+    assert all(msg.delivery_count == 1 for msg in sent_l)
+    assert all(msg.delivery_count == 0 for msg in msg_l if msg.coalesced)
+    rx_l = []
+    while (msg_d := pubsub.get_message(timeout=0.2)) is not None:
+        rx_l.append(msg_d['data'])
+    assert rx_l == [msg.message for msg in sent_l]
+    pubsub.close()
+
+
+def test_pubsub_pattern(cli, dev):
+    # many subscribers: on a channel, on patterns and on a channel covered by a pattern
+    sub_a1 = RedisSubscribe(dev, 'plant:a:1', type=int)
+    sub_a1_bis = RedisSubscribe(dev, 'plant:a:1', type=int)
+    sub_plant = RedisSubscribe(dev, 'plant:*', type=int, pattern=True)
+    sub_alarm = RedisSubscribe(dev, 'plant:?:alarm', type=int, pattern=True)
+    sub_other = RedisSubscribe(dev, 'other', type=int)
+    all_subs_l = [sub_a1, sub_a1_bis, sub_plant, sub_alarm, sub_other]
+    for red_sub in all_subs_l:
+        assert red_sub.subscribe_evt.wait(timeout=1.0)
+    # only patterns and uncovered channels are subscribed on server
+    assert cli.execute_command('PUBSUB', 'NUMPAT') == 2
+    assert cli.pubsub_channels('plant:*') == []
+    assert cli.pubsub_channels('other') == [b'other']
+
+    def publish(channel: str, value: int, subs_l: List[RedisSubscribe]):
+        for red_sub in all_subs_l:
+            red_sub.receive_evt.clear()
+        cli.publish(channel, str(value))
+        for red_sub in subs_l:
+            assert red_sub.receive_evt.wait(timeout=1.0)
+            assert red_sub.get() == value
+            assert red_sub.last_channel == channel.encode()
+        # a message is dispatched once and only to matching subscribers
+        assert not any(s.receive_evt.is_set() for s in all_subs_l if s not in subs_l)
+
+    publish('plant:a:1', 1, [sub_a1, sub_a1_bis, sub_plant])
+    publish('plant:b:alarm', 2, [sub_plant, sub_alarm])
+    publish('other', 3, [sub_other])
+
+
+def test_pubsub_channel_after_pattern(cli, dev):
+    # a channel added after its covering pattern is active is ready without a server subscribe
+    sub_plant = RedisSubscribe(dev, 'plant:*', type=int, pattern=True)
+    assert sub_plant.subscribe_evt.wait(timeout=1.0)
+    sub_a1 = RedisSubscribe(dev, 'plant:a:1', type=int)
+    assert sub_a1.subscribe_evt.wait(timeout=1.0)
+    assert cli.pubsub_channels('plant:*') == []
+    cli.publish('plant:a:1', '42')
+    assert sub_a1.receive_evt.wait(timeout=1.0)
+    assert sub_a1.get() == 42
+
+
+def test_pubsub_reactivity(cli, dev):
+    # subscribe changes apply without waiting for the end of a polling period
+    first_sub = RedisSubscribe(dev, 'first', type=int)
+    assert first_sub.subscribe_evt.wait(timeout=1.0)
+    t_start = time.monotonic()
+    second_sub = RedisSubscribe(dev, 'second', type=int)
+    assert second_sub.subscribe_evt.wait(timeout=1.0)
+    assert time.monotonic() - t_start < 0.1
+    # a burst of messages is fully processed
+    for i in range(100):
+        cli.publish('second', str(i))
+    timeout = time.monotonic() + 1.0
+    while second_sub.get() != 99 and time.monotonic() < timeout:
+        time.sleep(0.01)
+    assert second_sub.get() == 99
+
+
+def test_pubsub_reconnect(cli, dev):
+    # subscriptions are restored after the server closes the pubsub connection
+    red_sub = RedisSubscribe(dev, 'my_channel', type=int)
+    assert red_sub.subscribe_evt.wait(timeout=1.0)
+    cli.client_kill_filter(_type='pubsub')
+    timeout = time.monotonic() + 5.0
+    while red_sub.get() != 42 and time.monotonic() < timeout:
+        cli.publish('my_channel', b'42')
+        time.sleep(0.1)
+    assert red_sub.get() == 42 and not red_sub.error()
+
+
+def test_redis_stream(cli, dev):
+    # append values and read them back with XREAD (in batches)
+    stream_r = RedisStreamRead(dev, 'stream', int, count=10)
+    stream_w = RedisStreamAppend(dev, 'stream', int, maxlen=1000)
+    for i in range(50):
+        assert stream_w.append(i, timeout=1.0)
+    dev.stream_append_thread.entry_q.join()
+    assert not stream_w.error()
+    assert cli.xlen('stream') == 50
+    values_l: List[int] = []
+    t_end = time.monotonic() + 2.0
+    while len(values_l) < 50 and time.monotonic() < t_end:
+        values_l.extend(value for _, value in stream_r.read(timeout=0.5))
+    assert values_l == list(range(50))
+    assert stream_r.get() == 49 and not stream_r.error()
+    # a full reader buffer stops reads: entries stay in redis until there is room
+    small_r = RedisStreamRead(dev, 'stream', int, start_id='0', count=10, buffer_size=5)
+    assert small_r.receive_evt.wait(timeout=2.0)
+    time.sleep(0.2)
+    assert len(small_r.read()) == 5
+    assert [value for _, value in small_r.read(timeout=2.0)] == [5, 6, 7, 8, 9]
+    # consumer groups: entries are shared between consumers and acknowledged
+    group_a = RedisStreamRead(dev, 'stream', int, group='grp', consumer='a', start_id='0')
+    group_b = RedisStreamRead(dev, 'stream', int, group='grp', consumer='b', start_id='0')
+    t_end = time.monotonic() + 2.0
+    ids_s = set()
+    while len(ids_s) < 50 and time.monotonic() < t_end:
+        for group_r in (group_a, group_b):
+            ids_s.update(entry_id for entry_id, _ in group_r.read(timeout=0.1))
+    assert len(ids_s) == 50
+    assert cli.xpending('stream', 'grp')['pending'] == 0
+    # bad arguments and read-only reader
+    with pytest.raises(ValueError):
+        RedisStreamRead(dev, 'stream', int, group='grp')
+    with pytest.raises(ValueError):
+        stream_r.set(0)
+    with pytest.raises(TypeError):
+        stream_w.set('foo')
+
+
+def test_redis_codecs(cli):
+    # struct codec: fixed-width binary values
+    codec = StructCodec()
+    for value, _type, size in [(True, bool, 1), (-42, int, 8), (3.14, float, 8), ('é', str, 2), (b'\x00', bytes, 1)]:
+        raw = codec.encode(value, _type)
+        assert len(raw) == size
+        assert codec.decode(raw, _type) == value
+    assert codec.encode(1, float) == codec.encode(1.0, float)
+    for value, _type in [(2 ** 63, int), ('1', int), (None, float)]:
+        with pytest.raises(TypeError):
+            codec.encode(value, _type)
+    with pytest.raises(TypeError):
+        codec.decode(b'\x00' * 4, float)
+    # a device codec applies to every key, unless a key set its own
+    dev = RedisDevice(host=REDIS_HOST, codec=StructCodec())
+    key_w = RedisSetKey(dev, 'codec', float)
+    key_w_txt = RedisSetKey(dev, 'codec_txt', float, codec=TextCodec())
+    key_r = RedisGetKey(dev, 'codec', float)
+    key_w.set(1.5)
+    key_w_txt.set(1.5)
+    for redis_key in (key_w, key_w_txt, key_r):
+        assert redis_key.sync() and redis_key.is_sync_evt.wait(timeout=1.0)
+    assert cli.get('codec') == struct.pack('>d', 1.5)
+    assert cli.get('codec_txt') == b'1.5'
+    assert key_r.get() == 1.5 and not key_r.error()
+
+
+def test_redis_shared_devices(cli):
+    # shared devices of a target use the client and I/O threads of the first one
+    dev_l = [RedisDevice(host=REDIS_HOST, db=1, refresh=0.1 * (i + 1), shared=True) for i in range(20)]
+    assert len({id(dev.redis_cli) for dev in dev_l}) == 1
+    assert len({id(dev.key_cyclic_thread) for dev in dev_l}) == 1
+    assert dev_l[0].subscribe_thread is dev_l[-1].subscribe_thread
+    assert RedisDevice(host=REDIS_HOST, db=2, shared=True).redis_cli is not dev_l[0].redis_cli
+    assert RedisDevice(host=REDIS_HOST, db=1).redis_cli is not dev_l[0].redis_cli
+    # keys of each device work at its own refresh
+    cli.select(1)
+    cli.set('shared', b'42')
+    key_fast = RedisGetKey(dev_l[0], 'shared', int, cyclic=True)
+    key_slow = RedisGetKey(dev_l[-1], 'shared', int, cyclic=True)
+    time.sleep(0.5)
+    assert key_fast.get() == key_slow.get() == 42
+    assert dev_l[-1].connected
+    cli.set('shared', b'43')
+    time.sleep(0.5)
+    assert key_fast.get() == 43 and key_slow.get() == 42
+
+
+def test_redis_sync_coalesce(cli, dev):
+    # wait device connection (requests of many keys are only accepted on a connected device)
+    t_end = time.monotonic() + 2.0
+    while not dev.connected and time.monotonic() < t_end:
+        time.sleep(0.05)
+    # a burst of set on a key keeps only one pending request (latest value wins)
+    keys_l = [RedisSetKey(dev, f'sync_{i}', int) for i in range(10)]
+    for value in range(50):
+        for redis_key in keys_l:
+            redis_key.set(value)
+            assert redis_key.sync()
+    for redis_key in keys_l:
+        assert redis_key.is_sync_evt.wait(timeout=1.0)
+        assert not redis_key.error()
+    assert cli.mget([f'sync_{i}' for i in range(10)]) == [b'49'] * 10
+    stats = dev.sync_stats
+    assert stats['executed'] + stats['coalesced'] == 500
+    assert stats['coalesced'] > 0 and stats['expired'] == 0
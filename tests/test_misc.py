@@ -1,8 +1,45 @@
 """ Test of Misc """
 
-from pyHMI.Misc import swap_bytes, swap_words
+import math
+import time
+
+from pyHMI.Misc import CyclicScheduler, LatencyHistogram, swap_bytes, swap_words
 
 
 def test_swap():
     assert swap_bytes(b'1234') == b'2143'
     assert swap_words(b'1234') == b'3412'
+
+
+def test_latency_histogram():
+    hist = LatencyHistogram()
+    assert hist.percentile(99) == 0.0
+    for duration in (0.0003,) * 90 + (0.004,) * 9 + (30.0,):
+        hist.add(duration)
+    assert hist.count == 100 and hist.max == 30.0
+    # percentiles are bucket upper bounds
+    assert hist.percentile(50) == 0.0005 and hist.percentile(99) == 0.005 and hist.percentile(100) == 30.0
+    buckets_l = hist.buckets()
+    assert buckets_l[2] == (0.0005, 90) and buckets_l[-1] == (math.inf, 100)
+    assert hist.as_dict()['p90'] == 0.0005
+
+
+def test_scheduler_stats():
+    class Item:
+        def __init__(self, cyclic: bool) -> None:
+            self.cyclic = cyclic
+            self.period = 0.01
+
+    scheduler = CyclicScheduler(device=None)
+    cyclic_item = Item(cyclic=True)
+    single_run_item = Item(cyclic=False)
+    scheduler.add(cyclic_item)
+    scheduler.add(single_run_item)
+    # both items are late: only the cyclic one counts for stats
+    time.sleep(0.05)
+    assert scheduler.pop_due() == [cyclic_item, single_run_item]
+    assert scheduler.missed_count == 1 and scheduler.last_lag >= 0.05
+    other_item = Item(cyclic=False)
+    scheduler.add(other_item)
+    time.sleep(0.05)
+    assert len(scheduler.pop_due()) == 3 and scheduler.missed_count == 2
@@ -119,3 +119,29 @@ def test_chg_cmd():
     tag_expect(my_tag, value=1, error=False)
     # chg_cmd don't apply if no external src
     tag_expect(Tag(42, chg_cmd=lambda _x: 100), value=42, error=False)
+
+
+def test_subscribe():
+    changes_l = []
+    # internal tag notify on value or error changes only
+    my_tag = Tag(0)
+    assert my_tag.subscribe(changes_l.append)
+    my_tag.value = 0
+    assert changes_l == []
+    my_tag.value = 42
+    my_tag.error = True
+    assert changes_l == [my_tag, my_tag]
+    # changes are forwarded through TagOp
+    op_tag = Tag(False, src=TagOp(my_tag, op.gt, 50))
+    assert op_tag.subscribe(changes_l.append)
+    changes_l.clear()
+    my_tag.value = 60
+    assert changes_l == [my_tag, op_tag]
+    # unsubscribe
+    my_tag.unsubscribe(changes_l.append)
+    op_tag.unsubscribe(changes_l.append)
+    changes_l.clear()
+    my_tag.value = 0
+    assert changes_l == []
+    # GetCmd cannot report changes
+    assert not Tag(0, src=GetCmd(lambda: 1)).subscribe(changes_l.append)